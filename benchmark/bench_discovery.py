@@ -0,0 +1,270 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+文件遍历、过滤及input file生成的性能基准
+在合成的代码目录(可配置文件数、目录深度、分支数及忽略规则)上分别统计各环节的耗时和内存峰值,并与基准数据对比
+
+用法:
+    python3 benchmark/bench_discovery.py --files 10000,100000
+    python3 benchmark/bench_discovery.py --files 10000 --save-baseline     # 保存为基准数据
+    python3 benchmark/bench_discovery.py --files 10000 --threshold 0.2     # 耗时超过基准20%时返回1
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+
+from codedog_scan import TCAPlugin
+from ignorefile import IgnoreFileMatcher
+from pathfilter import PathUtil, FilterPathUtil
+
+logger = logging.getLogger("benchmark")
+
+# 源码文件扩展名及权重
+EXTENSIONS = [(".py", 20), (".js", 20), (".ts", 10), (".go", 10), (".java", 10), (".cpp", 8), (".h", 8),
+              (".md", 4), (".json", 4), (".min.js", 3), (".png", 3)]
+# 常见的需要过滤的目录(生成时占一定比例的文件)
+NOISE_DIRS = ["node_modules", "build", "vendor", "third_party", "dist"]
+# 过滤路径(与INPUT_WHITE_PATHS/INPUT_IGNORE_PATHS格式一致)
+PATH_INCLUDE = ["src/.*", "lib/.*", "services/.*"]
+PATH_EXCLUDE = [".git/.*", "node_modules/.*", ".*/node_modules/.*", ".*/build/.*", "third_party/.*",
+                ".*/vendor/.*", ".*\\.min\\.js", ".*\\.png", "src/mod_1/.*", ".*/test_data/.*"]
+# .gitignore内容
+GITIGNORE_LINES = ["*.min.js", "*.png", "build/", "dist/", "node_modules/", "!keep.min.js"]
+TREE_MARKER = ".bench_tree.json"
+
+
+class TreeGenerator(object):
+    """
+    生成合成代码目录: 顶层目录下按深度和分支数生成子目录,文件按权重随机分配扩展名;
+    部分目录下生成噪声目录(node_modules、build等)及.gitignore
+    """
+    def __init__(self, file_count, depth, fanout, seed=0):
+        self._file_count = file_count
+        self._depth = depth
+        self._fanout = fanout
+        self._random = random.Random(seed)
+
+    def generate(self, root_dir):
+        """
+        生成目录,参数相同的目录已存在时直接复用
+        :return: 目录路径
+        """
+        params = {"files": self._file_count, "depth": self._depth, "fanout": self._fanout}
+        marker_path = os.path.join(root_dir, TREE_MARKER)
+        if os.path.isfile(marker_path):
+            with open(marker_path, "r") as rf:
+                if json.load(rf) == params:
+                    logger.info(f"复用已生成的目录: {root_dir}")
+                    return root_dir
+            raise Exception(f"目录已存在且参数不一致,请先删除: {root_dir}")
+
+        start_time = time.time()
+        leaf_dirs = []
+        for top in ["src", "lib", "services", "docs", "third_party"]:
+            self.__gen_dirs(os.path.join(root_dir, top), 1, leaf_dirs)
+        os.makedirs(os.path.join(root_dir, ".git", "objects"), exist_ok=True)
+        with open(os.path.join(root_dir, ".gitignore"), "w") as wf:
+            wf.write("\n".join(GITIGNORE_LINES) + "\n")
+
+        extensions = [ext for ext, _ in EXTENSIONS]
+        weights = [weight for _, weight in EXTENSIONS]
+        for index in range(self._file_count):
+            dir_path = self._random.choice(leaf_dirs)
+            ext = self._random.choices(extensions, weights)[0]
+            with open(os.path.join(dir_path, f"file_{index}{ext}"), "w") as wf:
+                wf.write(f"# {index}\n")
+        with open(marker_path, "w") as wf:
+            json.dump(params, wf)
+        logger.info("生成目录: %s, 文件数: %d, 耗时: %.2fs" % (root_dir, self._file_count, time.time() - start_time))
+        return root_dir
+
+    def __gen_dirs(self, dir_path, level, leaf_dirs):
+        os.makedirs(dir_path, exist_ok=True)
+        leaf_dirs.append(dir_path)
+        if level >= self._depth:
+            return
+        for index in range(self._fanout):
+            self.__gen_dirs(os.path.join(dir_path, f"mod_{index}"), level + 1, leaf_dirs)
+        # 约1/5的目录下生成噪声目录
+        if self._random.random() < 0.2:
+            noise_dir = os.path.join(dir_path, self._random.choice(NOISE_DIRS))
+            os.makedirs(noise_dir, exist_ok=True)
+            leaf_dirs.append(noise_dir)
+        if self._random.random() < 0.1:
+            with open(os.path.join(dir_path, ".gitignore"), "w") as wf:
+                wf.write("test_data/\n*.tmp\n")
+            leaf_dirs.append(os.path.join(dir_path, "test_data"))
+            os.makedirs(leaf_dirs[-1], exist_ok=True)
+
+
+class DiscoveryBenchmark(object):
+    """
+    分别统计各环节:
+    walk            - 遍历目录下所有文件
+    filter          - 对已遍历的文件列表按过滤路径过滤
+    walk_filter     - 边遍历边过滤(跳过整个被过滤的目录),与TCAPlugin.filter_paths一致
+    walk_gitignore  - 边遍历边按.gitignore过滤
+    serialize       - 生成quickscan的input file
+    """
+    def __init__(self, root_dir, work_dir, repeat, measure_memory):
+        self._root_dir = root_dir
+        self._work_dir = work_dir
+        self._repeat = repeat
+        self._measure_memory = measure_memory
+
+    def run(self):
+        results = {}
+        all_paths = self.__measure(results, "walk", self.__walk)
+        self.__measure(results, "filter", lambda: self.__filter(all_paths))
+        scan_paths = self.__measure(results, "walk_filter", self.__walk_filter)
+        self.__measure(results, "walk_gitignore", self.__walk_gitignore)
+        self.__measure(results, "serialize", lambda: self.__serialize(scan_paths))
+        results["walk"]["count"] = len(all_paths)
+        results["walk_filter"]["count"] = len(scan_paths)
+        return results
+
+    def __measure(self, results, name, func):
+        """
+        多次执行取最小耗时;另外单独执行一次统计内存峰值(tracemalloc会拖慢执行,不计入耗时)
+        """
+        times = []
+        result = None
+        for _ in range(self._repeat):
+            result = None
+            gc.collect()
+            start_time = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start_time)
+        record = {"time": round(min(times), 6), "times": [round(item, 6) for item in times]}
+        if self._measure_memory:
+            result = None
+            gc.collect()
+            tracemalloc.start()
+            result = func()
+            record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1048576, 3)
+            tracemalloc.stop()
+        results[name] = record
+        logger.info("%-16s %.4fs %s" % (name, record["time"],
+                                        f"{record['peak_mb']}MB" if "peak_mb" in record else ""))
+        return result
+
+    def __walk(self):
+        return list(PathUtil.get_dir_files(self._root_dir))
+
+    @staticmethod
+    def __filter_util():
+        return FilterPathUtil(list(PATH_INCLUDE), list(PATH_EXCLUDE))
+
+    def __filter(self, all_paths):
+        return self.__filter_util().get_include_files(all_paths, self._root_dir)
+
+    def __walk_filter(self):
+        filter_util = self.__filter_util()
+        paths = PathUtil.get_dir_files(self._root_dir, skip_dir=filter_util.should_skip_dir)
+        return filter_util.get_include_files(paths, self._root_dir)
+
+    def __walk_gitignore(self):
+        matcher = IgnoreFileMatcher(self._root_dir)
+        skip_dir = lambda rel_dir: matcher.match(rel_dir, is_dir=True)
+        return list(PathUtil.get_dir_files(self._root_dir, skip_dir=skip_dir, skip_file=matcher.match))
+
+    def __serialize(self, scan_paths):
+        input_file = os.path.join(self._work_dir, "quickscan_input_file.json")
+        TCAPlugin.write_quick_scan_input_file(input_file, scan_paths, ["open_source_check"])
+        return input_file
+
+
+def compare_baseline(results, baseline, threshold):
+    """
+    与基准数据对比耗时
+    :return: 超出阈值的项列表
+    """
+    regressions = []
+    for case, case_results in results.items():
+        if not isinstance(case_results, dict):
+            continue
+        for name, record in case_results.items():
+            base_time = baseline.get(case, {}).get(name, {}).get("time")
+            if not base_time:
+                continue
+            ratio = record["time"] / base_time
+            flag = "REGRESSION" if ratio > 1 + threshold else "ok"
+            logger.info("[%s] %-16s %.4fs / 基准 %.4fs = %.2f %s" % (case, name, record["time"], base_time, ratio, flag))
+            if ratio > 1 + threshold:
+                regressions.append(f"{case}/{name}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="文件遍历、过滤及input file生成的性能基准")
+    parser.add_argument("--files", default="10000", help="文件数,多个用英文逗号分割,如: 10000,100000,1000000")
+    parser.add_argument("--depth", type=int, default=5, help="目录深度")
+    parser.add_argument("--fanout", type=int, default=4, help="每级目录的子目录数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项执行次数,取最小耗时")
+    parser.add_argument("--no-memory", action="store_true", help="不统计内存峰值")
+    parser.add_argument("--tree-dir", help="合成目录的存放目录,默认为系统临时目录,已存在时复用")
+    parser.add_argument("--output", help="结果输出文件")
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"), help="基准数据文件")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基准数据")
+    parser.add_argument("--threshold", type=float, default=0.2, help="耗时超过基准的比例阈值")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="-%(asctime)s-%(levelname)s: %(message)s")
+    # 屏蔽被测模块的日志
+    for name in ["pathfilter", "ignorefile", "telemetry"]:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    args = parse_args()
+    tree_dir = args.tree_dir or os.path.join(tempfile.gettempdir(), "tca_bench_trees")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="tca_bench_") as work_dir:
+        for file_count in [int(item) for item in args.files.split(",")]:
+            case = f"files_{file_count}"
+            root_dir = os.path.join(tree_dir, f"{case}_d{args.depth}_f{args.fanout}")
+            TreeGenerator(file_count, args.depth, args.fanout).generate(root_dir)
+            logger.info(f"===== {case} =====")
+            results[case] = DiscoveryBenchmark(root_dir, work_dir, args.repeat, not args.no_memory).run()
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+    logger.info(f"max rss: {results['max_rss_mb']}MB")
+
+    if args.output:
+        with open(args.output, "w") as wf:
+            json.dump(results, wf, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as wf:
+            json.dump(results, wf, indent=2)
+        logger.info(f"已保存基准数据: {args.baseline}")
+        return 0
+    if not os.path.isfile(args.baseline):
+        logger.info(f"基准数据文件不存在,跳过对比: {args.baseline}")
+        return 0
+    with open(args.baseline, "r") as rf:
+        baseline = json.load(rf)
+    regressions = compare_baseline(results, baseline, args.threshold)
+    if regressions:
+        logger.error(f"性能退化(超过基准{int(args.threshold * 100)}%): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
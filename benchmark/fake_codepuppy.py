@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+模拟TCA客户端(codepuppy/scantask),用于离线压测TCA-action自身的开销
+支持quickinit、quickscan、localscan命令,通过环境变量配置模拟的耗时、cpu负载、问题量及结果文件大小:
+    FAKE_PUPPY_LATENCY          每个命令的固定耗时(秒),默认0
+    FAKE_PUPPY_CPU_PER_FILE     扫描每个文件占用的cpu时间(秒),默认0
+    FAKE_PUPPY_ISSUE_RATE       每个文件的问题数,默认0.1(按文件序号均匀分布)
+    FAKE_PUPPY_MSG_SIZE         每个问题描述的长度(字节),用于控制结果文件大小,默认64
+    FAKE_PUPPY_ERROR_CODE       quickscan结果的错误码,默认0
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+
+def get_env(name, default):
+    value = os.getenv(name)
+    return type(default)(value) if value else default
+
+
+def burn_cpu(seconds):
+    """
+    占用cpu指定时间
+    """
+    deadline = time.process_time() + seconds
+    while time.process_time() < deadline:
+        sum(range(1000))
+
+
+def list_scan_paths(source_dir):
+    """
+    获取待扫描文件: 优先使用TCA_QUICK_SCAN_INPUT指定的input file,否则遍历代码目录
+    """
+    input_file = os.getenv("TCA_QUICK_SCAN_INPUT")
+    if input_file and os.path.isfile(input_file):
+        with open(input_file, "r") as rf:
+            return [item["path"] for item in json.load(rf)["scan_path"]]
+    scan_paths = []
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames[:] = [name for name in dirnames if name != ".git"]
+        for name in filenames:
+            scan_paths.append(os.path.relpath(os.path.join(dirpath, name), source_dir))
+    return scan_paths
+
+
+def gen_issues(scan_paths, count):
+    msg = "x" * get_env("FAKE_PUPPY_MSG_SIZE", 64)
+    for index in range(count):
+        yield {
+            "path": scan_paths[index % len(scan_paths)],
+            "line": index // len(scan_paths) + 1,
+            "column": 1,
+            "rule": f"FakeRule{index % 7}",
+            "severity": ["fatal", "error", "warning", "info"][index % 4],
+            "msg": msg,
+        }
+
+
+def quickscan(args):
+    scan_paths = list_scan_paths(args.source_dir)
+    burn_cpu(get_env("FAKE_PUPPY_CPU_PER_FILE", 0.0) * len(scan_paths))
+    issue_count = int(len(scan_paths) * get_env("FAKE_PUPPY_ISSUE_RATE", 0.1)) if scan_paths else 0
+    report_path = os.getenv("TCA_QUICK_SCAN_OUTPUT") or os.path.join(os.getcwd(), "tca_quick_scan_report.json")
+    # 逐个问题写入,避免大结果文件占用内存
+    with open(report_path, "w") as wf:
+        wf.write('{"error_code": %d, "issue_count": %d, "issues": [' % (
+            get_env("FAKE_PUPPY_ERROR_CODE", 0), issue_count))
+        for index, issue in enumerate(gen_issues(scan_paths, issue_count)):
+            wf.write((", " if index else "") + json.dumps(issue))
+        wf.write("]}")
+    print(f"fake quickscan: {len(scan_paths)} files, {issue_count} issues")
+
+
+def localscan(args):
+    scan_paths = list_scan_paths(args.source_dir)
+    burn_cpu(get_env("FAKE_PUPPY_CPU_PER_FILE", 0.0) * len(scan_paths))
+    issue_count = int(len(scan_paths) * get_env("FAKE_PUPPY_ISSUE_RATE", 0.1))
+    severity_detail = {"fatal": 0, "error": 0, "warning": issue_count, "info": 0}
+    result = {
+        "status": "success",
+        "text": "扫描完成",
+        "url": "http://127.0.0.1/fake",
+        "description": f"fake localscan: {len(scan_paths)} files",
+        "scan_report": {
+            "lintscan": {
+                "current_scan": {"active_severity_detail": severity_detail},
+                "total": {"severity_detail": {key: {"active": value} for key, value in severity_detail.items()}},
+            },
+            "cyclomaticcomplexityscan": {
+                "custom_summary": None,
+                "default_summary": {"over_cc_sum": 0, "cc_func_average": 1.0, "over_cc_func_count": 0,
+                                    "diff_over_cc_func_count": 0, "over_cc_func_average": 0.0},
+            },
+            "duplicatescan": {"duplicate_rate": 0.0},
+        },
+    }
+    with open(os.path.join(os.getcwd(), "scan_status.json"), "w") as wf:
+        json.dump(result, wf, indent=2, ensure_ascii=False)
+    print(f"fake localscan: {len(scan_paths)} files, {issue_count} issues")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("quickinit").add_argument("-l", dest="label")
+    for name in ["quickscan", "localscan"]:
+        sub_parser = subparsers.add_parser(name)
+        sub_parser.add_argument("-s", dest="source_dir", default=os.getcwd())
+        sub_parser.add_argument("-l", dest="label")
+    args, _ = parser.parse_known_args()
+
+    time.sleep(get_env("FAKE_PUPPY_LATENCY", 0.0))
+    if args.command == "quickscan":
+        quickscan(args)
+    elif args.command == "localscan":
+        localscan(args)
+    elif args.command == "quickinit":
+        print("fake quickinit done")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+TCA-action端到端压测: 使用模拟客户端(fake_codepuppy.py)在合成代码目录上重复执行scan命令,
+统计耗时分位数、吞吐量及各阶段耗时,用于离线评估分片、结果缓存、结果处理等优化
+
+用法:
+    python3 benchmark/load_test.py --runs 20 --files 20000
+    python3 benchmark/load_test.py --runs 20 --concurrency 4 --param QUICK_SCAN_SHARDS=auto --cpu-per-file 0.0005
+    python3 benchmark/load_test.py --runs 10 --param RESULT_CACHE_DIR=/tmp/tca_result_cache --issue-rate 2
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_discovery import TreeGenerator
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCAN_SCRIPT = os.path.join(os.path.dirname(BENCH_DIR), "src", "codedog_scan.py")
+
+logger = logging.getLogger("benchmark")
+
+
+class LoadTest(object):
+    """
+    目录结构(插件目录为工作空间的上级目录,与codedog_scan.py的查找规则一致):
+    <root_dir>/lib/tca-client/codepuppy    # 模拟客户端
+    <root_dir>/workspace/                  # 合成代码目录
+    <root_dir>/logs/run_<n>.log            # 每次执行的日志
+    <root_dir>/traces/run_<n>.jsonl        # 每次执行的阶段统计
+    """
+    def __init__(self, root_dir, params, fake_env):
+        """
+        :param root_dir: 压测目录
+        :param params: TCA-action参数(不含INPUT_前缀)
+        :param fake_env: 模拟客户端的配置环境变量
+        """
+        self._root_dir = root_dir
+        self._workspace = os.path.join(root_dir, "workspace")
+        self._params = params
+        self._fake_env = fake_env
+        client_dir = os.path.join(root_dir, "lib", "tca-client")
+        os.makedirs(client_dir, exist_ok=True)
+        for name in ["codepuppy", "scantask"]:
+            shutil.copy(os.path.join(BENCH_DIR, "fake_codepuppy.py"), os.path.join(client_dir, name))
+            os.chmod(os.path.join(client_dir, name), 0o755)
+        for name in ["logs", "traces"]:
+            os.makedirs(os.path.join(root_dir, name), exist_ok=True)
+
+    def prepare(self, file_count, depth, fanout):
+        TreeGenerator(file_count, depth, fanout).generate(self._workspace)
+
+    def run_once(self, index):
+        """
+        执行一次scan命令
+        :return: (耗时, 返回码, 阶段统计列表)
+        """
+        trace_file = os.path.join(self._root_dir, "traces", f"run_{index}.jsonl")
+        env = dict(os.environ, **self._fake_env)
+        env["INPUT_TRACE_FILE"] = trace_file
+        env.setdefault("INPUT_BLOCK", "false")
+        for key, value in self._params.items():
+            env[f"INPUT_{key.upper()}"] = value
+        log_path = os.path.join(self._root_dir, "logs", f"run_{index}.log")
+        start_time = time.perf_counter()
+        with open(log_path, "wb") as wf:
+            returncode = subprocess.call([sys.executable, SCAN_SCRIPT, "scan"], cwd=self._workspace,
+                                         env=env, stdout=wf, stderr=subprocess.STDOUT)
+        use_time = time.perf_counter() - start_time
+        phases = []
+        if os.path.isfile(trace_file):
+            with open(trace_file, "r") as rf:
+                phases = [json.loads(line) for line in rf if line.strip()]
+        if returncode != 0:
+            logger.warning(f"[run {index}]返回码: {returncode}, 日志: {log_path}")
+        return use_time, returncode, phases
+
+    def run(self, runs, concurrency, warmup):
+        for index in range(warmup):
+            self.run_once(f"warmup_{index}")
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(self.run_once, range(runs)))
+        total_time = time.perf_counter() - start_time
+        return self.summarize(results, total_time)
+
+    @staticmethod
+    def summarize(results, total_time):
+        latencies = sorted(item[0] for item in results)
+        phase_times = {}
+        for _, _, phases in results:
+            for phase in phases:
+                if "wall_time" in phase:
+                    phase_times.setdefault(phase["name"], []).append(phase["wall_time"])
+        return {
+            "runs": len(results),
+            "failures": sum(1 for item in results if item[1] != 0),
+            "total_time": round(total_time, 3),
+            "throughput_per_min": round(len(results) * 60 / total_time, 3),
+            "latency": {
+                "min": round(latencies[0], 3),
+                "mean": round(sum(latencies) / len(latencies), 3),
+                "p50": round(percentile(latencies, 50), 3),
+                "p90": round(percentile(latencies, 90), 3),
+                "p99": round(percentile(latencies, 99), 3),
+                "max": round(latencies[-1], 3),
+            },
+            "phases_p50": {name: round(percentile(sorted(times), 50), 4) for name, times in phase_times.items()},
+        }
+
+
+def percentile(sorted_values, percent):
+    """
+    最近秩法计算分位数
+    """
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TCA-action端到端压测")
+    parser.add_argument("--runs", type=int, default=10, help="执行次数")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时执行的任务数")
+    parser.add_argument("--warmup", type=int, default=1, help="预热执行次数(不计入统计)")
+    parser.add_argument("--files", type=int, default=10000, help="合成代码目录的文件数")
+    parser.add_argument("--depth", type=int, default=5, help="合成代码目录的深度")
+    parser.add_argument("--fanout", type=int, default=4, help="合成代码目录每级的子目录数")
+    parser.add_argument("--param", action="append", default=[],
+                        help="TCA-action参数,格式: KEY=VALUE(不含INPUT_前缀),可多次指定")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟客户端每个命令的固定耗时(秒)")
+    parser.add_argument("--cpu-per-file", type=float, default=0.0, help="模拟客户端扫描每个文件的cpu时间(秒)")
+    parser.add_argument("--issue-rate", type=float, default=0.1, help="模拟客户端每个文件的问题数")
+    parser.add_argument("--msg-size", type=int, default=64, help="模拟客户端每个问题描述的长度(字节)")
+    parser.add_argument("--root-dir", help="压测目录,默认为临时目录(结束后删除)")
+    parser.add_argument("--output", help="结果输出文件")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="-%(asctime)s-%(levelname)s: %(message)s")
+    args = parse_args()
+    params = dict(item.split("=", 1) for item in args.param)
+    fake_env = {
+        "FAKE_PUPPY_LATENCY": str(args.latency),
+        "FAKE_PUPPY_CPU_PER_FILE": str(args.cpu_per_file),
+        "FAKE_PUPPY_ISSUE_RATE": str(args.issue_rate),
+        "FAKE_PUPPY_MSG_SIZE": str(args.msg_size),
+    }
+    root_dir = args.root_dir or tempfile.mkdtemp(prefix="tca_load_")
+    try:
+        load_test = LoadTest(root_dir, params, fake_env)
+        load_test.prepare(args.files, args.depth, args.fanout)
+        summary = load_test.run(args.runs, args.concurrency, args.warmup)
+    finally:
+        if not args.root_dir:
+            shutil.rmtree(root_dir, ignore_errors=True)
+    summary["params"] = params
+    summary["fake_client"] = fake_env
+    logger.info("压测结果:\n%s" % json.dumps(summary, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w") as wf:
+            json.dump(summary, wf, indent=2, ensure_ascii=False)
+    return 1 if summary["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
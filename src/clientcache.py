@@ -0,0 +1,241 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+TCA客户端缓存,按安装包摘要存放多个版本的客户端
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+
+from filelock import FileLock
+from ziplib import ZipMgr
+
+logger = logging.getLogger(__name__)
+
+
+class ClientCache(object):
+    """
+    客户端缓存目录结构:
+    <cache_dir>/
+        index.json                       # 安装包名称 -> 安装包sha256
+        <sha256>/<client_dirname>/       # 解压后的客户端目录
+        <sha256>/.complete               # 安装完成标记,记录安装信息;mtime作为最近使用时间
+        .download/                       # 安装包下载目录(保留未完成的下载,支持断点续传)
+        .locks/                          # 安装锁及各版本的使用锁
+        .staging-xxx/                    # 解压中的临时目录,解压完成后原子重命名为<sha256>
+    """
+    MARKER_NAME = ".complete"
+    INDEX_NAME = "index.json"
+
+    def __init__(self, cache_dir, max_size=None, max_age_days=None):
+        """
+        :param cache_dir: 缓存目录
+        :param max_size: 缓存总大小上限(字节),超出时按最近使用时间淘汰
+        :param max_age_days: 缓存最长保留天数(按最近使用时间)
+        """
+        self.cache_dir = cache_dir
+        self.download_dir = os.path.join(cache_dir, ".download")
+        self.lock_dir = os.path.join(cache_dir, ".locks")
+        self._max_size = max_size
+        self._max_age_days = max_age_days
+        os.makedirs(self.download_dir, exist_ok=True)
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+    def get_digest(self, archive_name):
+        """
+        根据安装包名称查找已安装过的安装包摘要
+        :param archive_name: 安装包文件名
+        :return: 安装包sha256;未安装过返回None
+        """
+        return self.__load_index().get(archive_name)
+
+    def install_lock(self):
+        """
+        安装锁(排它锁),下载、安装、淘汰缓存时持有
+        """
+        return FileLock(os.path.join(self.lock_dir, "install.lock"))
+
+    def lock_entry(self, digest):
+        """
+        获取缓存版本的共享锁,使用客户端期间持有,避免被其他任务淘汰
+        :param digest: 安装包sha256
+        :return: 已获取的共享锁
+        """
+        entry_lock = FileLock(os.path.join(self.lock_dir, f"{digest}.lock"), shared=True)
+        entry_lock.acquire()
+        return entry_lock
+
+    def get(self, digest):
+        """
+        根据安装包摘要获取已完成安装的客户端,并更新最近使用时间
+        :param digest: 安装包sha256
+        :return: 客户端目录;未命中或缓存不完整时返回None
+        """
+        marker = self.__load_marker(digest)
+        if not marker:
+            return None
+        work_dir = os.path.join(self.cache_dir, digest, marker["client_dirname"])
+        if not os.path.isdir(work_dir):
+            logger.warning(f"客户端缓存不完整,忽略: {work_dir}")
+            return None
+        os.utime(os.path.join(self.cache_dir, digest, self.MARKER_NAME))
+        return work_dir
+
+    def install(self, archive_name, archive_path, digest):
+        """
+        将安装包解压到临时目录,写入完成标记后原子重命名到缓存目录
+        :param archive_name: 安装包文件名
+        :param archive_path: 安装包路径
+        :param digest: 安装包sha256
+        :return: 客户端目录
+        """
+        work_dir = self.get(digest)
+        if work_dir:
+            logger.info(f"相同摘要的客户端已安装,复用: {work_dir}")
+        else:
+            work_dir = self.__install(archive_name, archive_path, digest)
+        self.__save_index(archive_name, digest)
+        return work_dir
+
+    def evict(self, keep_digests=()):
+        """
+        淘汰缓存:先删除超过保留天数的版本,再按最近使用时间从旧到新删除,直到总大小不超过上限
+        正在被其他任务使用(持有共享锁)的版本不会被淘汰
+        :param keep_digests: 不淘汰的安装包摘要(比如当前正在使用的版本)
+        :return:
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(".staging-"):
+                self.__remove_stale_staging(name)
+                continue
+            marker_path = os.path.join(self.cache_dir, name, self.MARKER_NAME)
+            if name in keep_digests or not os.path.isfile(marker_path):
+                continue
+            marker = self.__load_marker(name) or {}
+            entries.append((os.path.getmtime(marker_path), name, marker.get("size", 0)))
+        entries.sort()
+
+        total_size = sum(entry[2] for entry in entries)
+        now = time.time()
+        for last_used, digest, size in entries:
+            expired = self._max_age_days and now - last_used > self._max_age_days * 86400
+            oversize = self._max_size and total_size > self._max_size
+            if not expired and not oversize:
+                continue
+            entry_lock = FileLock(os.path.join(self.lock_dir, f"{digest}.lock"))
+            if not entry_lock.try_acquire():
+                logger.info(f"客户端缓存正在使用中,跳过淘汰: {digest}")
+                continue
+            try:
+                logger.info(f"淘汰客户端缓存: {digest}, 最近使用时间: {time.ctime(last_used)}")
+                self.__remove_entry(digest)
+            finally:
+                entry_lock.release()
+            total_size -= size
+
+    def __install(self, archive_name, archive_path, digest):
+        """
+        解压安装包到临时目录,完成后原子重命名
+        """
+        staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=self.cache_dir)
+        try:
+            ZipMgr().unzip_file(archive_path, staging_dir)
+            client_dirname = os.path.splitext(archive_name)[0]
+            if not os.path.isdir(os.path.join(staging_dir, client_dirname)):
+                # 安装包顶层目录名与安装包名称不一致时,使用唯一的顶层目录
+                sub_dirs = [name for name in os.listdir(staging_dir)
+                            if os.path.isdir(os.path.join(staging_dir, name))]
+                if len(sub_dirs) != 1:
+                    raise Exception(f"安装包目录结构不符合预期: {archive_name}")
+                client_dirname = sub_dirs[0]
+
+            marker = {
+                "archive": archive_name,
+                "digest": digest,
+                "client_dirname": client_dirname,
+                "size": self.__get_dir_size(staging_dir),
+                "install_time": time.time(),
+            }
+            with open(os.path.join(staging_dir, self.MARKER_NAME), "w") as wf:
+                json.dump(marker, wf, indent=2)
+            os.chmod(staging_dir, 0o755)
+            entry_dir = os.path.join(self.cache_dir, digest)
+            if os.path.exists(entry_dir):  # 遗留的不完整目录(无完成标记),先删除
+                shutil.rmtree(entry_dir)
+            os.rename(staging_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        work_dir = os.path.join(self.cache_dir, digest, client_dirname)
+        logger.info(f"客户端安装完成: {work_dir}")
+        return work_dir
+
+    def __load_marker(self, digest):
+        marker_path = os.path.join(self.cache_dir, digest, self.MARKER_NAME)
+        if not os.path.isfile(marker_path):
+            return None
+        try:
+            with open(marker_path, "r") as rf:
+                marker = json.load(rf)
+        except ValueError:
+            logger.warning(f"客户端缓存标记文件格式有误,忽略: {marker_path}")
+            return None
+        if marker.get("digest") != digest or not marker.get("client_dirname"):
+            return None
+        return marker
+
+    def __load_index(self):
+        index_path = os.path.join(self.cache_dir, self.INDEX_NAME)
+        if not os.path.isfile(index_path):
+            return {}
+        try:
+            with open(index_path, "r") as rf:
+                return json.load(rf)
+        except ValueError:
+            return {}
+
+    def __save_index(self, archive_name, digest):
+        index = self.__load_index()
+        index[archive_name] = digest
+        index_path = os.path.join(self.cache_dir, self.INDEX_NAME)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump(index, wf, indent=2)
+        os.replace(tmp_path, index_path)
+
+    def __remove_entry(self, digest):
+        """
+        先删除完成标记,再删除目录,避免删除中途被当作有效缓存
+        """
+        entry_dir = os.path.join(self.cache_dir, digest)
+        os.remove(os.path.join(entry_dir, self.MARKER_NAME))
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def __remove_stale_staging(self, name):
+        """
+        删除被中断的任务遗留的解压临时目录(超过1天未修改)
+        """
+        staging_dir = os.path.join(self.cache_dir, name)
+        if time.time() - os.path.getmtime(staging_dir) > 86400:
+            logger.info(f"删除遗留的临时目录: {staging_dir}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    @staticmethod
+    def __get_dir_size(dir_path):
+        total_size = 0
+        for dirpath, _, filenames in os.walk(dir_path):
+            for name in filenames:
+                file_path = os.path.join(dirpath, name)
+                if not os.path.islink(file_path):
+                    total_size += os.path.getsize(file_path)
+        return total_size
@@ -30,4 +30,18 @@ class CmdArgParser(object):
         # scan命令
         subparsers.add_parser('scan', help="执行分析")
 
+        # warmup命令
+        warmup_parser = subparsers.add_parser('warmup', help="安装客户端并预先初始化工具")
+        warmup_parser.add_argument('--labels', dest='labels', default=None,
+                                   help="需要初始化工具的规则标签,用英文逗号分割,默认使用INPUT_LABEL")
+
+        # daemon命令
+        daemon_parser = subparsers.add_parser('daemon', help="启动常驻扫描服务")
+        daemon_parser.add_argument('--socket', dest='socket', default=None,
+                                   help="unix socket路径,默认使用INPUT_DAEMON_SOCKET")
+        daemon_parser.add_argument('--workers', dest='workers', type=int, default=None,
+                                   help="同时运行的最大扫描数")
+        daemon_parser.add_argument('--labels', dest='labels', default=None,
+                                   help="启动时初始化工具的规则标签,用英文逗号分割,默认使用INPUT_LABEL")
+
         return argparser.parse_args()
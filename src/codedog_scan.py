@@ -10,17 +10,31 @@ TCA Action
 """
 
 import json
+import heapq
 import logging
 import os
 import stat
 import sys
-import subprocess
+import shutil
+import signal
+import time
+import tempfile
 import setting
 
+from concurrent.futures import ThreadPoolExecutor
 from downloadpuppy import PuppyDownloader
+from filelock import FileLock
+from gitutil import GitUtil
+from ignorefile import IgnoreFileMatcher
 from pathfilter import StringMgr, PathUtil, FilterPathUtil
+from procsupervisor import ProcessCommand, ProcessSupervisor
+from monorepo import MonorepoRunner
+from scandaemon import ScanDaemon, ScanDaemonClient
+from quickreport import QuickReportUtil, QuickReportReader, QuickReportWriter, QuickReportSummary, \
+    NdjsonWriter, SarifWriter, IssueWriterGroup
+from resultcache import ResultCache
+from telemetry import tracer
 from cmdarg import CmdArgParser
-from setting import PUPPY_DOWNLOAD_URL
 from redline import RedLine
 
 
@@ -50,6 +64,15 @@ class TCAPlugin(object):
         self.url_list = {}
         self.fail_msg = []  # 未通过红线指标的提示信息
         self.pass_msg = []  # 已通过红线指标的提示信息
+        self.client_lock = None  # 客户端缓存的共享锁
+        self.run_work_dir = None  # 本次任务的临时工作目录
+        self.client_version = None  # 客户端版本(客户端目录名)
+        self.result_cache = None  # 扫描结果缓存
+        self.result_cache_keys = {}  # 未命中缓存的文件相对路径 -> 缓存key
+        self.cached_issues = []  # 命中缓存的文件的问题列表
+        self.scan_paths = None  # 待扫描文件相对路径列表
+        self.label_use_times = {}  # 按规则标签并发扫描时,各标签的扫描耗时
+        self.discovery = None  # 启动阶段并发获取待扫描文件列表的任务(Future)
 
         # 判断是否快速扫描模式
         self.quick_scan = self.get_param("quick_scan")
@@ -68,8 +91,36 @@ class TCAPlugin(object):
         else:
             self.block = True
         self.from_file = self.get_param("from_file")
+        # 增量扫描的对比版本,由git直接计算变更文件列表
+        self.diff_base = self.get_param("diff_base")
+        self.diff_merge_base = self.get_param("diff_merge_base") not in ["false", "False"]
         self.white_paths = self.get_param("white_paths")
         self.ignore_paths = self.get_param("ignore_paths")
+        # 是否按各级目录下的.gitignore及代码根目录下的.tcaignore过滤文件
+        self.use_gitignore = self.get_param("use_gitignore") in ["true", "True"]
+        # 扫描结果缓存目录(为空时不使用缓存)、缓存大小上限(MB)及工具配置标识(变更后缓存失效)
+        self.result_cache_dir = self.get_param("result_cache_dir")
+        self.result_cache_max_size = self.__parse_positive_int("result_cache_max_size", setting.RESULT_CACHE_MAX_SIZE)
+        self.result_cache_key = self.get_param("result_cache_key")
+        # 分片并发扫描的分片数(auto表示cpu核数,为空时不分片)及内存预算(MB)
+        self.quick_scan_shards = self.__parse_quick_scan_shards(self.get_param("quick_scan_shards"))
+        self.shard_memory_budget = self.__parse_positive_int("shard_memory_budget", None)
+        # 多个规则标签时,每个标签启动独立的扫描进程并发扫描
+        self.parallel_labels = self.get_param("parallel_labels") in ["true", "True"]
+        # 快速扫描完整结果的输出文件(相对工作空间)
+        self.report_file = self.get_param("report_file") or setting.QUICK_SCAN_REPORT_FILE
+        # 快速扫描问题的SARIF、NDJSON输出文件(相对工作空间),为空时不输出
+        self.sarif_file = self.get_param("sarif_file")
+        self.ndjson_file = self.get_param("ndjson_file")
+        # 阶段统计文件(.jsonl结尾时为JSON Lines格式,否则为Chrome trace格式),为空时不输出
+        self.trace_file = self.get_param("trace_file")
+        # 多项目模式: 项目清单文件(相对工作空间)及同时扫描的最大项目数
+        self.projects_file = self.get_param("projects_file")
+        self.project_workers = self.__parse_positive_int("project_workers", setting.PROJECT_WORKERS)
+        # 快速扫描模式下是否按存量问题量红线指标(total_xxx)判断是否通过(多项目模式下项目设置了红线指标时自动启用)
+        self.quick_redline = self.get_param("quick_redline") in ["true", "True"]
+        # 常驻扫描服务的unix socket路径,设置后scan命令将扫描请求提交到常驻扫描服务执行
+        self.daemon_socket = self.get_param("daemon_socket")
 
         # 完整扫描模式 - 用户输入参数
         self.scheme_id = self.get_param("scheme_id")
@@ -78,6 +129,14 @@ class TCAPlugin(object):
         self.compare_branch = self.get_param("compare_branch")
         # 超时时间
         self.timeout = self.get_param("timeout")
+        # 完整扫描模式的结果文件(相对工作空间)
+        self.status_file = self.get_param("status_file") or "codedog_report.json"
+        # 客户端分段并发下载的并发数
+        self.download_concurrency = self.__parse_positive_int("download_concurrency", None)
+        # 客户端安装包镜像列表(按优先级排列),用英文逗号分割
+        self.client_mirrors = self.get_param("client_mirrors")
+        self.client_mirrors = [item.strip() for item in self.client_mirrors.split(",") if item.strip()] \
+            if self.client_mirrors else []
         # 与服务端通信参数
         self.token = self.get_param("token")
         self.server_ip = self.get_param("server_ip")
@@ -90,6 +149,43 @@ class TCAPlugin(object):
 
         self.source_dir = self.get_param("source_dir")
 
+    @staticmethod
+    def __parse_quick_scan_shards(value):
+        """
+        解析分片数参数
+        :return: "auto"或大于1的分片数;不分片(包括格式有误)时返回None
+        """
+        if not value or not value.strip():
+            return None
+        value = value.strip()
+        if value.lower() == "auto":
+            return "auto"
+        try:
+            shard_count = int(value)
+        except ValueError:
+            logger.warning(f"分片数格式有误(需为整数或auto): {value}, 不分片扫描")
+            return None
+        return shard_count if shard_count > 1 else None
+
+    def __parse_positive_int(self, key, default):
+        """
+        获取正整数参数
+        :param key: 参数名
+        :param default: 默认值
+        :return: 参数值;未设置或格式有误(非正整数)时返回默认值
+        """
+        value = self.get_param(key)
+        if not value or not value.strip():
+            return default
+        try:
+            number = int(value.strip())
+        except ValueError:
+            number = 0
+        if number < 1:
+            logger.warning(f"参数{key}格式有误(需为正整数): {value}, 使用默认值: {default}")
+            return default
+        return number
+
     def get_param(self, key):
         """从环境变量获取用户配置参数"""
         env = os.getenv(f"INPUT_{key.upper()}")
@@ -99,6 +195,7 @@ class TCAPlugin(object):
     def __chmod_exe(self, dir_path):
         """
         给可执行程序赋予执行权限
+        解压时已恢复压缩包中记录的权限,此处仅兜底处理未记录unix权限(如windows下打包)的情况
         :param dir_path: 可执行程序目录
         :return:
         """
@@ -107,60 +204,422 @@ class TCAPlugin(object):
             os.path.join(dir_path, self.task_name),
         ]
         for exe_path in exe_paths:
-            if os.path.exists(exe_path):
-                os.chmod(exe_path, stat.S_IRWXU)
+            if os.path.exists(exe_path) and not os.access(exe_path, os.X_OK):
+                os.chmod(exe_path, os.stat(exe_path).st_mode | stat.S_IRWXU)
 
     def run_quickscan(self, cur_workspace, codedog_exe, codedog_work_dir):
-        input_file = self.get_quick_scan_input_file(cur_workspace, codedog_work_dir)
+        if self.result_cache_dir:
+            self.result_cache = ResultCache(os.path.abspath(self.result_cache_dir),
+                                            self.result_cache_max_size * 1024 * 1024,
+                                            StringMgr.str_to_list(self.label), self.client_version,
+                                            self.result_cache_key or "")
+        if self.discovery:  # 启动阶段已与客户端安装并发获取待扫描文件列表
+            with tracer.span("wait_discovery"):
+                scan_paths, input_file = self.discovery.result()
+            if input_file is None and scan_paths is not None:
+                input_file = self.gen_quick_scan_input_file(scan_paths, self.run_work_dir)
+        else:
+            input_file = self.get_quick_scan_input_file(cur_workspace, self.run_work_dir)
         if input_file:
             os.environ["TCA_QUICK_SCAN_INPUT"] = input_file
+        report_labels = [] if self.__is_parallel_labels() else None
+        if self.result_cache and not input_file:  # 所有文件均命中缓存,无需启动扫描
+            report_paths = []
+        elif report_labels is not None:
+            report_paths, report_labels = self.__run_label_quickscans(codedog_exe, codedog_work_dir, input_file)
+        elif self.quick_scan_shards and input_file:
+            report_paths = self.__run_sharded_quickscan(codedog_exe, codedog_work_dir)
+        else:
+            report_paths = [self.__run_quickscan_process(codedog_exe, codedog_work_dir)]
+
+        # 流式读取结果文件,统计问题分布,同时将完整结果(及SARIF、NDJSON)输出到工作空间下的文件;日志中只输出摘要
+        summary = QuickReportSummary(setting.REPORT_DIGEST_TOP_N)
+        writers = [QuickReportWriter(os.path.join(cur_workspace, self.report_file))]
+        if self.sarif_file:
+            writers.append(SarifWriter(os.path.join(cur_workspace, self.sarif_file), self.source_dir))
+        if self.ndjson_file:
+            writers.append(NdjsonWriter(os.path.join(cur_workspace, self.ndjson_file)))
+        writer = IssueWriterGroup(writers)
+        try:
+            data = self.__read_quickscan_reports(report_paths, summary, writer, report_labels)
+            self.__check_quickscan_status(data, summary.severity_counter)
+            data["summary"] = summary.to_dict()
+            data["timings"] = tracer.get_timings()  # 各阶段耗时(截至读取结果结束)
+            if not writer.started:
+                writer.start(setting.QUICK_SCAN_ISSUE_KEYS[0])
+            writer.close(data)
+        except Exception:
+            writer.abort()
+            raise
+
+        data.pop("summary")
+        data.pop("timings")
+        data_str = json.dumps(data, indent=2, ensure_ascii=False)
+        logger.info(f"扫描结果:\n{data_str}\n{summary.get_digest()}")
+
+    def __check_quickscan_status(self, data, severity_counts=None):
+        """
+        根据错误码及问题量判断是否通过,设置返回码;启用quick_redline且设置了存量问题量红线指标(total_xxx)时,按红线指标判断
+        :param data: 扫描结果字段
+        :param severity_counts: 各级别的问题量
+        """
+        self.status_code = data.get("error_code")
+        if self.status_code == 0:  # 正常执行完成，才判断问题量
+            issue_count = data.get("issue_count")
+            is_pass = None if issue_count is None else issue_count == 0
+            quality_data = self.__get_quick_quality_data(severity_counts)
+            if quality_data:  # 按红线指标判断
+                self.check_pass({}, quality_data, list(quality_data))
+                data["redline_msg"] = "\n".join(self.pass_msg + self.fail_msg)
+                is_pass = not self.fail_msg
+            if is_pass is not None:
+                if is_pass:
+                    data["status"] = "pass"
+                    data["text"] = "通过"
+                    data["description"] = "通过"
+                else:
+                    data["status"] = "failed"
+                    data["text"] = "不通过"
+                    data["description"] = f"不通过, 待处理问题量: {issue_count}"
+                    if self.block:
+                        self.status_code = 1
+        else:  # 执行异常，如果设置了不block，修改错误码为0，不阻塞流程
+            if not self.block:
+                logger.warning(f"param block=false, reset status code({self.status_code}) to 0.")
+                self.status_code = 0
+
+    def __get_quick_quality_data(self, severity_counts):
+        """
+        根据快速扫描各级别的问题量生成存量问题量红线数据(与RedLine一致,各级别包含更严重级别的问题量)
+        :return: 质量红线判断数据(只包含已设置的红线指标);未启用quick_redline或未设置存量问题量红线指标时返回None
+        """
+        if not self.quick_redline or severity_counts is None:
+            return None
+        quality_data = {}
+        total = 0
+        for level in ["fatal", "error", "warning", "info"]:
+            total += severity_counts.get(level, 0)
+            if self.get_param(f"total_{level}") is not None:
+                quality_data[f"total_{level}"] = {"value": total}
+        return quality_data or None
 
+    @tracer.traced("read_report")
+    def __read_quickscan_reports(self, report_paths, summary, writer, report_labels=None):
+        """
+        流式读取各结果文件的问题列表: 统计问题分布、写入完整结果,启用结果缓存时按文件分组写入缓存;
+        合并各结果文件的其他字段(错误码、问题量等)
+        :param report_paths: 结果文件路径列表
+        :param summary: QuickReportSummary
+        :param writer: QuickReportWriter
+        :param report_labels: 按规则标签并发扫描时,各结果文件对应的规则标签列表(问题中记录label字段),否则为None
+        :return: 合并后的结果字段(不含问题列表)
+        """
+        if not report_paths:  # 所有文件均命中缓存
+            results = [{"error_code": 0, "issue_count": 0}]
+        else:
+            results = []
+        label_results = {}
+        file_issues = {}
+        has_issue_detail = False
+        for index, report_path in enumerate(report_paths):
+            label = report_labels[index] if report_labels else None
+            if not os.path.exists(report_path):
+                logger.warning(f"未生成结果文件: {report_path}")
+                results.append({"error_code": -1, "description": f"未生成结果文件: {report_path}"})
+                label_results.setdefault(label, []).append(results[-1])
+                continue
+            reader = QuickReportReader(report_path)
+            for issue in reader.iter_issues():
+                if not writer.started:
+                    writer.start(reader.issue_key)
+                if label:
+                    issue["label"] = label
+                rel_path = QuickReportUtil.get_issue_rel_path(issue, self.source_dir)
+                summary.add(issue, rel_path)
+                writer.add(issue)
+                if self.result_cache and rel_path in self.result_cache_keys:
+                    file_issues.setdefault(rel_path, []).append(issue)
+            has_issue_detail = has_issue_detail or reader.issue_key is not None
+            results.append(reader.fields)
+            label_results.setdefault(label, []).append(reader.fields)
+        data = self.merge_quickscan_results(results)
+
+        if self.result_cache and data.get("error_code") == 0:  # 执行异常,不写入缓存
+            with tracer.span("update_result_cache"):
+                self.__update_result_cache(data, file_issues if has_issue_detail else None)
+            # 合并命中缓存的问题
+            for issue in self.cached_issues:
+                if not writer.started:
+                    writer.start(setting.QUICK_SCAN_ISSUE_KEYS[0])
+                summary.add(issue, QuickReportUtil.get_issue_rel_path(issue, self.source_dir))
+                writer.add(issue)
+            data["issue_count"] = (data.get("issue_count") or 0) + len(self.cached_issues)
+        if report_labels is not None:
+            data["labels"] = self.__get_label_results(label_results, data.get("error_code") == 0)
+        return data
+
+    def __get_label_results(self, label_results, with_cached_issues):
+        """
+        按规则标签汇总扫描结果: 错误码、问题量(包含命中缓存的问题)、是否通过及扫描耗时
+        :param label_results: 规则标签 -> 结果字段列表
+        :param with_cached_issues: 是否计入命中缓存的问题
+        :return: 规则标签 -> 汇总结果
+        """
+        cached_counts = {}
+        if self.result_cache and with_cached_issues:
+            for issue in self.cached_issues:
+                cached_counts[issue.get("label")] = cached_counts.get(issue.get("label"), 0) + 1
+        labels = {}
+        for label in sorted(StringMgr.str_to_list(self.label)):
+            merged = self.merge_quickscan_results(label_results.get(label, [{"error_code": 0, "issue_count": 0}]))
+            result = {"error_code": merged["error_code"], "issue_count": merged.get("issue_count")}
+            if result["issue_count"] is not None:
+                result["issue_count"] += cached_counts.get(label, 0)
+            if result["error_code"] != 0:
+                result["status"] = "error"
+                result["description"] = merged.get("description")
+            elif result["issue_count"] is not None:
+                result["status"] = "pass" if result["issue_count"] == 0 else "failed"
+            if label in self.label_use_times:
+                result["use_time"] = round(self.label_use_times[label], 3)
+            labels[label] = result
+        return labels
+
+    @tracer.traced("quickscan")
+    def __run_quickscan_process(self, codedog_exe, codedog_work_dir):
+        """
+        启动快速扫描进程,返回扫描结果
+        """
         # 扫描参数
         scan_args = [
             codedog_exe, "quickscan",
             "-s", self.source_dir,
             "-l", self.label
         ]
-        logger.info("run cmd: %s", " ".join(scan_args))
-
-        sp = subprocess.Popen(args=scan_args, cwd=codedog_work_dir)
-        scan_time_out = setting.SCAN_TIMEOUT
-        sp.wait(timeout=scan_time_out)
 
         report_path = os.getenv("TCA_QUICK_SCAN_OUTPUT")
         if report_path:
             report_path = os.path.abspath(report_path)
+        else:  # 结果输出到本次任务的工作目录,避免并发任务互相覆盖
+            report_path = os.path.join(self.run_work_dir, "tca_quick_scan_report.json")
+            os.environ["TCA_QUICK_SCAN_OUTPUT"] = report_path
+
+        ProcessSupervisor(setting.SCAN_TIMEOUT).run(ProcessCommand(scan_args, cwd=codedog_work_dir))
+        # 结果文件不存在时不使用客户端目录下的默认结果文件(可能是其他任务或上次执行的结果),读取时作为执行异常处理
+        return report_path
+
+    def __get_shard_count(self, file_count):
+        """
+        计算分片数: 默认为cpu核数,不超过内存预算可同时运行的进程数及文件数
+        """
+        if self.quick_scan_shards == "auto":
+            shard_count = os.cpu_count() or 1
         else:
-            report_path = os.path.join(codedog_work_dir, "tca_quick_scan_report.json")
-        with open(report_path, "r") as rf:
-            data = json.load(rf)
-            self.status_code = data.get("error_code")
-
-            if self.status_code == 0:  # 正常执行完成，才判断问题量
-                issue_count = data.get("issue_count")
-                if issue_count is not None:
-                    if issue_count == 0:
-                        data["status"] = "pass"
-                        data["text"] = "通过"
-                        data["description"] = "通过"
-                    else:
-                        data["status"] = "failed"
-                        data["text"] = "不通过"
-                        data["description"] = f"不通过, 待处理问题量: {issue_count}"
-                        if self.block:
-                            self.status_code = 1
-            else:  # 执行异常，如果设置了不block，修改错误码为0，不阻塞流程
-                if not self.block:
-                    logger.warning(f"param block=false, reset status code({self.status_code}) to 0.")
-                    self.status_code = 0
+            shard_count = self.quick_scan_shards
+        if self.shard_memory_budget:
+            memory_budget = self.shard_memory_budget
+        else:  # 默认使用物理内存的80%
+            memory_budget = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.8 / 1048576
+        max_by_memory = max(1, int(memory_budget // setting.SHARD_MEMORY_PER_PROCESS))
+        if shard_count > max_by_memory:
+            logger.info(f"内存预算 {int(memory_budget)}MB 限制分片数为: {max_by_memory}")
+            shard_count = max_by_memory
+        return max(1, min(shard_count, file_count))
 
-        data_str = json.dumps(data, indent=2, ensure_ascii=False)
-        logger.info(f"扫描结果:\n{data_str}")
+    def split_shards(self, scan_paths, shard_count):
+        """
+        将待扫描文件按文件大小和语言(扩展名)均衡划分为多个分片:
+        逐个语言(总大小从大到小)处理,文件按大小从大到小分配给该语言已分配量最小(其次总量最小)的分片,
+        使每个分片的总量及各语言的分配量均衡
+        :param scan_paths: 待扫描文件相对路径列表
+        :param shard_count: 分片数
+        :return: 分片列表,每个分片为文件相对路径列表
+        """
+        lang_files = {}
+        for rel_path in scan_paths:
+            try:
+                size = os.path.getsize(os.path.join(self.source_dir, rel_path))
+            except OSError:
+                size = 0
+            # 每个文件附加固定开销,避免大量小文件集中在同一分片
+            weight = size + setting.SHARD_FILE_OVERHEAD
+            lang = os.path.splitext(rel_path)[1].lower()
+            lang_files.setdefault(lang, []).append((weight, rel_path))
+
+        shards = [[] for _ in range(shard_count)]
+        shard_loads = [0] * shard_count
+        lang_groups = sorted(lang_files.values(), key=lambda files: -sum(weight for weight, _ in files))
+        for files in lang_groups:
+            files.sort(reverse=True)
+            heap = [(0, shard_loads[index], index) for index in range(shard_count)]
+            heapq.heapify(heap)
+            for weight, rel_path in files:
+                lang_load, total_load, index = heapq.heappop(heap)
+                shards[index].append(rel_path)
+                shard_loads[index] += weight
+                heapq.heappush(heap, (lang_load + weight, shard_loads[index], index))
+        return [shard for shard in shards if shard]
+
+    @tracer.traced("quickscan_sharded")
+    def __run_sharded_quickscan(self, codedog_exe, codedog_work_dir):
+        """
+        将待扫描文件划分为多个分片,每个分片使用独立的工作目录(输入文件、结果文件)并发扫描
+        :return: 各分片的结果文件路径列表
+        """
+        shard_count = self.__get_shard_count(len(self.scan_paths))
+        if shard_count <= 1:
+            return [self.__run_quickscan_process(codedog_exe, codedog_work_dir)]
+        shards = self.split_shards(self.scan_paths, shard_count)
+        commands, report_paths = self.__gen_quickscan_commands(codedog_exe, codedog_work_dir, self.label, shards,
+                                                               self.run_work_dir)
+        ProcessSupervisor(setting.SCAN_TIMEOUT).run_all(commands)
+        return report_paths
+
+    def __gen_quickscan_commands(self, codedog_exe, codedog_work_dir, label, shards, work_dir, name=""):
+        """
+        生成各分片的扫描命令,每个分片使用独立的工作目录(输入文件、结果文件)
+        :param label: 规则标签(多个用英文逗号分割)
+        :param shards: 分片列表,每个分片为文件相对路径列表;为None时扫描整个代码目录(不生成输入文件)
+        :param work_dir: 分片工作目录的上级目录
+        :param name: 日志中显示的名称前缀
+        :return: (扫描命令列表, 结果文件路径列表)
+        """
+        commands = []
+        report_paths = []
+        for index, shard_paths in enumerate(shards or [None]):
+            shard_dir = os.path.join(work_dir, f"shard_{index}")
+            os.makedirs(shard_dir)
+            report_path = os.path.join(shard_dir, "tca_quick_scan_report.json")
+            env = dict(os.environ, TCA_QUICK_SCAN_OUTPUT=report_path)
+            if shard_paths is not None:
+                input_file = os.path.join(shard_dir, "quickscan_input_file.json")
+                self.write_quick_scan_input_file(input_file, shard_paths, StringMgr.str_to_list(label))
+                env["TCA_QUICK_SCAN_INPUT"] = input_file
+            scan_args = [codedog_exe, "quickscan", "-s", self.source_dir, "-l", label]
+            shard_name = f"{name}分片{index}" if shards and len(shards) > 1 else name
+            if shard_paths is not None:
+                logger.info(f"[{shard_name}]文件数: {len(shard_paths)}")
+            commands.append(ProcessCommand(scan_args, cwd=codedog_work_dir, env=env, name=shard_name or None))
+            report_paths.append(report_path)
+        return commands, report_paths
+
+    def __is_parallel_labels(self):
+        return self.parallel_labels and len(StringMgr.str_to_list(self.label)) > 1
+
+    @tracer.traced("quickscan_labels")
+    def __run_label_quickscans(self, codedog_exe, codedog_work_dir, input_file):
+        """
+        每个规则标签启动独立的扫描进程,共用同一待扫描文件列表并发扫描;设置了分片数时,各标签再按分片并发
+        :param input_file: 待扫描文件的input file,为空时扫描整个代码目录
+        :return: (结果文件路径列表, 各结果文件对应的规则标签列表)
+        """
+        labels = sorted(StringMgr.str_to_list(self.label))
+        scan_paths = self.scan_paths if input_file else None
+        shards = [scan_paths] if scan_paths is not None else None
+        if self.quick_scan_shards and scan_paths:
+            # 扫描进程数按标签数均分
+            shard_count = max(1, self.__get_shard_count(len(scan_paths)) // len(labels))
+            if shard_count > 1:
+                shards = self.split_shards(scan_paths, shard_count)
+
+        commands = []
+        report_paths = []
+        report_labels = []
+        for index, label in enumerate(labels):
+            label_dir = os.path.join(self.run_work_dir, f"label_{index}")
+            label_commands, label_report_paths = self.__gen_quickscan_commands(
+                codedog_exe, codedog_work_dir, label, shards, label_dir, name=label)
+            commands.extend(label_commands)
+            report_paths.extend(label_report_paths)
+            report_labels.extend([label] * len(label_report_paths))
+        logger.info(f"按规则标签并发扫描: {labels}, 进程数: {len(commands)}")
+        ProcessSupervisor(setting.SCAN_TIMEOUT).run_all(commands)
+        for label, command in zip(report_labels, commands):
+            self.label_use_times[label] = max(self.label_use_times.get(label, 0), command.use_time or 0)
+        return report_paths, report_labels
+
+    @staticmethod
+    def merge_quickscan_results(results):
+        """
+        合并多个快速扫描结果(不含问题列表)的字段: 问题量求和;任一结果执行异常时,使用首个异常结果的错误码和描述
+        :param results: 扫描结果字段列表
+        :return: 合并后的扫描结果字段
+        """
+        merged = {"error_code": 0, "issue_count": None}
+        for result in results:
+            for key, value in result.items():
+                if key not in merged:
+                    merged[key] = value
+            error_code = result.get("error_code")
+            if error_code != 0 and merged["error_code"] == 0:
+                merged["error_code"] = error_code
+                for key in ["status", "text", "description"]:
+                    if key in result:
+                        merged[key] = result[key]
+            if result.get("issue_count") is not None:
+                merged["issue_count"] = (merged["issue_count"] or 0) + result["issue_count"]
+        if merged["issue_count"] is None:
+            merged.pop("issue_count")
+        return merged
+
+    def __apply_result_cache(self, scan_paths):
+        """
+        计算待扫描文件的缓存key,命中缓存的文件不再扫描,其问题列表保存到self.cached_issues
+        :param scan_paths: 待扫描文件相对路径列表
+        :return: 未命中缓存的文件相对路径列表
+        """
+        miss_paths = []
+        for rel_path in scan_paths:
+            key = self.result_cache.get_key(os.path.join(self.source_dir, rel_path), rel_path)
+            issues = self.result_cache.get(key) if key else None
+            if issues is None:
+                miss_paths.append(rel_path)
+                if key:
+                    self.result_cache_keys[rel_path] = key
+                continue
+            for issue in issues:  # 代码目录可能已变更(绝对路径不同),更新为当前路径
+                path_key = QuickReportUtil.get_issue_path_key(issue)
+                if path_key:
+                    issue[path_key] = os.path.join(self.source_dir, rel_path) \
+                        if os.path.isabs(issue[path_key]) else rel_path
+            self.cached_issues.extend(issues)
+        logger.info(f"[扫描结果缓存]命中文件数: {len(scan_paths) - len(miss_paths)}，待扫描文件数: {len(miss_paths)}")
+        return miss_paths
+
+    def __update_result_cache(self, data, file_issues):
+        """
+        将本次扫描的各文件问题列表写入缓存
+        :param data: 扫描结果字段
+        :param file_issues: 未命中缓存的文件相对路径 -> 问题列表;结果中无问题明细时为None
+        :return:
+        """
+        if file_issues is not None:
+            for rel_path, key in self.result_cache_keys.items():
+                self.result_cache.put(key, file_issues.get(rel_path, []))
+        elif data.get("issue_count") == 0:  # 无问题明细,但问题量为0,所有文件均无问题
+            for key in self.result_cache_keys.values():
+                self.result_cache.put(key, [])
+        else:
+            logger.warning("扫描结果中无问题明细,本次结果不写入缓存。")
+        self.result_cache.evict()
 
     def get_quick_scan_input_file(self, cur_workspace, codedog_work_dir):
         """
-        从from_file指定的文件中获取需要扫描的文件路径,生成quickscan的input file
+        从from_file指定的文件中获取需要扫描的文件路径(或通过git获取相对diff_base的变更文件),生成quickscan的input file
+        """
+        scan_paths = self.discover_scan_paths(cur_workspace)
+        if scan_paths is None:
+            return None
+        return self.gen_quick_scan_input_file(scan_paths, codedog_work_dir)
+
+    @tracer.traced("discover")
+    def discover_scan_paths(self, cur_workspace):
+        """
+        获取待扫描文件相对路径列表(from_file指定的文件、相对diff_base的变更文件或遍历代码目录),并按过滤路径过滤
+        :param cur_workspace: 当前工作空间目录
+        :return: 待扫描文件相对路径列表;不需要文件列表(扫描整个代码目录)时返回None
         """
+        output_paths = self.get_output_rel_paths(cur_workspace)
         scan_paths = []
         if self.from_file:
             file_path = os.path.join(cur_workspace, self.from_file)
@@ -179,17 +638,79 @@ class TCAPlugin(object):
             if not scan_paths:
                 logger.warning("from_file文件中无待扫描文件,请检查。")
                 sys.exit(-1)
+        elif self.diff_base:
+            scan_paths = GitUtil.get_changed_files(self.source_dir, self.diff_base, self.diff_merge_base)
+            logger.info(f"相对 {self.diff_base} 的变更文件数: {len(scan_paths)}")
+            if not scan_paths:
+                logger.info("无变更文件,跳过扫描。")
+                sys.exit(0)
         else:
-            if not self.white_paths and not self.ignore_paths:  # 未指定扫描文件列表，也未设置过滤路径, 返回空（此时不生成input_file,会扫描整个代码目录）
+            # 未指定扫描文件列表，也不需要获取文件列表(过滤路径、结果缓存、分片扫描，或代码目录下有上次输出的结果文件),
+            # 返回空（此时不生成input_file,会扫描整个代码目录）
+            if not self.__need_file_list() and not self.__has_output_files(output_paths):
                 return None
 
-        if self.white_paths or self.ignore_paths:  # 根据过滤路径进行过滤
+        if self.__need_file_list() or not (self.from_file or self.diff_base):  # 根据过滤路径进行过滤
             scan_paths = self.filter_paths(scan_paths)
+        # 排除输出文件,避免扫描上次输出的结果
+        scan_paths = [rel_path for rel_path in scan_paths if self.__norm_rel_path(rel_path) not in output_paths]
+        if not scan_paths:
+            logger.info("过滤后无待扫描文件,跳过扫描。")
+            sys.exit(0)
+        return scan_paths
+
+    def get_output_rel_paths(self, cur_workspace, base_dir=None):
+        """
+        获取位于指定目录下的输出文件(结果文件、SARIF、NDJSON、阶段统计、状态文件)的相对路径
+        :param cur_workspace: 当前工作空间目录(输出文件路径相对工作空间)
+        :param base_dir: 目录,默认为代码目录
+        :return: 以/分隔的相对路径集合
+        """
+        base_dir = base_dir or self.source_dir
+        rel_paths = set()
+        for file_path in [self.report_file, self.sarif_file, self.ndjson_file, self.trace_file, self.status_file]:
+            if not file_path:
+                continue
+            rel_path = os.path.relpath(os.path.join(cur_workspace, file_path), base_dir)
+            if rel_path != os.pardir and not rel_path.startswith(os.pardir + os.sep):
+                rel_paths.add(self.__norm_rel_path(rel_path))
+        return rel_paths
+
+    def __has_output_files(self, output_paths):
+        return any(os.path.isfile(os.path.join(self.source_dir, rel_path)) for rel_path in output_paths)
+
+    @staticmethod
+    def __norm_rel_path(rel_path):
+        return os.path.normpath(rel_path).replace(os.sep, "/")
+
+    @tracer.traced("gen_input_file")
+    def gen_quick_scan_input_file(self, scan_paths, codedog_work_dir):
+        """
+        过滤掉命中扫描结果缓存的文件,生成quickscan的input file
+        :param scan_paths: 待扫描文件相对路径列表
+        :param codedog_work_dir: input file所在目录
+        :return: input file路径;所有文件均命中缓存时返回None
+        """
+        if self.result_cache:
+            scan_paths = self.__apply_result_cache(scan_paths)
             if not scan_paths:
-                logger.info("过滤后无待扫描文件,跳过扫描。")
-                sys.exit(0)
+                logger.info("所有文件均命中扫描结果缓存,无需扫描。")
+                return None
+
+        self.scan_paths = scan_paths
+        input_file = os.path.join(codedog_work_dir, "quickscan_input_file.json")
+        self.write_quick_scan_input_file(input_file, scan_paths, StringMgr.str_to_list(self.label))
+        return input_file
 
-        # 将待扫描文件添加到input file中
+    @staticmethod
+    def write_quick_scan_input_file(input_file, scan_paths, labels):
+        """
+        将待扫描文件添加到input file中
+        :param input_file: input file路径
+        :param scan_paths: 待扫描文件相对路径列表
+        :param labels: 规则标签列表
+        :return:
+        """
         format_scan_paths = []
         for rel_path in scan_paths:
             format_scan_paths.append({
@@ -197,15 +718,20 @@ class TCAPlugin(object):
                 "type": "file"
             })
         data = {
-            "labels": StringMgr.str_to_list(self.label),
+            "labels": labels,
             "scan_path": format_scan_paths
         }
-        input_file = os.path.join(codedog_work_dir, "quickscan_input_file.json")
         if os.path.exists(input_file):
             os.remove(input_file)
         with open(input_file, "w") as wf:
             json.dump(data, wf, indent=2)
-        return input_file
+
+    def __need_file_list(self):
+        """
+        是否需要获取待扫描文件列表
+        """
+        return bool(self.white_paths or self.ignore_paths or self.use_gitignore or self.result_cache_dir
+                    or self.quick_scan_shards or self.__is_parallel_labels())
 
     def filter_paths(self, scan_paths):
         """
@@ -220,14 +746,29 @@ class TCAPlugin(object):
         else:
             path_exclude = []
 
-        if not scan_paths:  # 未指定扫描文件列表，获取目录下所有文件，再过滤
-            scan_paths = PathUtil.get_dir_files(self.source_dir)
+        filter_util = FilterPathUtil(path_include, path_exclude)
+        ignore_matcher = IgnoreFileMatcher(self.source_dir) if self.use_gitignore else None
+        if scan_paths:
+            if ignore_matcher:
+                scan_paths = [rel_path for rel_path in scan_paths if not ignore_matcher.is_ignored(rel_path)]
+        else:  # 未指定扫描文件列表，遍历目录下所有文件(跳过整个被过滤或被忽略的目录)，边遍历边过滤
+            skip_dir = filter_util.should_skip_dir
+            skip_file = None
+            if ignore_matcher:
+                skip_dir = lambda rel_dir: filter_util.should_skip_dir(rel_dir) or \
+                    ignore_matcher.match(rel_dir, is_dir=True)
+                skip_file = ignore_matcher.match
+            scan_paths = PathUtil.get_dir_files(self.source_dir, skip_dir=skip_dir, skip_file=skip_file)
 
-        scan_paths = FilterPathUtil(path_include, path_exclude).get_include_files(scan_paths, self.source_dir)
+        scan_paths = filter_util.get_include_files(scan_paths, self.source_dir)
         return scan_paths
 
-    def check_pass(self, scan_result, quality_data):
+    def check_pass(self, scan_result, quality_data, metric_ids=None):
         """
+        按红线指标判断是否通过,结果记录在pass_msg/fail_msg
+        :param scan_result: 扫描结果
+        :param quality_data: 质量红线判断数据
+        :param metric_ids: 需要判断的红线指标,为空时判断所有已设置的指标
         scan_result 中的 urls 结构 demo
         "urls": {
             "proj_overview": "",     # 概览页
@@ -267,7 +808,7 @@ class TCAPlugin(object):
         }
         for key_id, info in metric_keys.items():
             expected_value = self.get_param(key_id)
-            if expected_value is None:
+            if expected_value is None or (metric_ids is not None and key_id not in metric_ids):
                 continue
             if key_id in ["cc_func_average", "over_cc_func_average"]:
                 expected_value = float(expected_value)
@@ -335,6 +876,7 @@ class TCAPlugin(object):
             "redline_msg": redline_msg,
             "scan_report": scan_report,
             "metrics": quality_data,
+            "timings": tracer.get_timings(),
         }
 
         result_msg = "\n"
@@ -347,7 +889,7 @@ class TCAPlugin(object):
 
         # 将结果输出到工作空间下的json文件,供后续步骤使用
         workspace = os.getcwd()
-        codedog_report_file = os.path.join(workspace, "codedog_report.json")
+        codedog_report_file = os.path.join(workspace, self.status_file)
         if os.path.exists(codedog_report_file):
             os.remove(codedog_report_file)
         with open(codedog_report_file, "wb") as fp:
@@ -357,17 +899,102 @@ class TCAPlugin(object):
             logger.warning(f"param block=false, reset status code({self.status_code}) to 0.")
             self.status_code = 0
 
+    @tracer.traced("quickinit")
     def __init_tools(self, tca_work_dir, codedog_exe):
         # 扫描参数
         scan_args = [
             codedog_exe, "quickinit",
             "-l", self.label
         ]
-        logger.info("run cmd: %s", " ".join(scan_args))
+        ProcessSupervisor(setting.SCAN_TIMEOUT).run(ProcessCommand(scan_args, cwd=tca_work_dir))
+
+    @tracer.traced("warmup")
+    def warmup(self, tca_install_dir, labels):
+        """
+        安装客户端,并发初始化各规则标签的工具,完成后写入清单文件;扫描时清单匹配则跳过工具初始化
+        :param tca_install_dir: 客户端安装目录
+        :param labels: 规则标签列表
+        :return: 初始化失败的规则标签列表
+        """
+        tca_work_dir = self.__install_client(tca_install_dir)
+        codedog_exe = os.path.join(tca_work_dir, self.codepuppy_name)
+        return self.__init_label_tools(tca_work_dir, codedog_exe, labels)
+
+    def __init_label_tools(self, tca_work_dir, codedog_exe, labels):
+        """
+        并发初始化各规则标签的工具,完成后写入清单文件
+        :return: 初始化失败的规则标签列表
+        """
+        logger.info(f"开始初始化工具, 规则标签: {labels}")
+        commands = [ProcessCommand([codedog_exe, "quickinit", "-l", label], cwd=tca_work_dir,
+                                   name=f"quickinit[{label}]") for label in labels]
+        with FileLock(os.path.join(tca_work_dir, ".tools.lock")):
+            returncodes = ProcessSupervisor(setting.SCAN_TIMEOUT).run_all(commands)
+            failed_labels = [label for label, returncode in zip(labels, returncodes) if returncode != 0]
+            ready_labels = [label for label in labels if label not in failed_labels]
+            if ready_labels:
+                self.__write_warmup_manifest(tca_work_dir, codedog_exe, ready_labels)
+        if failed_labels:
+            logger.error(f"工具初始化失败, 规则标签: {failed_labels}")
+        return failed_labels
 
-        sp = subprocess.Popen(args=scan_args, cwd=tca_work_dir)
-        scan_time_out = setting.SCAN_TIMEOUT
-        sp.wait(timeout=scan_time_out)
+    @staticmethod
+    def __get_exe_signature(codedog_exe):
+        """
+        客户端可执行文件的标识(大小及修改时间),客户端更新后清单失效
+        """
+        file_stat = os.stat(codedog_exe)
+        return {"size": file_stat.st_size, "mtime": int(file_stat.st_mtime)}
+
+    def __load_warmup_manifest(self, tca_work_dir):
+        manifest_path = os.path.join(tca_work_dir, setting.WARMUP_MANIFEST_NAME)
+        if not os.path.isfile(manifest_path):
+            return None
+        try:
+            with open(manifest_path, "r") as rf:
+                return json.load(rf)
+        except (OSError, ValueError) as err:
+            logger.warning(f"读取工具清单失败: {err}")
+            return None
+
+    def __write_warmup_manifest(self, tca_work_dir, codedog_exe, labels):
+        """
+        写入工具清单(客户端版本不变时合并已初始化的规则标签),先写临时文件再原子重命名
+        """
+        client_version = os.path.basename(tca_work_dir)
+        exe_signature = self.__get_exe_signature(codedog_exe)
+        manifest = self.__load_warmup_manifest(tca_work_dir)
+        if not manifest or manifest.get("client_version") != client_version \
+                or manifest.get("codepuppy", {}).get("signature") != exe_signature:
+            manifest = {"labels": {}}
+        manifest["client_version"] = client_version
+        manifest["client_dir"] = tca_work_dir
+        manifest["codepuppy"] = {"path": codedog_exe, "signature": exe_signature}
+        for label in labels:
+            manifest["labels"][label] = {"initialized_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        manifest_path = os.path.join(tca_work_dir, setting.WARMUP_MANIFEST_NAME)
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump(manifest, wf, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+        logger.info(f"已写入工具清单: {manifest_path}")
+
+    def __is_warmed_up(self, tca_work_dir, codedog_exe, labels):
+        """
+        判断工具是否已由warmup命令初始化: 清单中的客户端版本、可执行文件与当前一致,且包含所有规则标签
+        """
+        manifest = self.__load_warmup_manifest(tca_work_dir)
+        if not manifest:
+            return False
+        if manifest.get("client_version") != os.path.basename(tca_work_dir) \
+                or manifest.get("codepuppy", {}).get("signature") != self.__get_exe_signature(codedog_exe):
+            logger.info("客户端已变化,工具清单失效")
+            return False
+        missing_labels = [label for label in labels if label not in manifest.get("labels", {})]
+        if missing_labels:
+            logger.info(f"工具清单中不包含规则标签: {missing_labels}")
+            return False
+        return True
 
     def run_localscan(self, codedog_exe, codedog_work_dir):
         # 扫描参数
@@ -409,15 +1036,15 @@ class TCAPlugin(object):
                     print_cmd_args.append("****")
                 else:
                     print_cmd_args.append(item)
-            logger.info("run cmd: %s", " ".join(print_cmd_args))
 
-            sp = subprocess.Popen(args=scan_args, cwd=codedog_work_dir)
-            if self.timeout:
-                scan_time_out = self.timeout * 3600
+            if self.timeout:  # 参数为字符串,单位为小时
+                scan_time_out = float(self.timeout) * 3600
             else:
                 scan_time_out = setting.SCAN_TIMEOUT
             logger.info("超时时间设置为: %s 小时" % (scan_time_out / 3600))
-            sp.wait(timeout=scan_time_out)
+            with tracer.span("localscan"):
+                ProcessSupervisor(scan_time_out).run(
+                    ProcessCommand(scan_args, cwd=codedog_work_dir, print_args=print_cmd_args))
         except Exception as err:
             self.gen_status_file(status="error", text="扫描异常", url=None, desc=str(err))
             raise err
@@ -442,22 +1069,184 @@ class TCAPlugin(object):
                 desc="启动失败,未生成结果文件: %s" % result_file,
             )
 
-    def scan_source_dir(self, cur_workspace, codedog_exe, codedog_work_dir):
+    def resolve_source_dir(self, cur_workspace):
         """
-        扫描代码
-        :return:
+        将代码目录转换为绝对路径
         """
         if self.source_dir:  # 指定了代码相对路径,拼接成绝对路径
             self.source_dir = os.path.abspath(self.source_dir)
         else:  # 没有指定,默认使用当前工作空间目录
             self.source_dir = os.path.abspath(cur_workspace)
 
+    def __discover_task(self, cur_workspace):
+        """
+        启动阶段在后台线程中执行: 遍历、过滤代码目录并生成input file,与客户端下载、解压及工具初始化并发
+        扫描结果缓存依赖客户端版本,启用缓存时input file在客户端安装完成后生成
+        :return: (待扫描文件相对路径列表, input file路径)
+        """
+        scan_paths = self.discover_scan_paths(cur_workspace)
+        input_file = None
+        if scan_paths is not None and not self.result_cache_dir:
+            input_file = self.gen_quick_scan_input_file(scan_paths, self.run_work_dir)
+        return scan_paths, input_file
+
+    def scan_source_dir(self, cur_workspace, codedog_exe, codedog_work_dir):
+        """
+        扫描代码
+        :return:
+        """
+        self.resolve_source_dir(cur_workspace)
+
         logger.info(f"scan source_dir: {self.source_dir}")
         if self.quick_scan:
             self.run_quickscan(cur_workspace, codedog_exe, codedog_work_dir)
         else:
             self.run_localscan(codedog_exe, codedog_work_dir)
 
+    def run_projects(self, cur_workspace, tca_install_dir):
+        """
+        多项目模式: 客户端只安装一次,所有项目的规则标签统一初始化工具(写入warmup清单,项目扫描时跳过初始化),
+        一次遍历工作空间生成各项目的文件列表(与客户端安装并发),然后并发扫描各项目,汇总结果到codedog_report.json
+        :param cur_workspace: 当前工作空间目录
+        :param tca_install_dir: 客户端安装目录
+        """
+        runner = MonorepoRunner(cur_workspace, os.path.join(cur_workspace, self.projects_file), self.label)
+        runner.load_projects()
+        workers = max(1, self.project_workers)
+        if not self.quick_scan and workers > 1:  # 完整扫描的结果输出到客户端目录下的固定文件,不支持并发
+            logger.warning("完整扫描模式不支持并发扫描多个项目,并发数设置为1")
+            workers = 1
+        if self.timeout:  # 参数为字符串,单位为小时
+            timeout = float(self.timeout) * 3600 + setting.PROJECT_TIMEOUT_MARGIN
+        else:
+            timeout = setting.SCAN_TIMEOUT + setting.PROJECT_TIMEOUT_MARGIN
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            file_lists = executor.submit(tracer.traced("discover")(runner.prepare_file_lists),
+                                         self.get_output_rel_paths(cur_workspace, cur_workspace))
+            tca_work_dir = self.__install_client(tca_install_dir)
+            codedog_exe = os.path.join(tca_work_dir, self.codepuppy_name)
+            tools_lock_path = os.path.join(tca_work_dir, ".tools.lock")
+            if self.quick_scan:
+                labels = runner.get_labels()
+                with FileLock(tools_lock_path, shared=True):
+                    warmed_up = self.__is_warmed_up(tca_work_dir, codedog_exe, labels)
+                if not warmed_up:
+                    with tracer.span("quickinit"):
+                        failed_labels = self.__init_label_tools(tca_work_dir, codedog_exe, labels)
+                    if failed_labels:
+                        raise Exception(f"工具初始化失败, 规则标签: {failed_labels}")
+            with tracer.span("wait_discovery"):
+                file_counts = file_lists.result()
+            with FileLock(tools_lock_path, shared=True), tracer.span("scan_projects"):
+                results = runner.run(file_counts, workers, timeout)
+        finally:
+            executor.shutdown(wait=True)
+        self.__gen_projects_report(cur_workspace, results, runner.rollup(results))
+
+    def __gen_projects_report(self, cur_workspace, results, rollup):
+        """
+        输出多项目模式的结果: 各项目结果及汇总写入codedog_report.json,任一项目执行异常或不通过时设置返回码
+        """
+        if rollup["error"]:
+            status = "error"
+        elif rollup["failed"]:
+            status = "failure"
+        else:
+            status = "success"
+        status_map = {"success": "通过", "failure": "不通过", "error": "执行异常"}
+        self.status_code = {"success": 0, "failure": 1, "error": 2}[status]
+        description = "项目数: %d, 通过: %d, 不通过: %d, 执行异常: %d, 跳过: %d" % (
+            rollup["project_count"], rollup["pass"], rollup["failed"], rollup["error"], rollup["skipped"])
+        result = {
+            "status": status,
+            "status_code": self.status_code,
+            "text": status_map[status],
+            "description": description,
+            "rollup": rollup,
+            "projects": results,
+            "timings": tracer.get_timings(),
+        }
+        with open(os.path.join(cur_workspace, self.status_file), "w", encoding="utf-8") as wf:
+            json.dump(result, wf, indent=2, ensure_ascii=False)
+
+        result_msg = "\n" + "*" * 100
+        result_msg += "\n检查结果: %s。%s" % (status_map[status], description)
+        for name, project_result in results.items():
+            result_msg += "\n[%s] %s, 问题量: %s, 耗时: %ss, %s" % (
+                name, project_result["status"], project_result.get("issue_count"), project_result.get("use_time"),
+                project_result.get("description") or "")
+        result_msg += "\n" + "*" * 100
+        logger.info(result_msg)
+
+        if self.status_code != 0 and not self.block:  # 如果参数设置为不阻塞，返回码重置为0
+            logger.warning(f"param block=false, reset status code({self.status_code}) to 0.")
+            self.status_code = 0
+
+    def run_daemon(self, tca_install_dir, socket_path, workers, labels):
+        """
+        常驻扫描服务: 安装客户端、初始化工具后常驻,通过unix socket接收扫描请求,排队并发执行
+        :param tca_install_dir: 客户端安装目录
+        :param socket_path: unix socket路径
+        :param workers: 同时运行的最大扫描数
+        :param labels: 启动时初始化工具的规则标签列表;其他规则标签由扫描进程自行初始化
+        """
+        tca_work_dir = self.__install_client(tca_install_dir)
+        codedog_exe = os.path.join(tca_work_dir, self.codepuppy_name)
+        with FileLock(os.path.join(tca_work_dir, ".tools.lock"), shared=True):
+            warmed_up = self.__is_warmed_up(tca_work_dir, codedog_exe, labels)
+        if not warmed_up:
+            failed_labels = self.__init_label_tools(tca_work_dir, codedog_exe, labels)
+            if failed_labels:
+                raise Exception(f"工具初始化失败, 规则标签: {failed_labels}")
+        ScanDaemon(socket_path, workers, tca_work_dir).serve()
+
+    def scan_by_daemon(self, cur_workspace):
+        """
+        将扫描请求提交到常驻扫描服务执行,扫描参数为当前进程的INPUT_XXX环境变量
+        :return: 是否已由常驻扫描服务执行;服务未启动时返回False
+        """
+        params = {key[len("INPUT_"):].lower(): value for key, value in os.environ.items()
+                  if key.startswith("INPUT_") and key != "INPUT_DAEMON_SOCKET"}
+        result = ScanDaemonClient(self.daemon_socket).scan(cur_workspace, params)
+        if result is None:
+            return False
+        logger.info("常驻扫描服务执行结束, 排队耗时: %ss, 扫描耗时: %ss" % (result.get("wait_time"), result.get("use_time")))
+        if result.get("error"):
+            raise Exception(result["error"])
+        self.status_code = result["returncode"]
+        return True
+
+    def __install_client(self, tca_install_dir):
+        """
+        获取客户端目录: 优先复用默认的tca-client目录,否则从客户端缓存中获取(未命中时下载安装)
+        :param tca_install_dir: 客户端安装目录
+        :return: 客户端目录
+        """
+        # 由常驻扫描服务启动的扫描进程,直接使用服务已安装的客户端(服务持有客户端共享锁)
+        daemon_client_dir = os.getenv(setting.DAEMON_CLIENT_DIR_ENV)
+        if daemon_client_dir and os.path.isdir(daemon_client_dir):
+            logger.info(f"使用常驻扫描服务的客户端: {daemon_client_dir}")
+            return daemon_client_dir
+
+        # 默认客户端工作目录，如果存在，直接复用；否则从客户端缓存中获取
+        tca_work_dir = os.path.join(tca_install_dir, "tca-client")
+
+        if os.path.exists(tca_work_dir):  # 使用默认的tca-client目录(把客户端提前打包内置在docker中)
+            logger.info("tca_work_dir: %s" % tca_work_dir)
+            logger.info(f"{tca_work_dir} existis, reuse it.")
+        else:  # 使用缓存中按安装包摘要存放的客户端，未命中时重新下载安装
+            downloader = PuppyDownloader(self.download_concurrency, mirrors=self.client_mirrors)
+            tca_work_dir = downloader.install_linux_client(tca_install_dir)
+            # 使用期间持有客户端共享锁,避免被其他任务淘汰
+            self.client_lock = downloader.client_lock
+            if not tca_work_dir:
+                raise Exception("TCA客户端下载失败!")
+            logger.info("tca_work_dir: %s" % tca_work_dir)
+        self.__chmod_exe(tca_work_dir)
+        return tca_work_dir
+
     def run(self):
         args = CmdArgParser.parse_args()
         cur_workspace = os.getcwd()
@@ -473,40 +1262,88 @@ class TCAPlugin(object):
             os.makedirs(tca_install_dir)
         logger.info(f"tca_install_dir: {tca_install_dir}")
 
-        # 默认客户端工作目录，如果存在，直接复用；否则重新下载
-        tca_work_dir = os.path.join(tca_install_dir, "tca-client")
+        if args.command == "warmup":
+            labels = StringMgr.str_to_list(args.labels or self.label)
+            try:
+                failed_labels = self.warmup(tca_install_dir, labels)
+            finally:
+                if self.trace_file:
+                    tracer.write_trace(os.path.join(cur_workspace, self.trace_file))
+            if failed_labels:
+                sys.exit(1)
+            return
+        if args.command == "daemon":
+            socket_path = args.socket or self.daemon_socket or setting.DAEMON_SOCKET_PATH
+            workers = max(1, args.workers or setting.DAEMON_WORKERS)
+            self.run_daemon(tca_install_dir, socket_path, workers, StringMgr.str_to_list(args.labels or self.label))
+            return
+        if args.command != "scan":
+            logger.warning(f"args need: scan, warmup or daemon.")
+            return
 
-        if os.path.exists(tca_work_dir):  # 使用默认的tca-client目录(把客户端提前打包内置在docker中)
-            logger.info("tca_work_dir: %s" % tca_work_dir)
-            logger.info(f"{tca_work_dir} existis, reuse it.")
-        else:  # 使用从下载url提取的目录，比如：tca-client-v20220629.1-x86_64-linux
-            zip_file_name = PUPPY_DOWNLOAD_URL.split('/')[-1]
-            tca_work_dirname = os.path.splitext(zip_file_name)[0]
-            tca_work_dir = os.path.join(tca_install_dir, tca_work_dirname)
-            logger.info("tca_work_dir: %s" % tca_work_dir)
-            if os.path.exists(tca_work_dir):
-                logger.info(f"{tca_work_dir} exists, reuse it.")
-            else:  # 重新下载
-                tca_work_dir = PuppyDownloader().download_linux_client(tca_install_dir)
-                self.__chmod_exe(tca_work_dir)
+        if self.daemon_socket:
+            if self.scan_by_daemon(cur_workspace):
+                logger.info("结束.")
+                if self.status_code != 0:
+                    logger.warning(f"status code: {self.status_code}")
+                    sys.exit(self.status_code)
+                return
+            logger.warning("常驻扫描服务未启动, 在当前进程中执行扫描.")
 
-        codedog_exe = os.path.join(tca_work_dir, self.codepuppy_name)
-        if args.command == "scan":
+        if self.projects_file:
+            try:
+                self.run_projects(cur_workspace, tca_install_dir)
+            finally:
+                if self.trace_file:
+                    tracer.write_trace(os.path.join(cur_workspace, self.trace_file))
+            logger.info("结束.")
+            if self.status_code != 0:
+                logger.warning(f"status code: {self.status_code}")
+                sys.exit(self.status_code)
+            return
+
+        self.resolve_source_dir(cur_workspace)
+        # 本次任务的临时工作目录,存放输入文件、结果文件等,避免与并发任务冲突
+        self.run_work_dir = tempfile.mkdtemp(prefix="tca_action_")
+        # 启动流水线: 获取待扫描文件列表不依赖客户端,在后台线程中与客户端下载、解压及工具初始化并发执行,扫描前等待完成
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            if self.quick_scan:
+                self.discovery = executor.submit(self.__discover_task, cur_workspace)
+            tca_work_dir = self.__install_client(tca_install_dir)
+            self.client_version = os.path.basename(tca_work_dir)
+            codedog_exe = os.path.join(tca_work_dir, self.codepuppy_name)
+            # 工具锁: 初始化工具时持有排它锁,扫描时持有共享锁,避免并发任务在扫描过程中更新工具
+            tools_lock_path = os.path.join(tca_work_dir, ".tools.lock")
             if self.quick_scan:
-                self.__init_tools(tca_work_dir, codedog_exe)
+                if self.discovery.done():  # 获取文件列表已结束(如无待扫描文件、参数有误),无需初始化工具
+                    self.discovery.result()
+                with FileLock(tools_lock_path, shared=True):
+                    warmed_up = self.__is_warmed_up(tca_work_dir, codedog_exe, StringMgr.str_to_list(self.label))
+                if warmed_up:
+                    logger.info(f"工具已由warmup命令初始化, 跳过初始化.")
+                else:
+                    with FileLock(tools_lock_path):
+                        self.__init_tools(tca_work_dir, codedog_exe)
             else:
                 logger.info(f"It is not quick scan, skip initing tools.")
 
             logger.info("开始扫描代码 ...")
-            self.scan_source_dir(cur_workspace, codedog_exe, tca_work_dir)
+            with FileLock(tools_lock_path, shared=True):
+                self.scan_source_dir(cur_workspace, codedog_exe, tca_work_dir)
+        finally:
+            executor.shutdown(wait=True)
+            shutil.rmtree(self.run_work_dir, ignore_errors=True)
+            if self.trace_file:
+                tracer.write_trace(os.path.join(cur_workspace, self.trace_file))
 
-            logger.info("结束.")
-            if self.status_code != 0:
-                logger.warning(f"status code: {self.status_code}")
-                sys.exit(self.status_code)
-        else:
-            logger.warning(f"args need: scan.")
+        logger.info("结束.")
+        if self.status_code != 0:
+            logger.warning(f"status code: {self.status_code}")
+            sys.exit(self.status_code)
 
 
 if __name__ == "__main__":
+    # 上级进程(常驻扫描服务、多项目模式等)超时或取消时发送SIGTERM,转换为SystemExit,以便结束扫描子进程并清理临时目录
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     TCAPlugin().run()
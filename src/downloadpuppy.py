@@ -12,32 +12,117 @@ import os
 import logging
 
 
+from clientcache import ClientCache
 from fileserver import FileServer
-from ziplib import ZipMgr
-from setting import PUPPY_DOWNLOAD_URL
+from httpclient import HttpClient
+from mirrorselector import MirrorSelector
+from telemetry import tracer
+from setting import PUPPY_DOWNLOAD_URL, PUPPY_DOWNLOAD_SHA256, PUPPY_DOWNLOAD_MIRRORS, DOWNLOAD_CONCURRENCY, \
+    CLIENT_CACHE_DIR_NAME, CLIENT_CACHE_MAX_SIZE, CLIENT_CACHE_MAX_AGE_DAYS
 
 logger = logging.getLogger(__name__)
 
 
 class PuppyDownloader(object):
-    def __init__(self):
-        self._file_server = FileServer()
+    def __init__(self, concurrency=None, mirrors=None):
+        """
+        :param concurrency: 分段并发下载的并发数,为空时使用默认配置,为1时使用单连接下载
+        :param mirrors: 安装包镜像列表(按优先级排列),排在默认镜像(PUPPY_DOWNLOAD_MIRRORS)之前
+        """
+        self._http_client = HttpClient()
+        self._file_server = FileServer(self._http_client)
+        self._concurrency = concurrency if concurrency else DOWNLOAD_CONCURRENCY
+        self._mirrors = list(mirrors or []) + PUPPY_DOWNLOAD_MIRRORS
+        self.last_checksum = None
+        self.client_lock = None
 
-    def common_download(self, url, dest_dir, zip_file_name):
+    @tracer.traced("download")
+    def download(self, url, dest_dir, zip_file_name, checksum=None):
+        """
+        下载安装包到指定目录
+        :return: 下载成功,返回安装包路径(sha256记录在self.last_checksum);否则返回None
+        """
         dest_file_path = os.path.join(dest_dir, zip_file_name)
-        download_path = self._file_server.download_file(url, dest_file_path)
+        if MirrorSelector.is_local(url):
+            download_path = self._file_server.copy_file(MirrorSelector.get_local_path(url), dest_file_path,
+                                                        checksum=checksum)
+        elif self._concurrency > 1:
+            download_path = self._file_server.download_file_segmented(url, dest_file_path, self._concurrency,
+                                                                      checksum=checksum)
+        else:
+            download_path = self._file_server.download_file(url, dest_file_path, checksum=checksum)
+        self.last_checksum = self._file_server.last_checksum
         if download_path:
             logger.info("下载成功: %s" % download_path)
-            unzip_dir = ZipMgr().unzip_file(download_path, dest_dir)
-            logger.info(f"unzip to dir: {unzip_dir}")
-            # 删除压缩包
-            logger.info("解压后删除压缩包: %s" % download_path)
-            os.remove(download_path)
-            return unzip_dir
         else:
             logger.error("%s 下载失败!" % url)
-            return None
+        return download_path
 
-    def download_linux_client(self, dest_dir):
+    def download_from_mirrors(self, dest_dir, zip_file_name, checksum=None):
+        """
+        从镜像下载安装包: 按首字节耗时从快到慢依次尝试可用镜像,下载失败时使用下一个镜像
+        :param checksum: 期望的安装包sha256,为空时使用镜像发布的摘要
+        :return: 下载成功,返回安装包路径(sha256记录在self.last_checksum);否则返回None
+        """
+        urls, checksum = MirrorSelector(self._mirrors).select(zip_file_name, checksum=checksum)
+        for url in urls:
+            try:
+                download_path = self.download(url, dest_dir, zip_file_name, checksum=checksum)
+            except Exception as err:
+                logger.warning(f"从镜像下载失败: {url}, {err}")
+                continue
+            if download_path:
+                return download_path
+        logger.error("所有镜像均下载失败!")
+        return None
+
+    @tracer.traced("install_client")
+    def install_linux_client(self, install_dir):
+        """
+        从客户端缓存中获取已安装的客户端,未命中时下载并安装到缓存中,然后淘汰过期的缓存版本
+        同一机器上的多个任务并发执行时,由首个任务持有安装锁完成安装,其他任务等待后直接复用;
+        返回的客户端在使用期间持有共享锁(self.client_lock),不会被其他任务淘汰
+        :param install_dir: 客户端安装目录,缓存位于其下的cache目录
+        :return: 客户端目录;下载失败返回None
+        """
+        cache = ClientCache(os.path.join(install_dir, CLIENT_CACHE_DIR_NAME),
+                            max_size=CLIENT_CACHE_MAX_SIZE, max_age_days=CLIENT_CACHE_MAX_AGE_DAYS)
         zip_file_name = PUPPY_DOWNLOAD_URL.split('/')[-1]
-        return self.common_download(PUPPY_DOWNLOAD_URL, dest_dir, zip_file_name)
+        work_dir = self.__use_cached_client(cache, zip_file_name)
+        if work_dir:
+            return work_dir
+
+        with cache.install_lock():
+            # 等待锁期间,其他任务可能已完成安装
+            work_dir = self.__use_cached_client(cache, zip_file_name)
+            if work_dir:
+                return work_dir
+
+            download_path = self.download_from_mirrors(cache.download_dir, zip_file_name,
+                                                       checksum=PUPPY_DOWNLOAD_SHA256)
+            if not download_path:
+                return None
+            digest = self.last_checksum
+            self.client_lock = cache.lock_entry(digest)
+            work_dir = cache.install(zip_file_name, download_path, digest)
+            logger.info("安装后删除压缩包: %s" % download_path)
+            os.remove(download_path)
+            cache.evict(keep_digests=(digest,))
+        return work_dir
+
+    def __use_cached_client(self, cache, zip_file_name):
+        """
+        获取缓存中已安装的客户端,并持有其共享锁
+        :return: 客户端目录;未命中返回None
+        """
+        digest = cache.get_digest(zip_file_name)
+        if not digest:
+            return None
+        entry_lock = cache.lock_entry(digest)
+        work_dir = cache.get(digest)
+        if not work_dir:
+            entry_lock.release()
+            return None
+        logger.info(f"使用已缓存的客户端: {work_dir}")
+        self.client_lock = entry_lock
+        return work_dir
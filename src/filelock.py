@@ -0,0 +1,72 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+跨进程文件锁,用于同一机器上并发执行的多个任务共享客户端安装目录
+"""
+
+import os
+import time
+import fcntl
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock(object):
+    """
+    基于flock的文件锁,支持共享锁(读锁)和排它锁(写锁)
+    进程退出时,锁由系统自动释放
+    """
+    def __init__(self, lock_path, shared=False):
+        """
+        :param lock_path: 锁文件路径
+        :param shared: True-共享锁,多个进程可同时持有;False-排它锁
+        """
+        self.lock_path = lock_path
+        self.shared = shared
+        self._fd = None
+
+    def acquire(self):
+        """
+        阻塞等待获取锁,并输出等待耗时
+        """
+        self.__open()
+        start_time = time.time()
+        fcntl.flock(self._fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        wait_time = time.time() - start_time
+        logger.info("获取%s: %s, 等待耗时: %.2fs" % ("共享锁" if self.shared else "排它锁", self.lock_path, wait_time))
+
+    def try_acquire(self):
+        """
+        非阻塞获取锁
+        :return: 获取成功返回True,锁被其他进程持有时返回False
+        """
+        self.__open()
+        try:
+            fcntl.flock(self._fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __open(self):
+        if self._fd is None:
+            self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -7,28 +7,385 @@
 """ 文件服务器接口
 """
 
+import os
+import json
+import time
+import hashlib
 import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.error import HTTPError
+
 from httpclient import HttpClient
+from setting import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_RETRY_TIMES, DOWNLOAD_MIN_SEGMENT_SIZE
 
 
 logger = logging.getLogger(__name__)
 
 
 class FileServer(object):
-    def __init__(self):
+    def __init__(self, http_client=None):
+        """
+        :param http_client: http会话,为空时新建;共用会话可复用长连接
+        """
+        self._http_client = http_client if http_client else HttpClient()
+        # 下载内容按原始字节计算Range及校验,不使用压缩传输
         self._headers = {
-            "Content-type": "application/json"
+            "Content-type": "application/json",
+            "Accept-Encoding": "identity"
         }
+        self.last_checksum = None
 
-    def download_file(self, file_url, filepath):
+    def download_file(self, file_url, filepath, checksum=None):
         """
         从文件服务器下载文件到指定地址
+        边下载边写入临时文件(filepath.part)并计算sha256,完成后原子重命名为filepath;
+        下载中断时保留临时文件,重试时通过HTTP Range从断点处续传
         :param file_url: 需要下载的文件的url
         :param filepath: 下载后的文件路径
-        :return: 下载成功,返回filepath;否则返回None
+        :param checksum: 期望的文件sha256值,不为空时校验下载内容
+        :return: 下载成功,返回filepath(文件sha256记录在self.last_checksum);否则返回None
         """
         # logger.info(f"file_url: {file_url}")
-        data = HttpClient.request(file_url, headers=self._headers, method="GET")
-        with open(filepath, "wb") as wf:
-            wf.write(data)
+        self.last_checksum = None
+        part_path = filepath + ".part"
+        for retry_index in range(DOWNLOAD_RETRY_TIMES + 1):
+            if retry_index > 0:
+                time.sleep(retry_index)
+                logger.warning(f"下载中断,第{retry_index}次重试: {file_url}")
+            # 每次尝试都重新计算摘要(续传时先读取已下载部分)
+            hasher = hashlib.sha256()
+            try:
+                self.__stream_to_file(file_url, part_path, hasher)
+            except (OSError, EOFError, HTTPException) as err:
+                logger.warning(f"下载异常: {err}")
+                # 4xx错误(416续传位置无效除外)重试无意义,直接抛出
+                if isinstance(err, HTTPError) and err.code < 500 and err.code != 416:
+                    raise
+                if retry_index == DOWNLOAD_RETRY_TIMES:
+                    raise
+                continue
+            break
+
+        digest = hasher.hexdigest()
+        if checksum and digest != checksum.lower():
+            logger.error(f"文件校验失败, 期望sha256: {checksum}, 实际: {digest}")
+            os.remove(part_path)
+            return None
+        os.replace(part_path, filepath)
+        self.last_checksum = digest
+        return filepath
+
+    def copy_file(self, src_path, filepath, checksum=None):
+        """
+        从本地(离线镜像)复制文件:写入临时文件并计算sha256,校验通过后原子重命名为filepath
+        :param src_path: 源文件路径
+        :param filepath: 复制后的文件路径
+        :param checksum: 期望的文件sha256值,不为空时校验文件内容
+        :return: 复制成功,返回filepath(文件sha256记录在self.last_checksum);否则返回None
+        """
+        self.last_checksum = None
+        part_path = filepath + ".part"
+        hasher = hashlib.sha256()
+        with open(src_path, "rb") as rf, open(part_path, "wb") as wf:
+            for chunk in iter(lambda: rf.read(DOWNLOAD_CHUNK_SIZE), b""):
+                wf.write(chunk)
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        if checksum and digest != checksum.lower():
+            logger.error(f"文件校验失败, 期望sha256: {checksum}, 实际: {digest}")
+            os.remove(part_path)
+            return None
+        os.replace(part_path, filepath)
+        self.last_checksum = digest
+        return filepath
+
+    def download_file_segmented(self, file_url, filepath, concurrency, checksum=None):
+        """
+        分段并发下载文件:按字节范围切分,多线程写入预分配的临时文件(filepath.part),完成后原子重命名为filepath
+        每完成一个分段写入进度文件,下载中断时保留临时文件及进度文件,再次下载同一文件时只下载未完成的分段;
+        按顺序完成的分段在下载过程中即计算摘要,下载完成后无需重新读取整个文件
+        服务端不支持Range请求时,回退为单连接流式下载(download_file)
+        :param file_url: 需要下载的文件的url
+        :param filepath: 下载后的文件路径
+        :param concurrency: 并发下载的线程数
+        :param checksum: 期望的文件sha256值,不为空时校验下载内容
+        :return: 下载成功,返回filepath(文件sha256记录在self.last_checksum);否则返回None
+        """
+        self.last_checksum = None
+        part_path = filepath + ".part"
+        progress_path = part_path + SegmentProgress.SUFFIX
+        real_url, total_size, validator = self.__probe_range_support(file_url)
+        if not total_size:
+            logger.info("服务端不支持Range请求,使用单连接下载")
+            if os.path.exists(progress_path):  # 分段下载的临时文件不是连续的已下载内容,不能用于单连接续传
+                self.__remove_files(part_path, progress_path)
+            return self.download_file(file_url, filepath, checksum=checksum)
+
+        progress = SegmentProgress.load(progress_path, part_path, file_url, total_size, validator)
+        if progress:
+            logger.info(f"分段下载断点续传, 已完成分段数: {len(progress.segments) - len(progress.pending)}"
+                        f"/{len(progress.segments)}")
+        else:
+            segment_size = max(DOWNLOAD_MIN_SEGMENT_SIZE, -(-total_size // concurrency))
+            progress = SegmentProgress.create(progress_path, part_path, file_url, total_size, validator,
+                                              segment_size)
+        pending = progress.pending
+        logger.info(f"分段下载: 文件大小 {total_size} bytes, 分段数 {len(progress.segments)}, "
+                    f"待下载分段数 {len(pending)}, 并发数 {concurrency}")
+
+        start_time = time.time()
+        if pending:
+            try:
+                with ThreadPoolExecutor(max_workers=min(concurrency, len(pending))) as executor:
+                    futures = [executor.submit(self.__download_segment, real_url, part_path, progress, index,
+                                               seg_start, seg_end)
+                               for index, (seg_start, seg_end) in pending]
+                    for future in futures:
+                        future.result()
+            except Exception:
+                logger.warning(f"分段下载中断, 已保留临时文件及下载进度, 再次下载时继续: {part_path}")
+                raise
+        use_time = time.time() - start_time
+        download_size = sum(seg_end + 1 - seg_start for _, (seg_start, seg_end) in pending)
+        logger.info("分段下载完成, 耗时: %.2fs, 平均速度: %.2fMB/s" % (
+            use_time, download_size / 1048576 / max(use_time, 1e-6)))
+
+        digest = progress.hexdigest()
+        if checksum and digest != checksum.lower():
+            logger.error(f"文件校验失败, 期望sha256: {checksum}, 实际: {digest}")
+            self.__remove_files(part_path, progress_path)
+            return None
+        os.replace(part_path, filepath)
+        self.__remove_files(progress_path)
+        self.last_checksum = digest
         return filepath
+
+    @staticmethod
+    def __remove_files(*file_paths):
+        for file_path in file_paths:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def __probe_range_support(self, file_url):
+        """
+        请求首字节,判断服务端是否支持Range请求
+        :param file_url: 下载url
+        :return: (重定向后的url, 文件大小, 文件版本标识(ETag或Last-Modified));不支持Range时文件大小为None
+        """
+        headers = dict(self._headers)
+        headers["Range"] = "bytes=0-0"
+        with self._http_client.open(file_url, headers=headers, method="GET") as resp:
+            content_range = resp.getheader("Content-Range", "")
+            accept_ranges = resp.getheader("Accept-Ranges", "")
+            validator = resp.getheader("ETag") or resp.getheader("Last-Modified")
+            real_url = resp.geturl()
+        if resp.status != 206 or "/" not in content_range or accept_ranges.lower() == "none":
+            return real_url, None, None
+        total_size = content_range.rsplit("/", 1)[-1]
+        if not total_size.isdigit():
+            return real_url, None, None
+        return real_url, int(total_size), validator
+
+    def __download_segment(self, file_url, part_path, progress, index, seg_start, seg_end):
+        """
+        下载单个字节范围,写入临时文件的对应位置;连接中断时从已写入位置继续;完成后记录到下载进度
+        :param file_url: 下载url
+        :param part_path: 临时文件路径
+        :param progress: 下载进度(SegmentProgress)
+        :param index: 分段序号
+        :param seg_start: 起始字节位置
+        :param seg_end: 结束字节位置(包含)
+        :return:
+        """
+        start_time = time.time()
+        offset = seg_start
+        for retry_index in range(DOWNLOAD_RETRY_TIMES + 1):
+            headers = dict(self._headers)
+            headers["Range"] = f"bytes={offset}-{seg_end}"
+            try:
+                with self._http_client.open(file_url, headers=headers, method="GET") as resp, \
+                        open(part_path, "r+b") as wf:
+                    if resp.status != 206:
+                        raise EOFError(f"分段[{index}]请求未返回206: {resp.status}")
+                    wf.seek(offset)
+                    for chunk in iter(lambda: resp.read(min(DOWNLOAD_CHUNK_SIZE, seg_end + 1 - offset)), b""):
+                        wf.write(chunk)
+                        offset += len(chunk)
+                        if offset > seg_end:
+                            break
+                if offset > seg_end:
+                    break
+                raise EOFError(f"分段[{index}]下载不完整: {offset - seg_start}/{seg_end + 1 - seg_start} bytes")
+            except (OSError, EOFError, HTTPException) as err:
+                if retry_index == DOWNLOAD_RETRY_TIMES:
+                    raise
+                logger.warning(f"分段[{index}]下载异常,第{retry_index + 1}次重试: {err}")
+                time.sleep(retry_index + 1)
+
+        progress.mark_done(index)
+        use_time = time.time() - start_time
+        seg_size = seg_end + 1 - seg_start
+        logger.info("分段[%d] bytes=%d-%d, 耗时: %.2fs, 速度: %.2fMB/s" % (
+            index, seg_start, seg_end, use_time, seg_size / 1048576 / max(use_time, 1e-6)))
+
+    def __stream_to_file(self, file_url, part_path, hasher):
+        """
+        将url内容分块写入临时文件,已存在的临时文件作为断点续传起点
+        :param file_url: 下载url
+        :param part_path: 临时文件路径
+        :param hasher: 摘要对象
+        :return:
+        """
+        headers = dict(self._headers)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        try:
+            resp = self._http_client.open(file_url, headers=headers, method="GET")
+        except HTTPError as err:
+            if err.code == 416 and offset:  # 续传位置无效,删除临时文件,下次重新下载
+                os.remove(part_path)
+            raise
+
+        with resp:
+            if offset and resp.status == 206:
+                logger.info(f"断点续传, 已下载: {offset} bytes")
+                mode = "ab"
+                with open(part_path, "rb") as rf:
+                    for chunk in iter(lambda: rf.read(DOWNLOAD_CHUNK_SIZE), b""):
+                        hasher.update(chunk)
+            else:  # 服务端不支持Range,从头下载
+                mode = "wb"
+                offset = 0
+            content_length = resp.getheader("Content-Length")
+            expected_size = offset + int(content_length) if content_length else None
+
+            with open(part_path, mode) as wf:
+                for chunk in iter(lambda: resp.read(DOWNLOAD_CHUNK_SIZE), b""):
+                    wf.write(chunk)
+                    hasher.update(chunk)
+
+        if expected_size is not None and os.path.getsize(part_path) != expected_size:
+            raise EOFError(f"下载不完整: {os.path.getsize(part_path)}/{expected_size} bytes")
+
+
+class SegmentProgress(object):
+    """
+    分段下载进度: 记录已完成的分段(每完成一个分段写入进度文件),并按顺序计算已完成分段的sha256
+    进度文件内容: {"url", "total_size", "segment_size", "validator"(ETag或Last-Modified), "done"(已完成的分段序号)}
+    """
+    SUFFIX = ".progress.json"
+
+    def __init__(self, progress_path, part_path, record):
+        """
+        :param progress_path: 进度文件路径
+        :param part_path: 临时文件路径
+        :param record: 进度记录
+        """
+        self._progress_path = progress_path
+        self._part_path = part_path
+        self._record = record
+        total_size, segment_size = record["total_size"], record["segment_size"]
+        self.segments = [(start, min(start + segment_size, total_size) - 1)
+                         for start in range(0, total_size, segment_size)]
+        self._done = set(index for index in record["done"] if 0 <= index < len(self.segments))
+        self._hasher = hashlib.sha256()
+        self._hashed_count = 0  # 已计算摘要的分段数(从第一个分段开始连续)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, progress_path, part_path, url, total_size, validator, segment_size):
+        """
+        开始新的下载: 预分配临时文件,写入进度文件
+        """
+        with open(part_path, "wb") as wf:
+            wf.truncate(total_size)
+        progress = cls(progress_path, part_path, {
+            "url": url,
+            "total_size": total_size,
+            "segment_size": segment_size,
+            "validator": validator,
+            "done": [],
+        })
+        progress.__save()
+        return progress
+
+    @classmethod
+    def load(cls, progress_path, part_path, url, total_size, validator):
+        """
+        读取上次中断的下载进度
+        :return: 进度;没有进度文件,或与本次下载的文件(url、大小、版本标识)不一致、临时文件不完整时返回None
+        """
+        try:
+            with open(progress_path, "r") as rf:
+                record = json.load(rf)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(record, dict) or record.get("url") != url or record.get("total_size") != total_size \
+                or record.get("validator") != validator:
+            logger.info("下载的文件已变化,重新下载")
+            return None
+        if not isinstance(record.get("segment_size"), int) or record["segment_size"] <= 0 \
+                or not isinstance(record.get("done"), list):
+            return None
+        if not os.path.isfile(part_path) or os.path.getsize(part_path) != total_size:
+            return None
+        progress = cls(progress_path, part_path, record)
+        with progress._lock:
+            progress.__update_hash()
+        return progress
+
+    @property
+    def pending(self):
+        """
+        :return: 未完成的分段列表: [(分段序号, (起始字节位置, 结束字节位置)), ...]
+        """
+        with self._lock:
+            return [(index, segment) for index, segment in enumerate(self.segments) if index not in self._done]
+
+    def mark_done(self, index):
+        """
+        记录已完成的分段,并计算按顺序已完成的分段的摘要
+        """
+        with self._lock:
+            self._done.add(index)
+            self.__save()
+            self.__update_hash()
+
+    def hexdigest(self):
+        """
+        :return: 整个文件的sha256(所有分段均已完成)
+        """
+        with self._lock:
+            if self._hashed_count != len(self.segments):
+                raise Exception("分段下载未完成,无法计算摘要")
+            return self._hasher.hexdigest()
+
+    def __save(self):
+        self._record["done"] = sorted(self._done)
+        tmp_path = f"{self._progress_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump(self._record, wf)
+        os.replace(tmp_path, self._progress_path)
+
+    def __update_hash(self):
+        """
+        读取从第一个分段开始连续已完成的分段计算摘要(刚写入的分段通常仍在页缓存中)
+        """
+        if self._hashed_count not in self._done:
+            return
+        with open(self._part_path, "rb") as rf:
+            while self._hashed_count < len(self.segments) and self._hashed_count in self._done:
+                seg_start, seg_end = self.segments[self._hashed_count]
+                rf.seek(seg_start)
+                remaining = seg_end + 1 - seg_start
+                while remaining > 0:
+                    chunk = rf.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise EOFError(f"临时文件不完整: {self._part_path}")
+                    self._hasher.update(chunk)
+                    remaining -= len(chunk)
+                self._hashed_count += 1
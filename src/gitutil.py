@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+git命令封装,获取增量扫描的变更文件列表
+"""
+
+import os
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+
+class GitUtil(object):
+    @staticmethod
+    def get_changed_files(source_dir, diff_base, merge_base=True):
+        """
+        获取当前HEAD相对对比版本新增、修改、复制、重命名(取新路径)的文件,不包含删除的文件和子模块
+        使用-z输出以NUL分隔的原始路径,不受core.quotepath转义影响
+        :param source_dir: 代码目录,返回的路径相对该目录,且只包含该目录下的文件
+        :param diff_base: 对比版本(分支、tag或commit)
+        :param merge_base: True-与对比版本和HEAD的公共祖先对比(base...HEAD);False-直接与对比版本对比
+        :return: 文件相对路径列表
+        """
+        cmd_args = ["git", "diff", "--name-only", "-z", "--relative", "--find-renames",
+                    "--diff-filter=ACMR", "--ignore-submodules", "--no-ext-diff"]
+        if merge_base:
+            cmd_args.append(f"{diff_base}...HEAD")
+        else:
+            cmd_args.extend([diff_base, "HEAD"])
+        cmd_args.append("--")
+        logger.info("run cmd: %s", " ".join(cmd_args))
+        sp = subprocess.run(cmd_args, cwd=source_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if sp.returncode != 0:
+            raise Exception(f"获取变更文件失败: {os.fsdecode(sp.stderr).strip()}")
+        return [os.fsdecode(path) for path in sp.stdout.split(b"\0") if path]
@@ -8,22 +8,120 @@
 """ http request
 """
 
-import sys
-import json
 import ssl
+import json
+import time
+import zlib
+import base64
+import random
 import logging
+import threading
+import http.client
 
-from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from urllib.parse import urlsplit, urljoin, unquote
+from urllib.request import getproxies, proxy_bypass
+
+from setting import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRY_TIMES, HTTP_BACKOFF_BASE, \
+    HTTP_BACKOFF_MAX, HTTP_POOL_MAXSIZE, HTTP_MAX_REDIRECTS
 
 
 logger = logging.getLogger(__name__)
 
 
-class HttpClient(object):
-    @staticmethod
-    def request(url, headers, param=None, body=None, method="POST"):
+class HttpResponse(object):
+    """
+    http响应,接口与urlopen返回的响应兼容(status/getheader/geturl/read/上下文管理器)
+    响应内容为gzip压缩时透明解压;内容读取完毕后连接归还连接池,未读完即关闭时断开连接
+    """
+    def __init__(self, client, pool_key, conn, resp, url):
+        self._client = client
+        self._pool_key = pool_key
+        self._conn = conn
+        self._resp = resp
+        self._url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+        self._decoder = None
+        self._buffer = bytearray()
+        if (resp.getheader("Content-Encoding") or "").lower() == "gzip":
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def getheader(self, name, default=None):
+        # 解压后的内容长度与Content-Length不一致,不返回压缩相关的头部
+        if self._decoder and name.lower() in ("content-length", "content-encoding"):
+            return default
+        return self._resp.getheader(name, default)
+
+    def geturl(self):
+        return self._url
+
+    def read(self, amt=None):
         """
+        :param amt: 读取的最大字节数,为空时读取全部内容
+        """
+        if self._conn is None:
+            return b""
+        if self._decoder is None:
+            data = self._resp.read() if amt is None else self._resp.read(amt)
+            if amt is None or not data or self._resp.isclosed():
+                self.__release()
+            return data
+        while amt is None or len(self._buffer) < amt:
+            raw = self._resp.read(amt or 65536)
+            if not raw:
+                self._buffer += self._decoder.flush()
+                self.__release()
+                break
+            self._buffer += self._decoder.decompress(raw)
+        size = len(self._buffer) if amt is None else amt
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        """
+        未读完的响应无法复用连接,直接断开
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __release(self):
+        if self._conn is not None:
+            self._client.release_conn(self._pool_key, self._conn, self._resp.will_close)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
+
+class HttpClient(object):
+    """
+    http会话: 按host(及代理)复用长连接,支持连接/读取超时、幂等请求失败时按指数退避(带随机抖动)重试、
+    gzip压缩传输、重定向及系统代理(http_proxy/https_proxy/no_proxy)
+    线程安全,多个线程可共用同一个会话(每个连接同一时间只被一个请求使用)
+    """
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+    RETRY_STATUS = (429, 502, 503, 504)
+    REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 retry_times=HTTP_RETRY_TIMES):
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._retry_times = retry_times
+        self._ssl_context = ssl._create_unverified_context()
+        self._lock = threading.Lock()
+        self._pool = {}
+
+    def request(self, url, headers, param=None, body=None, method="POST"):
+        """
+        发送请求,返回全部响应内容
         :param url:
         :param headers:
         :param param:
@@ -31,14 +129,179 @@ class HttpClient(object):
         :param method:
         :return:
         """
+        with self.open(url, headers, param=param, body=body, method=method) as resp:
+            return resp.read()
+
+    def open(self, url, headers, param=None, body=None, method="GET"):
+        """
+        发送请求,返回未读取的响应对象,供调用方分块读取响应内容
+        :param url:
+        :param headers:
+        :param param:
+        :param body:
+        :param method:
+        :return: 响应对象(HttpResponse)
+        :raise HTTPError: 响应状态码>=400
+        """
         if param:
             url += "?" + param
         if body:
-            body = json.dumps(body)
-            if sys.version_info.major == 3:
-                body = body.encode("utf-8")
-        req = Request(url=url, data=body, headers=headers)
-        req.get_method = lambda: method.upper()
-        context = ssl._create_unverified_context()
-        result = urlopen(req, context=context).read()
-        return result
+            body = json.dumps(body).encode("utf-8")
+        headers = dict(headers or {})
+        if not any(key.lower() == "accept-encoding" for key in headers):
+            headers["Accept-Encoding"] = "gzip"
+        method = method.upper()
+
+        for _ in range(HTTP_MAX_REDIRECTS + 1):
+            resp = self.__request_with_retry(url, headers, body, method)
+            location = resp.getheader("Location")
+            if resp.status not in self.REDIRECT_STATUS or not location:
+                break
+            resp.read()  # 读取重定向响应内容,以便复用连接
+            url = urljoin(url, location)
+            if resp.status == 303 or (resp.status in (301, 302) and method == "POST"):
+                method, body = "GET", None
+        else:
+            raise HTTPError(url, resp.status, "重定向次数过多", resp.headers, None)
+
+        if resp.status >= 400:
+            resp.close()
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        return resp
+
+    def release_conn(self, pool_key, conn, will_close):
+        """
+        将连接归还连接池
+        """
+        if will_close:
+            conn.close()
+            return
+        with self._lock:
+            idle_conns = self._pool.setdefault(pool_key, [])
+            if len(idle_conns) < HTTP_POOL_MAXSIZE:
+                idle_conns.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """
+        关闭连接池中的所有连接
+        """
+        with self._lock:
+            pool, self._pool = self._pool, {}
+        for idle_conns in pool.values():
+            for conn in idle_conns:
+                conn.close()
+
+    def __request_with_retry(self, url, headers, body, method):
+        """
+        发送请求并获取响应头;幂等请求在连接异常或服务端暂时不可用(429/502/503/504)时重试
+        复用的空闲连接可能已被服务端关闭,此时(任意请求方法)使用新连接立即重试一次
+        建立连接失败(连接被拒绝、超时、DNS解析失败、TLS握手失败等)与请求异常同样退避重试
+        """
+        attempt = 0
+        while True:
+            pool_key, conn = self.__get_idle_conn(url)
+            reused = conn is not None
+            try:
+                if conn is None:
+                    conn = self.__new_conn(*pool_key)
+                if pool_key[3] and pool_key[0] == "http":
+                    headers = dict(headers, **self.__get_proxy_headers(pool_key[3]))
+                conn.request(method, self.__get_request_target(url, pool_key), body=body, headers=headers)
+                resp = conn.getresponse()
+            except (OSError, http.client.HTTPException) as err:
+                if conn is not None:
+                    conn.close()
+                if reused and isinstance(err, (http.client.RemoteDisconnected, ConnectionResetError,
+                                               BrokenPipeError)):
+                    continue
+                if method not in self.IDEMPOTENT_METHODS or attempt >= self._retry_times:
+                    raise
+                logger.warning(f"请求异常: {err}, {url}")
+            else:
+                response = HttpResponse(self, pool_key, conn, resp, url)
+                if resp.status not in self.RETRY_STATUS or method not in self.IDEMPOTENT_METHODS \
+                        or attempt >= self._retry_times:
+                    return response
+                response.close()
+                logger.warning(f"服务端暂时不可用: {resp.status}, {url}")
+            attempt += 1
+            # 指数退避,随机抖动避免并发请求同时重试
+            delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+            logger.info("第%d次重试, 等待%.2fs" % (attempt, delay))
+            time.sleep(delay)
+
+    def __get_idle_conn(self, url):
+        """
+        从连接池获取空闲连接
+        :return: (连接池key, 连接);没有空闲连接时连接为None
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise ValueError(f"不支持的url: {url}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        proxy = self.__get_proxy(scheme, parts.hostname)
+        pool_key = (scheme, parts.hostname, port, proxy)
+        with self._lock:
+            idle_conns = self._pool.get(pool_key)
+            if idle_conns:
+                return pool_key, idle_conns.pop()
+        return pool_key, None
+
+    def __new_conn(self, scheme, host, port, proxy):
+        """
+        新建连接: 建立连接时使用连接超时,之后读写使用读取超时;https经代理时通过CONNECT建立隧道
+        """
+        conn_host, conn_port = host, port
+        if proxy:
+            proxy_parts = urlsplit(proxy)
+            conn_host, conn_port = proxy_parts.hostname, proxy_parts.port or 80
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(conn_host, conn_port, timeout=self._connect_timeout,
+                                               context=self._ssl_context)
+            if proxy:
+                conn.set_tunnel(host, port, headers=self.__get_proxy_headers(proxy))
+        else:
+            conn = http.client.HTTPConnection(conn_host, conn_port, timeout=self._connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self._read_timeout)
+        return conn
+
+    @staticmethod
+    def __get_proxy(scheme, host):
+        """
+        获取系统代理配置(环境变量),no_proxy中的host不使用代理
+        """
+        proxy = getproxies().get(scheme)
+        if not proxy or proxy_bypass(host):
+            return None
+        if "://" not in proxy:
+            proxy = "http://" + proxy
+        return proxy
+
+    @staticmethod
+    def __get_proxy_headers(proxy):
+        """
+        代理url中包含用户名密码时,生成代理认证头部
+        """
+        proxy_parts = urlsplit(proxy)
+        if not proxy_parts.username:
+            return {}
+        credentials = f"{unquote(proxy_parts.username)}:{unquote(proxy_parts.password or '')}"
+        return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials.encode()).decode()}
+
+    @staticmethod
+    def __get_request_target(url, pool_key):
+        """
+        http经代理时请求行使用完整url,否则使用路径
+        """
+        scheme, _, _, proxy = pool_key
+        if proxy and scheme == "http":
+            return url
+        parts = urlsplit(url)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        return target
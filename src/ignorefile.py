@@ -0,0 +1,220 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+按.gitignore语法解析忽略文件(各级目录下的.gitignore及代码根目录下的.tcaignore),判断路径是否被忽略
+"""
+
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IgnoreRule(object):
+    """
+    忽略文件中的一条规则
+    """
+    def __init__(self, base_dir, regex, negate, dir_only):
+        """
+        :param base_dir: 忽略文件所在目录(相对代码根目录,根目录为空字符串)
+        :param regex: 匹配相对base_dir路径的正则表达式
+        :param negate: 是否为!开头的反向规则(重新包含)
+        :param dir_only: 是否为/结尾的规则(只匹配目录)
+        """
+        self.base_dir = base_dir
+        self.regex = regex
+        self.negate = negate
+        self.dir_only = dir_only
+
+    def match(self, rel_path, is_dir):
+        if self.dir_only and not is_dir:
+            return False
+        if self.base_dir:
+            if not rel_path.startswith(self.base_dir + "/"):
+                return False
+            rel_path = rel_path[len(self.base_dir) + 1:]
+        return self.regex.fullmatch(rel_path) is not None
+
+
+class IgnoreRuleParser(object):
+    @staticmethod
+    def parse_file(file_path, base_dir):
+        """
+        解析忽略文件
+        :param file_path: 忽略文件路径
+        :param base_dir: 忽略文件所在目录(相对代码根目录)
+        :return: IgnoreRule列表
+        """
+        rules = []
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="replace") as rf:
+                lines = rf.readlines()
+        except OSError as err:
+            logger.warning(f"读取忽略文件失败: {file_path}, {err}")
+            return rules
+        for line in lines:
+            rule = IgnoreRuleParser.parse_line(line, base_dir)
+            if rule:
+                rules.append(rule)
+        return rules
+
+    @staticmethod
+    def parse_line(line, base_dir):
+        """
+        解析一行规则,空行和注释返回None
+        """
+        line = line.rstrip("\r\n")
+        while line.endswith(" ") and not line.endswith("\\ "):
+            line = line[:-1]
+        if not line or line.startswith("#"):
+            return None
+        negate = False
+        if line.startswith("!"):
+            negate = True
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = False
+        if line.endswith("/"):
+            dir_only = True
+            line = line.rstrip("/")
+        if not line:
+            return None
+        # 包含/(不计结尾的/)的规则相对忽略文件所在目录匹配,否则匹配任意层级的文件名
+        anchored = "/" in line
+        line = line.lstrip("/")
+        regex_exp = IgnoreRuleParser.translate(line)
+        if not anchored:
+            regex_exp = "(?:.*/)?" + regex_exp
+        try:
+            regex = re.compile(regex_exp, re.DOTALL)
+        except re.error:
+            logger.warning(f"忽略规则格式有误,跳过: {line}")
+            return None
+        return IgnoreRule(base_dir, regex, negate, dir_only)
+
+    @staticmethod
+    def translate(pattern):
+        """
+        将通配符规则转换为正则表达式: * 和 ? 不匹配/, ** 匹配任意层级目录
+        """
+        result = []
+        index = 0
+        length = len(pattern)
+        while index < length:
+            char = pattern[index]
+            if char == "*":
+                if pattern[index:index + 2] == "**" and (index == 0 or pattern[index - 1] == "/") \
+                        and (index + 2 == length or pattern[index + 2] == "/"):
+                    if index + 2 == length:  # 结尾的 /** 匹配目录下的所有内容
+                        result.append(".*")
+                        index += 2
+                    else:  # **/ 匹配0个或多个目录
+                        result.append("(?:.*/)?")
+                        index += 3
+                    continue
+                while index < length and pattern[index] == "*":
+                    index += 1
+                result.append("[^/]*")
+                continue
+            if char == "?":
+                result.append("[^/]")
+            elif char == "[":
+                end = pattern.find("]", index + 2 if pattern[index + 1:index + 2] in ("!", "^") else index + 1)
+                if end == -1:
+                    result.append(re.escape(char))
+                else:
+                    content = pattern[index + 1:end]
+                    if content[:1] in ("!", "^"):
+                        content = "^" + content[1:]
+                    content = content.replace("\\", "\\\\").replace("[", "\\[")
+                    result.append("(?!/)[%s]" % content)
+                    index = end
+            elif char == "\\" and index + 1 < length:
+                index += 1
+                result.append(re.escape(pattern[index]))
+            else:
+                result.append(re.escape(char))
+            index += 1
+        return "".join(result)
+
+
+class IgnoreFileMatcher(object):
+    """
+    忽略文件匹配器,按目录懒加载各级.gitignore,解析结果按目录缓存
+    规则优先级: 下级目录的.gitignore高于上级目录,代码根目录的.tcaignore最高;同一文件中后面的规则优先
+    与git一致,目录被忽略时,其下的文件无法被重新包含
+    """
+    GITIGNORE_NAME = ".gitignore"
+    TCAIGNORE_NAME = ".tcaignore"
+
+    def __init__(self, root_dir):
+        """
+        :param root_dir: 代码根目录
+        """
+        self._root_dir = root_dir
+        self.__dir_rules = {}
+        self.__dir_ignored = {}
+        tcaignore_path = os.path.join(root_dir, self.TCAIGNORE_NAME)
+        self.__tca_rules = IgnoreRuleParser.parse_file(tcaignore_path, "") if os.path.isfile(tcaignore_path) else []
+
+    def __get_dir_rules(self, rel_dir):
+        """
+        获取作用于目录下路径的.gitignore规则(包含上级目录的规则),按目录缓存;
+        目录下没有.gitignore时复用上级目录的规则列表
+        """
+        rules = self.__dir_rules.get(rel_dir)
+        if rules is not None:
+            return rules
+        parent_rules = self.__get_dir_rules(os.path.dirname(rel_dir)) if rel_dir else []
+        gitignore_path = os.path.join(self._root_dir, rel_dir, self.GITIGNORE_NAME)
+        if os.path.isfile(gitignore_path):
+            rules = parent_rules + IgnoreRuleParser.parse_file(gitignore_path, rel_dir)
+        else:
+            rules = parent_rules
+        self.__dir_rules[rel_dir] = rules
+        return rules
+
+    def match(self, rel_path, is_dir=False):
+        """
+        判断路径本身是否匹配忽略规则(不判断上级目录),用于遍历时上级目录已判断过的场景
+        :param rel_path: 以/分隔的相对路径
+        :param is_dir: 是否为目录
+        :return: bool
+        """
+        if is_dir and os.path.basename(rel_path) == ".git":
+            return True
+        ignored = False
+        for rule in self.__get_dir_rules(os.path.dirname(rel_path)):
+            if rule.match(rel_path, is_dir):
+                ignored = not rule.negate
+        for rule in self.__tca_rules:
+            if rule.match(rel_path, is_dir):
+                ignored = not rule.negate
+        return ignored
+
+    def is_ignored(self, rel_path):
+        """
+        判断文件是否被忽略(包含上级目录被忽略的情况)
+        :param rel_path: 文件相对路径
+        :return: bool
+        """
+        rel_path = rel_path.replace(os.sep, "/")
+        parent_dir = os.path.dirname(rel_path)
+        if parent_dir and self.__is_dir_ignored(parent_dir):
+            return True
+        return self.match(rel_path, is_dir=False)
+
+    def __is_dir_ignored(self, rel_dir):
+        ignored = self.__dir_ignored.get(rel_dir)
+        if ignored is None:
+            parent_dir = os.path.dirname(rel_dir)
+            ignored = (parent_dir and self.__is_dir_ignored(parent_dir)) or self.match(rel_dir, is_dir=True)
+            self.__dir_ignored[rel_dir] = ignored
+        return ignored
@@ -0,0 +1,140 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+安装包镜像选择: 并发探测各镜像的首字节耗时(TTFB),按耗时排序,并校验各镜像发布的安装包摘要一致
+"""
+
+import os
+import time
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import url2pathname, pathname2url
+
+from httpclient import HttpClient
+from setting import MIRROR_PROBE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class MirrorSelector(object):
+    """
+    镜像的安装包摘要来自同名的.sha256文件(sha256sum输出格式,如: <sha256>  <文件名>),没有时不参与一致性校验;
+    期望摘要优先使用配置的sha256,否则使用优先级最高的镜像发布的摘要,摘要不一致的镜像不会被使用
+    """
+    SIDECAR_SUFFIX = ".sha256"
+
+    def __init__(self, mirrors, probe_timeout=MIRROR_PROBE_TIMEOUT):
+        """
+        :param mirrors: 镜像列表(按优先级排列)
+        :param probe_timeout: 探测超时时间(秒)
+        """
+        self._mirrors = mirrors
+        # 探测不重试,超时或失败的镜像直接跳过
+        self._http_client = HttpClient(connect_timeout=probe_timeout, read_timeout=probe_timeout, retry_times=0)
+
+    @staticmethod
+    def get_file_url(mirror, file_name):
+        """
+        获取镜像上的安装包url: 以/结尾的镜像为目录,拼接安装包文件名;本地路径转换为file://url
+        """
+        if "://" not in mirror:
+            mirror = "file://" + pathname2url(os.path.abspath(mirror)) + ("/" if mirror.endswith("/") else "")
+        return mirror + file_name if mirror.endswith("/") else mirror
+
+    @staticmethod
+    def is_local(url):
+        return urlsplit(url).scheme == "file"
+
+    @staticmethod
+    def get_local_path(url):
+        return url2pathname(urlsplit(url).path)
+
+    def select(self, file_name, checksum=None):
+        """
+        :param file_name: 安装包文件名
+        :param checksum: 配置的安装包sha256
+        :return: (按TTFB排序的可用url列表, 期望的安装包sha256);sha256未知时为None
+        """
+        urls = []
+        for mirror in self._mirrors:
+            url = self.get_file_url(mirror, file_name)
+            if url not in urls:
+                urls.append(url)
+        checksum = checksum.lower() if checksum else None
+        if len(urls) == 1:  # 只有一个镜像时无需探测
+            return urls, checksum
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            results = list(executor.map(self.__probe, urls))
+        logger.info("镜像探测耗时: %.2fs" % (time.time() - start_time))
+
+        candidates = []
+        for index, (url, (ttfb, digest)) in enumerate(zip(urls, results)):
+            if ttfb is None:
+                continue
+            if digest and not checksum:
+                checksum = digest
+            candidates.append((ttfb, index, url, digest))
+        available = []
+        for ttfb, _, url, digest in sorted(candidates):
+            if digest and digest != checksum:
+                logger.error(f"镜像安装包摘要不一致, 已跳过: {url}, 期望sha256: {checksum}, 镜像sha256: {digest}")
+                continue
+            logger.info("镜像: %s, TTFB: %.3fs" % (url, ttfb))
+            available.append(url)
+        if not checksum:
+            logger.warning("各镜像均未发布安装包摘要(.sha256),无法校验镜像间的一致性")
+        return available, checksum
+
+    def __probe(self, url):
+        """
+        探测镜像: 请求首字节计算TTFB,并读取安装包摘要
+        :return: (TTFB, sha256);镜像不可用时TTFB为None
+        """
+        start_time = time.perf_counter()
+        try:
+            if self.is_local(url):
+                with open(self.get_local_path(url), "rb") as rf:
+                    rf.read(1)
+            else:
+                with self._http_client.open(url, headers={"Range": "bytes=0-0", "Accept-Encoding": "identity"}) as resp:
+                    resp.read(1)
+            ttfb = time.perf_counter() - start_time
+        except (OSError, HTTPException) as err:
+            logger.warning(f"镜像不可用: {url}, {err}")
+            return None, None
+        return ttfb, self.__read_sidecar(url)
+
+    def __read_sidecar(self, url):
+        """
+        读取安装包摘要文件
+        :return: sha256;没有摘要文件时返回None
+        """
+        sidecar_url = url + self.SIDECAR_SUFFIX
+        try:
+            if self.is_local(sidecar_url):
+                with open(self.get_local_path(sidecar_url), "rb") as rf:
+                    content = rf.read(1024)
+            else:
+                content = self._http_client.request(sidecar_url, headers={}, method="GET")
+        except FileNotFoundError:
+            return None
+        except HTTPError as err:
+            if err.code != 404:
+                logger.warning(f"读取安装包摘要失败: {sidecar_url}, {err}")
+            return None
+        except (OSError, HTTPException) as err:
+            logger.warning(f"读取安装包摘要失败: {sidecar_url}, {err}")
+            return None
+        fields = content.decode("utf-8", errors="replace").split()
+        return fields[0].lower() if fields else None
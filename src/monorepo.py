@@ -0,0 +1,292 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+多项目模式: 按项目清单文件将仓库划分为多个子项目,共用同一客户端及一次目录遍历,并发扫描各项目并汇总结果
+"""
+
+import os
+import re
+import sys
+import json
+import logging
+
+from pathfilter import StringMgr, PathUtil
+from procsupervisor import ProcessCommand, ProcessSupervisor
+from quickreport import QuickReportReader
+from setting import PROJECTS_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class MonorepoRunner(object):
+    """
+    项目清单文件格式(json):
+    {
+        "projects": [
+            {"name": "team-a", "source_dir": "services/a", "label": "safety", "ignore_paths": ".*/test/.*",
+             "total_error": 0},
+            ...
+        ]
+    }
+    source_dir为相对工作空间的项目目录;其他字段为该项目的参数(同INPUT_XXX环境变量,不含INPUT_前缀),覆盖全局参数
+    每个项目在独立的子进程中执行scan命令,输出位于<工作空间>/.tca_projects/<项目名>/:
+        scan_files.txt              # 统一遍历后分配给该项目的文件列表(相对项目目录)
+        tca_quick_scan_report.json  # 快速扫描结果
+        codedog_report.json         # 完整扫描模式的结果
+        trace.jsonl                 # 阶段统计
+    """
+    SCAN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "codedog_scan.py")
+    # 由多项目模式统一设置的参数,项目清单中不可覆盖
+    OUTPUT_PARAMS = {
+        "report_file": "tca_quick_scan_report.json",
+        "status_file": "codedog_report.json",
+        "trace_file": "trace.jsonl",
+    }
+
+    def __init__(self, workspace, projects_file, default_label):
+        """
+        :param workspace: 工作空间目录
+        :param projects_file: 项目清单文件路径
+        :param default_label: 项目未指定规则标签时使用的规则标签
+        """
+        self._workspace = workspace
+        self._projects_file = projects_file
+        self._default_label = default_label
+        self._output_dir = os.path.join(workspace, PROJECTS_OUTPUT_DIR)
+        self.projects = []
+
+    def load_projects(self):
+        """
+        读取项目清单文件
+        :return: 项目列表,每个项目为{"name", "source_dir"(绝对路径), "output_dir", "params"}
+        """
+        if not os.path.isfile(self._projects_file):
+            raise Exception(f"项目清单文件不存在: {self._projects_file}")
+        with open(self._projects_file, "r", encoding="utf-8") as rf:
+            items = json.load(rf).get("projects") or []
+        if not items:
+            raise Exception(f"项目清单文件中没有项目: {self._projects_file}")
+
+        names = set()
+        for item in items:
+            params = {key.lower(): value for key, value in item.items()}
+            rel_dir = os.path.normpath(params.pop("source_dir", ".") or ".")
+            name = str(params.pop("name", "") or rel_dir)
+            if name in names:
+                raise Exception(f"项目清单中存在重名项目: {name}")
+            names.add(name)
+            source_dir = os.path.abspath(os.path.join(self._workspace, rel_dir))
+            if not os.path.isdir(source_dir):
+                raise Exception(f"项目[{name}]目录不存在: {source_dir}")
+            self.projects.append({
+                "name": name,
+                "source_dir": source_dir,
+                "output_dir": os.path.join(self._output_dir, re.sub(r"[^\w.-]", "_", name)),
+                "params": params,
+            })
+        logger.info(f"项目清单: {len(self.projects)}个项目")
+        return self.projects
+
+    def get_labels(self):
+        """
+        获取所有项目的规则标签(合并去重)
+        """
+        labels = set()
+        for project in self.projects:
+            labels.update(StringMgr.str_to_list(str(project["params"].get("label") or self._default_label)))
+        return sorted(labels)
+
+    def __need_walk(self, project):
+        """
+        未指定文件列表(from_file)或对比版本(diff_base)的项目,需要遍历项目目录获取文件列表
+        """
+        params = project["params"]
+        return not (params.get("from_file") or params.get("diff_base") or os.getenv("INPUT_DIFF_BASE"))
+
+    def prepare_file_lists(self, exclude_paths=()):
+        """
+        一次遍历工作空间(只进入项目目录及其上级目录),将文件分配给所在的项目(嵌套的项目均会分配),
+        写入各项目的文件列表;各项目的过滤路径、.gitignore等过滤在项目扫描时对文件列表进行
+        :param exclude_paths: 不分配给项目的文件(相对工作空间,以/分隔),比如多项目模式的结果文件
+        :return: 项目名 -> 文件数;不需要遍历的项目不包含在内
+        """
+        walk_projects = [project for project in self.projects if self.__need_walk(project)]
+        if not walk_projects:
+            return {}
+        prefix_projects = {}
+        for project in walk_projects:
+            rel_dir = os.path.relpath(project["source_dir"], self._workspace)
+            prefix_projects.setdefault("" if rel_dir == "." else rel_dir, []).append(project)
+        ancestor_dirs = set()
+        for prefix in prefix_projects:
+            while prefix:
+                prefix = os.path.dirname(prefix)
+                ancestor_dirs.add(prefix)
+
+        def skip_dir(rel_dir):
+            if os.path.basename(rel_dir) == ".git" or rel_dir == PROJECTS_OUTPUT_DIR:
+                return True
+            if rel_dir in ancestor_dirs:
+                return False
+            return not self.__get_owner_prefixes(rel_dir, prefix_projects)
+
+        file_counts = {project["name"]: 0 for project in walk_projects}
+        list_files = {}
+        try:
+            for project in walk_projects:
+                os.makedirs(project["output_dir"], exist_ok=True)
+                list_files[project["name"]] = open(os.path.join(project["output_dir"], "scan_files.txt"), "w")
+            for rel_path in PathUtil.get_dir_files(self._workspace, skip_dir=skip_dir):
+                if rel_path.replace(os.sep, "/") in exclude_paths:
+                    continue
+                for prefix in self.__get_owner_prefixes(rel_path, prefix_projects):
+                    project_path = rel_path[len(prefix) + 1:] if prefix else rel_path
+                    for project in prefix_projects[prefix]:
+                        list_files[project["name"]].write(project_path + "\n")
+                        file_counts[project["name"]] += 1
+        finally:
+            for wf in list_files.values():
+                wf.close()
+        logger.info(f"各项目文件数: {file_counts}")
+        return file_counts
+
+    @staticmethod
+    def __get_owner_prefixes(rel_path, prefix_projects):
+        """
+        获取包含该路径的项目目录(相对工作空间)列表
+        """
+        prefixes = [""] if "" in prefix_projects else []
+        parts = rel_path.split(os.sep)
+        for index in range(1, len(parts) + 1):
+            prefix = os.sep.join(parts[:index])
+            if prefix in prefix_projects:
+                prefixes.append(prefix)
+        return prefixes
+
+    def __get_project_env(self, project, file_counts):
+        """
+        生成项目子进程的环境变量: 继承全局参数,项目参数覆盖全局参数,输出文件位于项目的输出目录
+        """
+        env = dict(os.environ)
+        for key in ["INPUT_PROJECTS_FILE", "INPUT_FROM_FILE"]:
+            env.pop(key, None)
+        for key, value in project["params"].items():
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            elif isinstance(value, list):
+                value = ",".join(str(item) for item in value)
+            env[f"INPUT_{key.upper()}"] = str(value)
+        if project["name"] in file_counts:
+            env["INPUT_FROM_FILE"] = os.path.join(project["output_dir"], "scan_files.txt")
+        elif project["params"].get("from_file"):  # 项目指定的文件列表相对工作空间
+            env["INPUT_FROM_FILE"] = os.path.join(self._workspace, str(project["params"]["from_file"]))
+        env["INPUT_SOURCE_DIR"] = project["source_dir"]
+        for key, file_name in self.OUTPUT_PARAMS.items():
+            env[f"INPUT_{key.upper()}"] = os.path.join(project["output_dir"], file_name)
+        for key in ["sarif_file", "ndjson_file"]:
+            file_path = env.get(f"INPUT_{key.upper()}")
+            if file_path:
+                env[f"INPUT_{key.upper()}"] = os.path.join(project["output_dir"], os.path.basename(file_path))
+        # 项目设置了存量问题量红线指标时,快速扫描按红线指标判断是否通过
+        if any(key.startswith("total_") for key in project["params"]):
+            env["INPUT_QUICK_REDLINE"] = "true"
+        # 子进程按是否通过设置返回码,汇总时是否阻塞由全局参数决定
+        env["INPUT_BLOCK"] = "true"
+        return env
+
+    def run(self, file_counts, workers, timeout):
+        """
+        并发扫描各项目(同时运行的项目数不超过workers),没有待扫描文件的项目跳过
+        :param file_counts: prepare_file_lists的返回值
+        :param workers: 同时扫描的最大项目数
+        :param timeout: 单个项目的超时时间(秒)
+        :return: 项目名 -> 扫描结果
+        """
+        results = {}
+        commands = []
+        run_projects = []
+        for project in self.projects:
+            os.makedirs(project["output_dir"], exist_ok=True)
+            if file_counts.get(project["name"], -1) == 0:
+                logger.info(f"项目[{project['name']}]无待扫描文件,跳过扫描。")
+                results[project["name"]] = self.__base_result(project, "skipped", "无待扫描文件")
+                continue
+            for file_name in self.OUTPUT_PARAMS.values():  # 删除上次执行的结果
+                file_path = os.path.join(project["output_dir"], file_name)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            commands.append(ProcessCommand([sys.executable, self.SCAN_SCRIPT, "scan"], cwd=self._workspace,
+                                           env=self.__get_project_env(project, file_counts), name=project["name"]))
+            run_projects.append(project)
+
+        logger.info(f"开始扫描{len(commands)}个项目, 并发数: {workers}")
+        returncodes = ProcessSupervisor(timeout).run_all(commands, max_concurrency=workers, return_exceptions=True)
+        for project, command, returncode in zip(run_projects, commands, returncodes):
+            result = self.__collect_result(project, returncode)
+            result["use_time"] = round(command.use_time, 3) if command.use_time is not None else None
+            results[project["name"]] = result
+        return results
+
+    def __base_result(self, project, status, description):
+        return {
+            "source_dir": project["source_dir"],
+            "label": project["params"].get("label") or self._default_label,
+            "status": status,
+            "description": description,
+        }
+
+    def __collect_result(self, project, returncode):
+        """
+        读取项目的扫描结果,状态统一为: pass/failed/error/skipped
+        """
+        if isinstance(returncode, BaseException):
+            return self.__base_result(project, "error", f"扫描异常: {returncode}")
+        report_path = os.path.join(project["output_dir"], self.OUTPUT_PARAMS["report_file"])
+        status_path = os.path.join(project["output_dir"], self.OUTPUT_PARAMS["status_file"])
+        if os.path.exists(report_path):  # 快速扫描
+            reader = QuickReportReader(report_path)
+            for _ in reader.iter_issues():
+                pass
+            fields = reader.fields
+            if fields.get("error_code") != 0:
+                status = "error"
+            else:
+                status = fields.get("status") or ("pass" if returncode == 0 else "failed")
+            result = self.__base_result(project, status, fields.get("description"))
+            for key in ["error_code", "issue_count", "redline_msg", "labels"]:
+                if key in fields:
+                    result[key] = fields[key]
+            result["severity"] = (fields.get("summary") or {}).get("severity", {})
+        elif os.path.exists(status_path):  # 完整扫描
+            with open(status_path, "r", encoding="utf-8") as rf:
+                data = json.load(rf)
+            status = {"success": "pass", "failure": "failed"}.get(data.get("status"), "error")
+            result = self.__base_result(project, status, data.get("description"))
+            for key in ["url", "redline_msg", "metrics"]:
+                result[key] = data.get(key)
+        elif returncode == 0:  # 过滤后无待扫描文件等情况,未执行扫描
+            result = self.__base_result(project, "skipped", "未执行扫描")
+        else:
+            result = self.__base_result(project, "error", f"未生成结果文件, 返回码: {returncode}")
+        result["returncode"] = returncode
+        result["output_dir"] = project["output_dir"]
+        return result
+
+    @staticmethod
+    def rollup(results):
+        """
+        汇总各项目结果: 各状态的项目数、问题总量及按级别的问题量
+        """
+        rollup = {"project_count": len(results), "pass": 0, "failed": 0, "error": 0, "skipped": 0,
+                  "issue_count": 0, "severity": {}}
+        for result in results.values():
+            rollup[result["status"]] = rollup.get(result["status"], 0) + 1
+            rollup["issue_count"] += result.get("issue_count") or 0
+            for level, count in (result.get("severity") or {}).items():
+                rollup["severity"][level] = rollup["severity"].get(level, 0) + count
+        return rollup
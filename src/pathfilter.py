@@ -13,6 +13,8 @@ import os
 import re
 import logging
 
+from telemetry import tracer
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,16 +27,37 @@ class StringMgr(object):
 
 class PathUtil(object):
     @staticmethod
-    def get_dir_files(root_dir, want_suffix=""):
-        files = set()
-        for dirpath, dirs, filenames in os.walk(root_dir):
-            for f in filenames:
-                if f.lower().endswith(want_suffix):
-                    fullpath = os.path.join(dirpath, f)
-                    files.add(fullpath)
-        full_paths = list(files)
-        rel_paths = [os.path.relpath(path, root_dir) for path in full_paths]
-        return rel_paths
+    def get_dir_files(root_dir, want_suffix="", skip_dir=None, skip_file=None):
+        """
+        遍历目录,逐个返回文件的相对路径(生成器)
+        与os.walk一致,不进入软链接目录;skip_dir判定为需要跳过的目录,不会进入遍历
+        :param root_dir: 根目录
+        :param want_suffix: 文件后缀(小写)
+        :param skip_dir: 回调函数,参数为目录相对路径,返回True时跳过该目录
+        :param skip_file: 回调函数,参数为文件相对路径,返回True时跳过该文件
+        :return: 文件相对路径生成器
+        """
+        dir_stack = [""]
+        while dir_stack:
+            rel_dir = dir_stack.pop()
+            try:
+                dir_iter = os.scandir(os.path.join(root_dir, rel_dir))
+            except OSError:  # 与os.walk一致,忽略无法访问的目录
+                continue
+            sub_dirs = []
+            with dir_iter:
+                for entry in dir_iter:
+                    rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if not entry.is_symlink() and not (skip_dir and skip_dir(rel_path)):
+                            sub_dirs.append(rel_path)
+                    elif entry.name.lower().endswith(want_suffix) and not (skip_file and skip_file(rel_path)):
+                        yield rel_path
+            dir_stack.extend(reversed(sub_dirs))
 
 
 class RegexCompiler(object):
@@ -48,17 +71,194 @@ class RegexCompiler(object):
             logger.error(err_msg)
             return None
 
+    @staticmethod
+    def compile_matcher(regex_exp_list):
+        """
+        编译为分级匹配的过滤路径规则集合,规则格式有误时返回None
+        """
+        regex = RegexCompiler.compile_regex(regex_exp_list)
+        if not regex:
+            return None
+        return PathMatcher(regex_exp_list, regex)
+
+
+class PathMatcher(object):
+    """
+    分级匹配的过滤路径规则集合,匹配结果与多个规则用|拼接后fullmatch一致:
+    - 纯字面量规则(比如 src/main.py),放入集合,直接判断是否相等
+    - 形如 dir/.* 的前缀规则,放入前缀树
+    - 形如 .*\\.ext 的后缀规则,放入后缀集合
+    - 其余规则拼接为正则表达式匹配
+    """
+    META_CHARS = ".^$*+?{}[]|()"
+
+    def __init__(self, regex_exp_list, regex):
+        """
+        :param regex_exp_list: 规则列表
+        :param regex: 所有规则拼接后编译的正则表达式
+        """
+        self.__regex = regex
+        self.__literals = set()
+        self.__prefix_trie = {}
+        self.__suffixes = set()
+        self.__suffix_lens = []
+        self.__other_regex = regex
+
+        if not self.__can_split(regex_exp_list):
+            return
+        other_exps = []
+        for regex_exp in regex_exp_list:
+            tokens = self.__tokenize(regex_exp)
+            if tokens is None:
+                other_exps.append(regex_exp)
+            elif all(kind == "lit" for kind, _ in tokens):
+                self.__literals.add(self.__join(tokens))
+            elif tokens[-2:] == [("meta", "."), ("meta", "*")] and all(kind == "lit" for kind, _ in tokens[:-2]):
+                self.__add_prefix(self.__join(tokens[:-2]))
+            elif tokens[:2] == [("meta", "."), ("meta", "*")] and all(kind == "lit" for kind, _ in tokens[2:]):
+                self.__suffixes.add(self.__join(tokens[2:]))
+            else:
+                other_exps.append(regex_exp)
+        self.__suffix_lens = sorted(set(len(suffix) for suffix in self.__suffixes))
+        # 字面量规则中不含分组,移除后不影响其余规则中的分组编号
+        self.__other_regex = re.compile("|".join(other_exps)) if other_exps else None
+
+    @staticmethod
+    def __can_split(regex_exp_list):
+        """
+        判断规则能否拆分匹配:每个规则都能单独编译(拼接后才合法的规则无法拆分),且不含(?...)写法(内联标志会作用于整个表达式)
+        """
+        for regex_exp in regex_exp_list:
+            if "(?" in regex_exp:
+                return False
+            try:
+                re.compile(regex_exp)
+            except re.error:
+                return False
+        return True
+
+    @classmethod
+    def is_literal(cls, regex_exp):
+        """
+        判断规则是否为纯字面量(不含元字符及特殊转义)
+        """
+        tokens = cls.__tokenize(regex_exp)
+        return tokens is not None and all(kind == "lit" for kind, _ in tokens)
+
+    @classmethod
+    def __tokenize(cls, regex_exp):
+        """
+        将规则拆分为字面量字符和元字符,含有 \\d、\\w 等特殊转义时返回None
+        :return: [(lit|meta, 字符), ...]
+        """
+        tokens = []
+        index = 0
+        while index < len(regex_exp):
+            char = regex_exp[index]
+            if char == "\\":
+                if index + 1 >= len(regex_exp) or regex_exp[index + 1].isalnum() or regex_exp[index + 1] == "_":
+                    return None
+                tokens.append(("lit", regex_exp[index + 1]))
+                index += 2
+                continue
+            tokens.append(("meta" if char in cls.META_CHARS else "lit", char))
+            index += 1
+        return tokens
+
+    @staticmethod
+    def __join(tokens):
+        return "".join(char for _, char in tokens)
+
+    def __add_prefix(self, prefix):
+        node = self.__prefix_trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[""] = True  # 结束标记
+
+    def __match_prefix(self, rel_path):
+        node = self.__prefix_trie
+        if not node:
+            return False
+        for char in rel_path:
+            if "" in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return "" in node
+
+    def fullmatch(self, rel_path):
+        """
+        判断路径是否完整匹配任一规则
+        :param rel_path: 以/分隔的相对路径
+        :return: bool
+        """
+        if "\n" in rel_path:  # .不匹配换行符,此类路径直接使用完整的正则表达式匹配
+            return self.__regex.fullmatch(rel_path) is not None
+        if rel_path in self.__literals:
+            return True
+        if self.__match_prefix(rel_path):
+            return True
+        for suffix_len in self.__suffix_lens:
+            if suffix_len <= len(rel_path) and rel_path[len(rel_path) - suffix_len:] in self.__suffixes:
+                return True
+        if self.__other_regex:
+            return self.__other_regex.fullmatch(rel_path) is not None
+        return False
+
 
 class FilterPathUtil(object):
+    # 分组扩展(前后断言、内联标志等)及锚点只约束匹配位置,A完整匹配"目录/"不能保证目录下的文件都被过滤
+    UNSAFE_DIR_TOKENS = ("(?", "^", "$", "\\b", "\\B", "\\A", "\\Z")
+
     def __init__(self, path_include, path_exclude):
         self.__include_regex = None
         self.__exclude_regex = None
+        self.__dir_exclude_regexes = []
 
         if path_include:
-            self.__include_regex = RegexCompiler.compile_regex(path_include)
+            self.__include_regex = RegexCompiler.compile_matcher(path_include)
 
         if path_exclude:
-            self.__exclude_regex = RegexCompiler.compile_regex(path_exclude)
+            self.__exclude_regex = RegexCompiler.compile_matcher(path_exclude)
+            if self.__exclude_regex:
+                self.__dir_exclude_regexes = self.__compile_dir_exclude_regexes(path_exclude)
+
+    @staticmethod
+    def __compile_dir_exclude_regexes(path_exclude):
+        """
+        从过滤路径中提取可以整个目录跳过的规则:
+        形如 A.* 且A中不含|的规则,如果A完整匹配 "目录/",则该目录下的所有文件均会被过滤;
+        A不是纯字面量时,含有断言、锚点的规则不能保证这一点,不用于跳过目录
+        :return: A的正则表达式列表
+        """
+        dir_regexes = []
+        for pattern in path_exclude:
+            if not pattern.endswith(".*") or "|" in pattern:
+                continue
+            prefix = pattern[:-2]
+            if not PathMatcher.is_literal(prefix) \
+                    and any(token in prefix for token in FilterPathUtil.UNSAFE_DIR_TOKENS):
+                continue
+            try:
+                dir_regexes.append(re.compile("(?:%s)" % prefix))
+            except re.error:  # 比如 a\.* 中的 .* 实际为转义的点号加 *
+                continue
+        return dir_regexes
+
+    def should_skip_dir(self, rel_dir):
+        """
+        判断目录下的所有文件是否都会被过滤,是则遍历时可以跳过整个目录
+        :param rel_dir: 目录相对路径
+        :return:
+        """
+        if not self.__dir_exclude_regexes:
+            return False
+        rel_dir = rel_dir.replace(os.sep, '/') + '/'
+        for dir_regex in self.__dir_exclude_regexes:
+            if dir_regex.fullmatch(rel_dir):
+                return True
+        return False
 
     def should_filter_path(self, rel_path):
         rel_path = rel_path.replace(os.sep, '/')
@@ -71,8 +271,16 @@ class FilterPathUtil(object):
         return False
 
     def get_include_files(self, rel_paths, root_dir):
+        """
+        过滤文件列表
+        :param rel_paths: 文件相对路径列表,也支持生成器
+        :param root_dir: 根目录
+        :return: 过滤后的文件相对路径列表
+        """
         wanted_rel_paths = []
+        total_count = 0
         for rel_path in rel_paths:
+            total_count += 1
             full_path = os.path.join(root_dir, rel_path)
             if os.path.exists(full_path):  # 判断文件是否存在,过滤掉软链接
                 if not self.should_filter_path(rel_path):
@@ -80,6 +288,8 @@ class FilterPathUtil(object):
                     wanted_rel_paths.append(rel_path)
 
         # use_time = time.time() - total_start_time
-        logger.info(f"[文件数]过滤前：{len(rel_paths)}，过滤后：{len(wanted_rel_paths)}")
+        logger.info(f"[文件数]过滤前：{total_count}，过滤后：{len(wanted_rel_paths)}")
+        tracer.set_counter("files_before_filter", total_count)
+        tracer.set_counter("files_after_filter", len(wanted_rel_paths))
 
         return wanted_rel_paths
@@ -0,0 +1,189 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+子进程管理: 基于asyncio运行子进程,逐行输出日志,超时后结束整个进程组
+"""
+
+import os
+import time
+import signal
+import asyncio
+import logging
+import subprocess
+
+from setting import PROCESS_PROGRESS_INTERVAL, PROCESS_KILL_GRACE, PROCESS_OUTPUT_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessCommand(object):
+    """
+    待执行的子进程命令
+    """
+    def __init__(self, args, cwd=None, env=None, name=None, print_args=None, output_handler=None):
+        """
+        :param args: 命令参数列表
+        :param cwd: 工作目录
+        :param env: 环境变量,为空时继承当前进程
+        :param name: 日志中显示的进程名称
+        :param print_args: 日志中显示的命令参数(比如隐藏token),为空时使用args
+        :param output_handler: 输出回调函数(参数: "stdout"/"stderr", 输出行),为空时只输出到日志
+        """
+        self.args = [str(item) for item in args]
+        self.cwd = cwd
+        self.env = env
+        self.name = name or os.path.basename(self.args[0])
+        self.print_args = print_args or self.args
+        self.output_handler = output_handler
+        self.use_time = None  # 运行耗时(秒),进程结束后记录
+
+
+class ProcessSupervisor(object):
+    """
+    子进程在独立的进程组中运行,stdout/stderr逐行输出到日志(附带已运行时长);
+    定时输出运行时长及无输出时长;超时(或无输出超时)后先向整个进程组发送SIGTERM,等待一段时间后发送SIGKILL
+    注意: python3.7下需要在主线程中调用
+    """
+    def __init__(self, timeout, idle_timeout=None):
+        """
+        :param timeout: 超时时间(秒)
+        :param idle_timeout: 无输出超时时间(秒),为空时不限制
+        """
+        self._timeout = timeout
+        self._idle_timeout = idle_timeout
+
+    def run(self, command):
+        """
+        运行单个子进程
+        :param command: ProcessCommand
+        :return: 进程返回码
+        :raise subprocess.TimeoutExpired: 超时
+        """
+        return self.run_all([command])[0]
+
+    def run_all(self, commands, max_concurrency=None, return_exceptions=False):
+        """
+        并发运行多个子进程,等待全部结束
+        :param commands: ProcessCommand列表
+        :param max_concurrency: 同时运行的最大进程数,为空时不限制
+        :param return_exceptions: 为True时,运行异常(如超时)的进程在结果中返回异常对象,不抛出
+        :return: 各进程返回码列表
+        :raise subprocess.TimeoutExpired: 任一进程超时(其他进程运行结束后抛出)
+        """
+        results = asyncio.run(self.__gather(commands, max_concurrency))
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        return results
+
+    async def __gather(self, commands, max_concurrency):
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def run_one(command):
+            if semaphore is None:
+                return await self.run_async(command)
+            async with semaphore:
+                return await self.run_async(command)
+        return await asyncio.gather(*[run_one(command) for command in commands], return_exceptions=True)
+
+    async def run_async(self, command):
+        """
+        运行子进程(协程),可在事件循环中并发调用
+        :param command: ProcessCommand
+        :return: 进程返回码
+        """
+        logger.info("run cmd: %s", " ".join(command.print_args))
+        proc = await asyncio.create_subprocess_exec(
+            *command.args, cwd=command.cwd, env=command.env,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            start_new_session=True, limit=PROCESS_OUTPUT_LIMIT)
+        start_time = time.time()
+        state = {"last_output": start_time}
+        pumps = [
+            asyncio.ensure_future(self.__pump(proc.stdout, command, "stdout", start_time, state)),
+            asyncio.ensure_future(self.__pump(proc.stderr, command, "stderr", start_time, state)),
+        ]
+        next_progress_time = start_time + PROCESS_PROGRESS_INTERVAL
+        try:
+            while True:
+                # 等待到下次输出进度或最近的超时时间点,超时后及时结束进程
+                wake_time = min(next_progress_time, start_time + self._timeout)
+                if self._idle_timeout:
+                    wake_time = min(wake_time, state["last_output"] + self._idle_timeout)
+                try:
+                    await asyncio.wait_for(asyncio.shield(proc.wait()), timeout=max(0, wake_time - time.time()))
+                    break
+                except asyncio.TimeoutError:
+                    pass
+                now = time.time()
+                elapsed, idle = now - start_time, now - state["last_output"]
+                if now >= next_progress_time:
+                    logger.info("[%s] 运行中, 已耗时: %ds, 无输出时长: %ds" % (command.name, elapsed, idle))
+                    next_progress_time += PROCESS_PROGRESS_INTERVAL
+                if elapsed >= self._timeout:
+                    logger.error("[%s] 运行超时(%ds), 结束进程组" % (command.name, self._timeout))
+                    await self.__kill_group(proc)
+                    raise subprocess.TimeoutExpired(command.print_args, self._timeout)
+                if self._idle_timeout and idle >= self._idle_timeout:
+                    logger.error("[%s] 超过%ds无输出, 结束进程组" % (command.name, self._idle_timeout))
+                    await self.__kill_group(proc)
+                    raise subprocess.TimeoutExpired(command.print_args, self._idle_timeout)
+        except asyncio.CancelledError:
+            await self.__kill_group(proc)
+            raise
+        finally:
+            # 孙进程可能继承了输出管道,进程结束后最多再等待一段时间读取剩余输出
+            done, pending = await asyncio.wait(pumps, timeout=PROCESS_KILL_GRACE)
+            for pump in pending:
+                pump.cancel()
+        command.use_time = time.time() - start_time
+        logger.info("[%s] 进程结束, 返回码: %s, 耗时: %.2fs" % (command.name, proc.returncode, command.use_time))
+        return proc.returncode
+
+    @staticmethod
+    async def __pump(stream, command, tag, start_time, state):
+        """
+        逐行读取子进程输出并打印日志,设置了输出回调时同时传递给回调
+        """
+        name = command.name
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:  # 单行超过长度限制,已读取的内容被丢弃
+                logger.warning("[%s][%s] 输出行过长,已截断" % (name, tag))
+                continue
+            if not line:
+                break
+            state["last_output"] = time.time()
+            text = line.decode("utf-8", errors="replace").rstrip()
+            logger.info("[%s][%s][+%.1fs] %s" % (name, tag, state["last_output"] - start_time, text))
+            if command.output_handler:
+                command.output_handler(tag, text)
+
+    @staticmethod
+    async def __kill_group(proc):
+        """
+        结束子进程及其所在进程组:先发送SIGTERM,等待后仍未退出则发送SIGKILL
+        """
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(proc.pid, sig)
+            except ProcessLookupError:  # 进程组已全部退出
+                break
+            try:
+                await asyncio.wait_for(asyncio.shield(proc.wait()), timeout=PROCESS_KILL_GRACE)
+            except asyncio.TimeoutError:
+                continue
+            if sig == signal.SIGTERM:
+                # 主进程已退出,仍向进程组发送SIGKILL,清理残留的孙进程
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            break
@@ -0,0 +1,398 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+快速扫描结果(tca_quick_scan_report.json)解析: 流式读取问题列表、统计问题分布、流式输出完整结果及SARIF/NDJSON
+"""
+
+import os
+import re
+import json
+import logging
+import collections
+
+from setting import QUICK_SCAN_ISSUE_KEYS, QUICK_SCAN_ISSUE_PATH_KEYS, QUICK_SCAN_ISSUE_RULE_KEYS, \
+    QUICK_SCAN_ISSUE_SEVERITY_KEYS, QUICK_SCAN_ISSUE_MSG_KEYS, QUICK_SCAN_ISSUE_LINE_KEYS, \
+    QUICK_SCAN_ISSUE_COLUMN_KEYS, REPORT_READ_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class QuickReportUtil(object):
+    @staticmethod
+    def get_issue_path_key(issue):
+        """
+        获取问题中文件路径的字段名
+        """
+        for key in QUICK_SCAN_ISSUE_PATH_KEYS:
+            if key in issue:
+                return key
+        return None
+
+    @staticmethod
+    def get_issue_rel_path(issue, source_dir):
+        """
+        获取问题所在文件相对代码目录的路径(以/分隔)
+        :return: 相对路径;问题中没有文件路径时返回None
+        """
+        path_key = QuickReportUtil.get_issue_path_key(issue)
+        if not path_key or not issue[path_key]:
+            return None
+        path = issue[path_key]
+        if os.path.isabs(path):
+            path = os.path.relpath(path, source_dir)
+        return path.replace(os.sep, "/")
+
+    @staticmethod
+    def get_issue_field(issue, keys):
+        """
+        按顺序查找问题中的字段值
+        :param issue: 问题
+        :param keys: 字段名列表
+        :return: 字段值;都不存在时返回None
+        """
+        for key in keys:
+            if key in issue:
+                return issue[key]
+        return None
+
+
+class QuickReportReader(object):
+    """
+    流式读取结果文件: 顶层对象中的问题列表逐个解析返回,不将整个结果加载到内存中;
+    其他顶层字段(错误码、问题量等)保存到self.fields,遍历结束后完整
+    """
+    WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, report_path, chunk_size=REPORT_READ_CHUNK_SIZE):
+        """
+        :param report_path: 结果文件路径
+        :param chunk_size: 分块读取的大小(字节)
+        """
+        self._report_path = report_path
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._rf = None
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self.fields = {}
+        self.issue_key = None  # 问题列表的字段名
+
+    def iter_issues(self):
+        """
+        逐个返回问题列表中的问题
+        """
+        with open(self._report_path, "r", encoding="utf-8", errors="replace") as rf:
+            self._rf = rf
+            self.__next_char("{")
+            if self.__peek() == "}":
+                return
+            while True:
+                key = self.__decode()
+                self.__next_char(":")
+                if key in QUICK_SCAN_ISSUE_KEYS and self.__peek() == "[":
+                    self.issue_key = key
+                    self.__next_char("[")
+                    if self.__peek() == "]":
+                        self.__next_char("]")
+                    else:
+                        while True:
+                            yield self.__decode()
+                            if self.__next_char(",]") == "]":
+                                break
+                else:
+                    self.fields[key] = self.__decode()
+                if self.__next_char(",}") == "}":
+                    break
+
+    def __fill(self, size):
+        """
+        读取下一块内容,丢弃已解析的部分
+        """
+        chunk = self._rf.read(size)
+        if not chunk:
+            self._eof = True
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+
+    def __peek(self):
+        """
+        跳过空白字符,返回下一个字符
+        """
+        while True:
+            self._pos = self.WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                raise ValueError(f"结果文件不完整: {self._report_path}")
+            self.__fill(self._chunk_size)
+
+    def __next_char(self, chars):
+        char = self.__peek()
+        if char not in chars:
+            raise ValueError(f"结果文件格式有误: {self._report_path}, 期望: {chars}, 实际: {char}")
+        self._pos += 1
+        return char
+
+    def __decode(self):
+        """
+        解析下一个json值;内容不完整时继续读取(读取量逐次翻倍,避免大字段反复解析)
+        """
+        self.__peek()
+        read_size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # 值恰好在缓冲区末尾时(如数字)可能被截断,继续读取后重新解析
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self.__fill(read_size)
+            read_size *= 2
+
+
+class IssueFileWriter(object):
+    """
+    流式输出问题的基类: 问题逐个写入,内存占用与问题量无关;先写入临时文件,完成后原子重命名
+    子类实现_write_header、_write_issue、_write_footer
+    """
+    NAME = ""
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        self._wf = None
+        self.issue_count = 0
+
+    def start(self, issue_key):
+        """
+        :param issue_key: 问题列表的字段名
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self._file_path)), exist_ok=True)
+        self._wf = open(self._tmp_path, "w", encoding="utf-8")
+        self._write_header(issue_key)
+
+    @property
+    def started(self):
+        return self._wf is not None
+
+    def add(self, issue):
+        self._write_issue(issue)
+        self.issue_count += 1
+
+    def close(self, fields):
+        """
+        完成输出
+        :param fields: 问题列表以外的结果字段
+        """
+        self._write_footer(fields)
+        self._wf.close()
+        self._wf = None
+        os.replace(self._tmp_path, self._file_path)
+        logger.info(f"{self.NAME}: {self._file_path}")
+
+    def abort(self):
+        if self._wf:
+            self._wf.close()
+            os.remove(self._tmp_path)
+            self._wf = None
+
+    def _write_header(self, issue_key):
+        pass
+
+    def _write_issue(self, issue):
+        raise NotImplementedError()
+
+    def _write_footer(self, fields):
+        pass
+
+
+class QuickReportWriter(IssueFileWriter):
+    """
+    输出完整结果(json): 问题列表逐个写入,其他字段在结束时写入
+    """
+    NAME = "完整扫描结果"
+
+    def _write_header(self, issue_key):
+        self._wf.write("{\n%s: [" % json.dumps(issue_key))
+
+    def _write_issue(self, issue):
+        self._wf.write(("," if self.issue_count else "") + "\n" + json.dumps(issue, ensure_ascii=False))
+
+    def _write_footer(self, fields):
+        self._wf.write("\n]")
+        for key, value in fields.items():
+            self._wf.write(",\n%s: %s" % (json.dumps(key), json.dumps(value, ensure_ascii=False)))
+        self._wf.write("\n}\n")
+
+
+class NdjsonWriter(IssueFileWriter):
+    """
+    输出NDJSON: 每行一个问题,便于下游逐行处理
+    """
+    NAME = "NDJSON结果"
+
+    def _write_issue(self, issue):
+        self._wf.write(json.dumps(issue, ensure_ascii=False) + "\n")
+
+
+class SarifWriter(IssueFileWriter):
+    """
+    输出SARIF 2.1.0(可上传到GitHub code scanning): results逐个写入,规则列表(tool.driver.rules)在结束时写入
+    """
+    NAME = "SARIF结果"
+    SEVERITY_LEVELS = {"fatal": "error", "error": "error", "warning": "warning", "info": "note"}
+
+    def __init__(self, file_path, source_dir):
+        """
+        :param file_path: 输出文件路径
+        :param source_dir: 代码目录,问题文件路径输出为相对该目录的路径
+        """
+        super(SarifWriter, self).__init__(file_path)
+        self._source_dir = source_dir
+        self._rules = {}
+
+    def _write_header(self, issue_key):
+        self._wf.write('{"$schema": "https://json.schemastore.org/sarif-2.1.0.json", "version": "2.1.0", '
+                       '"runs": [{"results": [')
+
+    def _write_issue(self, issue):
+        rule_id = str(QuickReportUtil.get_issue_field(issue, QUICK_SCAN_ISSUE_RULE_KEYS) or "unknown")
+        severity = str(QuickReportUtil.get_issue_field(issue, QUICK_SCAN_ISSUE_SEVERITY_KEYS) or "").lower()
+        message = QuickReportUtil.get_issue_field(issue, QUICK_SCAN_ISSUE_MSG_KEYS) or rule_id
+        result = {
+            "ruleId": rule_id,
+            "level": self.SEVERITY_LEVELS.get(severity, "warning"),
+            "message": {"text": str(message)},
+        }
+        rel_path = QuickReportUtil.get_issue_rel_path(issue, self._source_dir)
+        if rel_path:
+            location = {"artifactLocation": {"uri": rel_path, "uriBaseId": "%SRCROOT%"}}
+            region = {}
+            line = self.__to_positive_int(QuickReportUtil.get_issue_field(issue, QUICK_SCAN_ISSUE_LINE_KEYS))
+            if line:
+                region["startLine"] = line
+                column = self.__to_positive_int(
+                    QuickReportUtil.get_issue_field(issue, QUICK_SCAN_ISSUE_COLUMN_KEYS))
+                if column:
+                    region["startColumn"] = column
+                location["region"] = region
+            result["locations"] = [{"physicalLocation": location}]
+        self._rules.setdefault(rule_id, severity)
+        self._wf.write(("," if self.issue_count else "") + "\n" + json.dumps(result, ensure_ascii=False))
+
+    def _write_footer(self, fields):
+        rules = [{
+            "id": rule_id,
+            "defaultConfiguration": {"level": self.SEVERITY_LEVELS.get(severity, "warning")},
+        } for rule_id, severity in self._rules.items()]
+        tail = {
+            "tool": {"driver": {"name": "TCA", "informationUri": "https://github.com/Tencent/CodeAnalysis",
+                                "rules": rules}},
+            "originalUriBaseIds": {"%SRCROOT%": {"uri": "file://" + self._source_dir.rstrip("/") + "/"}},
+            "invocations": [{"executionSuccessful": fields.get("error_code") == 0}],
+        }
+        self._wf.write("\n]")
+        for key, value in tail.items():
+            self._wf.write(", %s: %s" % (json.dumps(key), json.dumps(value, ensure_ascii=False)))
+        self._wf.write("}]}\n")
+
+    @staticmethod
+    def __to_positive_int(value):
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return None
+        return value if value > 0 else None
+
+
+class IssueWriterGroup(object):
+    """
+    同时输出到多个IssueFileWriter
+    """
+    def __init__(self, writers):
+        self._writers = writers
+
+    def start(self, issue_key):
+        for writer in self._writers:
+            writer.start(issue_key)
+
+    @property
+    def started(self):
+        return all(writer.started for writer in self._writers)
+
+    def add(self, issue):
+        for writer in self._writers:
+            writer.add(issue)
+
+    def close(self, fields):
+        for writer in self._writers:
+            writer.close(fields)
+
+    def abort(self):
+        for writer in self._writers:
+            writer.abort()
+
+
+class QuickReportSummary(object):
+    """
+    统计问题分布(按级别、规则、文件),并保留前N个问题作为样例,用于在日志中输出有限长度的摘要
+    """
+    MAX_SAMPLE_LENGTH = 300  # 日志中每个问题样例的最大长度
+
+    def __init__(self, top_n):
+        self._top_n = top_n
+        self.issue_count = 0
+        self.severity_counter = collections.Counter()
+        self.rule_counter = collections.Counter()
+        self.file_counter = collections.Counter()
+        self.samples = []
+
+    def add(self, issue, rel_path=None):
+        """
+        :param issue: 问题
+        :param rel_path: 问题所在文件的相对路径
+        """
+        self.issue_count += 1
+        self.severity_counter[str(QuickReportUtil.get_issue_field(issue, QUICK_SCAN_ISSUE_SEVERITY_KEYS)).lower()] += 1
+        self.rule_counter[str(QuickReportUtil.get_issue_field(issue, QUICK_SCAN_ISSUE_RULE_KEYS))] += 1
+        if rel_path:
+            self.file_counter[rel_path] += 1
+        if len(self.samples) < self._top_n:
+            self.samples.append(issue)
+
+    def to_dict(self):
+        return {
+            "issue_count": self.issue_count,
+            "severity": dict(self.severity_counter.most_common()),
+            "rule": dict(self.rule_counter.most_common()),
+            "file_count": len(self.file_counter),
+        }
+
+    def get_digest(self):
+        """
+        :return: 摘要文本(各级别问题量、问题量最多的N个规则及文件、前N个问题)
+        """
+        lines = [f"问题总数: {self.issue_count}"]
+        if not self.issue_count:
+            return "\n".join(lines)
+        lines.append("按级别: " + ", ".join(f"{key}={value}" for key, value in self.severity_counter.most_common()))
+        lines.append(f"问题量最多的规则(前{self._top_n}个, 共{len(self.rule_counter)}个):")
+        lines.extend(f"  {value:>8}  {key}" for key, value in self.rule_counter.most_common(self._top_n))
+        lines.append(f"问题量最多的文件(前{self._top_n}个, 共{len(self.file_counter)}个):")
+        lines.extend(f"  {value:>8}  {key}" for key, value in self.file_counter.most_common(self._top_n))
+        lines.append(f"问题样例(前{len(self.samples)}个):")
+        for issue in self.samples:
+            text = json.dumps(issue, ensure_ascii=False)
+            if len(text) > self.MAX_SAMPLE_LENGTH:
+                text = text[:self.MAX_SAMPLE_LENGTH] + "..."
+            lines.append("  " + text)
+        return "\n".join(lines)
@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+按文件内容摘要缓存快速扫描结果,未变更的文件无需重复分析
+"""
+
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache(object):
+    """
+    缓存目录结构: <cache_dir>/<key前2位>/<key>.json,内容为该文件的问题列表;mtime作为最近使用时间
+    key由文件相对路径、文件内容sha256及扫描上下文(规则标签、客户端版本、工具配置)共同计算;
+    问题可能与路径相关(如按路径过滤、按扩展名识别语言),内容相同但路径不同的文件不共用缓存
+    """
+    def __init__(self, cache_dir, max_size, labels, client_version, tool_config=""):
+        """
+        :param cache_dir: 缓存目录
+        :param max_size: 缓存总大小上限(字节),超出时按最近使用时间淘汰
+        :param labels: 规则标签列表
+        :param client_version: 客户端版本
+        :param tool_config: 工具配置标识,变更后缓存全部失效
+        """
+        self.cache_dir = cache_dir
+        self._max_size = max_size
+        context = json.dumps({
+            "labels": sorted(labels),
+            "client_version": client_version,
+            "tool_config": tool_config,
+        }, sort_keys=True)
+        self._context = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_key(self, file_path, rel_path):
+        """
+        计算文件的缓存key
+        :param file_path: 文件路径
+        :param rel_path: 文件相对代码目录的路径
+        :return: key;文件无法读取时返回None
+        """
+        hasher = hashlib.sha256(self._context.encode("utf-8"))
+        hasher.update(rel_path.replace(os.sep, "/").encode("utf-8") + b"\0")
+        try:
+            with open(file_path, "rb") as rf:
+                for chunk in iter(lambda: rf.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+        except OSError:
+            return None
+        return hasher.hexdigest()
+
+    def get(self, key):
+        """
+        获取缓存的问题列表,并更新最近使用时间
+        :return: 问题列表;未命中返回None
+        """
+        cache_path = self.__get_cache_path(key)
+        try:
+            with open(cache_path, "r", encoding="utf-8") as rf:
+                issues = json.load(rf)
+        except (OSError, ValueError):
+            return None
+        os.utime(cache_path)
+        return issues
+
+    def put(self, key, issues):
+        """
+        写入文件的问题列表(先写临时文件再重命名,避免并发任务读到不完整的内容)
+        """
+        cache_path = self.__get_cache_path(key)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as wf:
+            json.dump(issues, wf, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+
+    def evict(self):
+        """
+        缓存总大小超过上限时,按最近使用时间从旧到新删除
+        """
+        entries = []
+        total_size = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                cache_path = os.path.join(dirpath, name)
+                try:
+                    file_stat = os.stat(cache_path)
+                except OSError:
+                    continue
+                entries.append((file_stat.st_mtime, file_stat.st_size, cache_path))
+                total_size += file_stat.st_size
+        if total_size <= self._max_size:
+            return
+        entries.sort()
+        remove_count = 0
+        for _, size, cache_path in entries:
+            if total_size <= self._max_size:
+                break
+            try:
+                os.remove(cache_path)
+            except OSError:
+                continue
+            total_size -= size
+            remove_count += 1
+        logger.info(f"扫描结果缓存超过上限,淘汰缓存文件数: {remove_count}")
+
+    def __get_cache_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
@@ -0,0 +1,279 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+常驻扫描服务: 客户端安装及工具初始化只执行一次,通过unix socket接收扫描请求,排队并发执行
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import logging
+import subprocess
+
+from procsupervisor import ProcessCommand, ProcessSupervisor
+from setting import SCAN_TIMEOUT, DAEMON_TIMEOUT_MARGIN, DAEMON_CLIENT_DIR_ENV
+
+logger = logging.getLogger(__name__)
+
+
+class ScanDaemon(object):
+    """
+    协议: 每个连接发送一个请求,请求及响应均为每行一个json对象(NDJSON)
+        请求:
+            {"action": "scan", "cwd": 工作空间目录, "params": {"label": ..., "source_dir": ..., "from_file": ..., ...}}
+            {"action": "status"}
+            params为扫描参数(同INPUT_XXX环境变量,不含INPUT_前缀)
+        响应:
+            {"type": "accepted", "id": 请求编号, "queued": 排队中的请求数}
+            {"type": "output", "stream": "stdout"/"stderr", "line": 扫描进程的输出行}
+            {"type": "result", "id": 请求编号, "returncode": 返回码, "wait_time": 排队耗时, "use_time": 扫描耗时,
+             "error": 执行异常信息}
+            {"type": "status", "workers": 并发数, "running": 扫描中的请求数, "queued": 排队中的请求数, "served": 已完成的请求数}
+    每个扫描请求在独立的子进程中执行scan命令(环境变量、结果文件等互不影响),子进程直接使用服务已安装的客户端及已初始化的工具;
+    客户端在扫描结束前断开连接时,结束对应的扫描进程
+    注意: 常驻服务只节省客户端安装(检查)及工具初始化的耗时;每个请求仍需启动python进程、加载模块及遍历待扫描文件
+    """
+    SCAN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "codedog_scan.py")
+
+    def __init__(self, socket_path, workers, client_dir):
+        """
+        :param socket_path: unix socket路径
+        :param workers: 同时运行的最大扫描数
+        :param client_dir: 已安装的客户端目录
+        """
+        self._socket_path = socket_path
+        self._workers = workers
+        self._client_dir = client_dir
+        self._semaphore = None
+        self._handlers = set()
+        self._next_id = 1
+        self._running = 0
+        self._queued = 0
+        self._served = 0
+
+    def serve(self):
+        """
+        启动服务,收到SIGTERM/SIGINT后停止(结束进行中的扫描)
+        注意: python3.7下需要在主线程中调用
+        """
+        asyncio.run(self.__serve())
+
+    async def __serve(self):
+        self.__remove_stale_socket()
+        self._semaphore = asyncio.Semaphore(self._workers)
+        stop_event = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        # 创建socket文件时即只允许当前用户访问(提交扫描请求),避免绑定后再修改权限前的时间窗口
+        old_umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(self.__handle, path=self._socket_path)
+        finally:
+            os.umask(old_umask)
+        logger.info(f"常驻扫描服务已启动: {self._socket_path}, 并发数: {self._workers}, 客户端目录: {self._client_dir}")
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("常驻扫描服务停止中 ...")
+            server.close()
+            await server.wait_closed()
+            for handler in list(self._handlers):
+                handler.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            if os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
+        logger.info(f"常驻扫描服务已停止, 已完成的请求数: {self._served}")
+
+    def __remove_stale_socket(self):
+        """
+        删除上次异常退出残留的socket文件;socket仍可连接时,说明已有服务在运行
+        """
+        if not os.path.exists(self._socket_path):
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            logger.info(f"删除残留的socket文件: {self._socket_path}")
+            os.remove(self._socket_path)
+            return
+        finally:
+            sock.close()
+        raise Exception(f"常驻扫描服务已在运行: {self._socket_path}")
+
+    @staticmethod
+    def __send(writer, message):
+        if not writer.is_closing():
+            writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    async def __handle(self, reader, writer):
+        """
+        处理一个连接的请求
+        """
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            line = await reader.readline()
+            try:
+                request = json.loads(line.decode("utf-8"))
+                action = request.get("action", "scan")
+            except (ValueError, AttributeError) as err:
+                self.__send(writer, {"type": "result", "returncode": None, "error": f"请求格式错误: {err}"})
+                return
+            if action == "status":
+                self.__send(writer, {"type": "status", "workers": self._workers, "running": self._running,
+                                     "queued": self._queued, "served": self._served})
+            elif action == "scan":
+                await self.__handle_scan(request, reader, writer)
+            else:
+                self.__send(writer, {"type": "result", "returncode": None, "error": f"不支持的请求: {action}"})
+            await writer.drain()
+        except ConnectionError as err:
+            logger.warning(f"客户端连接异常: {err}")
+        finally:
+            self._handlers.discard(handler)
+            writer.close()
+
+    async def __handle_scan(self, request, reader, writer):
+        """
+        处理扫描请求: 排队等待后启动扫描进程,转发扫描进程的输出,结束后返回结果;客户端断开连接时结束扫描进程
+        """
+        request_id = self._next_id
+        self._next_id += 1
+        cwd = request.get("cwd")
+        params = request.get("params") or {}
+        if not cwd or not os.path.isdir(cwd):
+            self.__send(writer, {"type": "result", "id": request_id, "returncode": None,
+                                 "error": f"工作空间目录不存在: {cwd}"})
+            return
+        try:
+            timeout = float(params["timeout"]) * 3600 if params.get("timeout") else SCAN_TIMEOUT
+        except ValueError:
+            self.__send(writer, {"type": "result", "id": request_id, "returncode": None,
+                                 "error": f"超时时间格式错误: {params['timeout']}"})
+            return
+
+        command = ProcessCommand([sys.executable, self.SCAN_SCRIPT, "scan"], cwd=cwd,
+                                 env=self.__get_scan_env(params), name=f"scan#{request_id}",
+                                 output_handler=lambda tag, text: self.__send(
+                                     writer, {"type": "output", "stream": tag, "line": text}))
+        logger.info(f"收到扫描请求[{request_id}]: cwd={cwd}, label={params.get('label')}, "
+                     f"排队中的请求数: {self._queued}")
+        self.__send(writer, {"type": "accepted", "id": request_id, "queued": self._queued})
+        scan_task = asyncio.ensure_future(self.__run_scan(command, timeout + DAEMON_TIMEOUT_MARGIN))
+        disconnect_task = asyncio.ensure_future(reader.read())  # 客户端不再发送数据,读取结束即断开连接
+        try:
+            await asyncio.wait([scan_task, disconnect_task], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not scan_task.done():
+                logger.warning(f"扫描请求[{request_id}]的客户端已断开连接, 取消扫描")
+                scan_task.cancel()
+                await asyncio.gather(scan_task, return_exceptions=True)
+            disconnect_task.cancel()
+        if scan_task.cancelled():
+            return
+        result = scan_task.result()
+        result.update({"type": "result", "id": request_id})
+        self._served += 1
+        logger.info(f"扫描请求[{request_id}]结束: {result}")
+        self.__send(writer, result)
+
+    async def __run_scan(self, command, timeout):
+        """
+        获取并发额度后运行扫描进程
+        :return: 扫描结果
+        """
+        start_time = time.time()
+        queued = True
+        self._queued += 1
+        try:
+            async with self._semaphore:
+                self._queued -= 1
+                queued = False
+                self._running += 1
+                wait_time = time.time() - start_time
+                try:
+                    returncode = await ProcessSupervisor(timeout).run_async(command)
+                    error = None
+                except (OSError, subprocess.TimeoutExpired) as err:
+                    returncode = None
+                    error = f"扫描异常: {err}"
+                finally:
+                    self._running -= 1
+        finally:
+            if queued:
+                self._queued -= 1
+        return {
+            "returncode": returncode,
+            "wait_time": round(wait_time, 3),
+            "use_time": round(command.use_time, 3) if command.use_time is not None else None,
+            "error": error,
+        }
+
+    def __get_scan_env(self, params):
+        """
+        生成扫描进程的环境变量: 不继承服务自身的扫描参数,只使用请求中的参数;并指定使用服务已安装的客户端
+        """
+        env = {key: value for key, value in os.environ.items() if not key.startswith("INPUT_")}
+        for key, value in params.items():
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            elif isinstance(value, list):
+                value = ",".join(str(item) for item in value)
+            env[f"INPUT_{key.upper()}"] = str(value)
+        env[DAEMON_CLIENT_DIR_ENV] = self._client_dir
+        return env
+
+
+class ScanDaemonClient(object):
+    """
+    常驻扫描服务的客户端: 提交扫描请求,输出扫描进程的日志,等待扫描结果
+    """
+    def __init__(self, socket_path):
+        """
+        :param socket_path: 常驻扫描服务的unix socket路径
+        """
+        self._socket_path = socket_path
+
+    def scan(self, cwd, params):
+        """
+        提交扫描请求并等待扫描结束
+        :param cwd: 工作空间目录
+        :param params: 扫描参数(不含INPUT_前缀)
+        :return: 扫描结果(result响应);服务未启动时返回None
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._socket_path)
+        except (ConnectionRefusedError, FileNotFoundError) as err:
+            logger.warning(f"无法连接常驻扫描服务: {self._socket_path}, {err}")
+            sock.close()
+            return None
+
+        with sock, sock.makefile("rb") as rf:
+            request = {"action": "scan", "cwd": cwd, "params": params}
+            sock.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+            for line in rf:
+                message = json.loads(line.decode("utf-8"))
+                if message.get("type") == "accepted":
+                    logger.info(f"扫描请求已提交到常驻扫描服务, 请求编号: {message['id']}, "
+                                f"排队中的请求数: {message['queued']}")
+                elif message.get("type") == "output":
+                    # 扫描进程的输出行已包含日志格式,原样写入对应的输出流
+                    stream = sys.stderr if message.get("stream") == "stderr" else sys.stdout
+                    stream.write(message["line"] + "\n")
+                    stream.flush()
+                elif message.get("type") == "result":
+                    return message
+        raise ConnectionError("常驻扫描服务连接中断,未返回扫描结果")
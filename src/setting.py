@@ -18,5 +18,102 @@ PUPPY_TASK_EXE_NAME = "scantask"
 # 整个扫描超时时间
 SCAN_TIMEOUT = 60 * 120
 
+# 多项目模式: 各项目的输出目录(相对工作空间)、默认并发扫描的项目数及项目扫描超时的额外时间(客户端准备、获取文件列表等,秒)
+PROJECTS_OUTPUT_DIR = ".tca_projects"
+PROJECT_WORKERS = 4
+PROJECT_TIMEOUT_MARGIN = 600
+
+# 子进程运行中输出进度日志的间隔(秒)、超时后SIGTERM到SIGKILL的等待时间(秒)及单行输出长度上限(字节)
+PROCESS_PROGRESS_INTERVAL = 60
+PROCESS_KILL_GRACE = 10
+PROCESS_OUTPUT_LIMIT = 1024 * 1024
+
+# warmup命令记录已初始化工具的清单文件(位于客户端目录下)
+WARMUP_MANIFEST_NAME = ".tca_warmup_manifest.json"
+
+# 常驻扫描服务: 默认的unix socket路径、同时运行的扫描数、扫描进程超时的额外时间(秒),
+# 及向扫描进程传递已安装客户端目录的环境变量名(扫描进程直接使用该客户端,跳过安装检查)
+DAEMON_SOCKET_PATH = "/tmp/tca_action_daemon.sock"
+DAEMON_WORKERS = 2
+DAEMON_TIMEOUT_MARGIN = 60
+DAEMON_CLIENT_DIR_ENV = "TCA_DAEMON_CLIENT_DIR"
+
 # puppy安装包下载url
 PUPPY_DOWNLOAD_URL = "https://github.com/Tencent/CodeAnalysis/releases/download/20230222.1/tca-client-v20230222.1-x86_64-linux.zip"
+
+# puppy安装包sha256校验值,为空时不校验
+PUPPY_DOWNLOAD_SHA256 = ""
+
+# puppy安装包镜像列表(按优先级排列),可通过INPUT_CLIENT_MIRRORS在前面追加;
+# 支持http(s)://及file://,以/结尾时表示目录(拼接安装包文件名)
+PUPPY_DOWNLOAD_MIRRORS = [PUPPY_DOWNLOAD_URL]
+# 多个镜像时,探测各镜像首字节耗时(TTFB)的超时时间(秒)
+MIRROR_PROBE_TIMEOUT = 5
+
+# 下载分块大小(字节)及中断后的重试次数
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRY_TIMES = 3
+
+# 分段并发下载的默认并发数及最小分段大小(字节),并发数为1时使用单连接下载
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+
+# http请求的连接超时、读取超时(秒)
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 60
+# 幂等请求失败时的重试次数,重试间隔按指数退避(带随机抖动),单位秒
+HTTP_RETRY_TIMES = 3
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 8
+# 每个host保留的空闲长连接数
+HTTP_POOL_MAXSIZE = 8
+# 最多跟随的重定向次数
+HTTP_MAX_REDIRECTS = 10
+
+# 解压时的读写分块大小(字节)、并行解压的最大线程数,以及分发到线程池的最小文件大小(字节)
+UNZIP_CHUNK_SIZE = 1024 * 1024
+UNZIP_MAX_WORKERS = 8
+UNZIP_PARALLEL_MIN_SIZE = 1024 * 1024
+
+# 客户端缓存目录名称(位于客户端安装目录下),缓存总大小上限(字节)及最长保留天数
+CLIENT_CACHE_DIR_NAME = "cache"
+CLIENT_CACHE_MAX_SIZE = 3 * 1024 * 1024 * 1024
+CLIENT_CACHE_MAX_AGE_DAYS = 30
+
+# 并行压缩的最大线程数、在线程池中压缩的最大文件大小(字节,更大的文件流式压缩),
+# 以及采样熵值(bits/byte)超过该值时使用STORE模式
+ZIP_MAX_WORKERS = 8
+ZIP_PARALLEL_MAX_SIZE = 8 * 1024 * 1024
+ZIP_STORE_ENTROPY = 7.5
+
+# 已压缩格式的文件扩展名,压缩时直接存储
+INCOMPRESSIBLE_EXTS = {
+    ".zip", ".jar", ".war", ".aar", ".apk", ".whl", ".egg", ".nupkg",
+    ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar", ".lz4",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico",
+    ".mp3", ".mp4", ".avi", ".mov", ".mkv", ".woff", ".woff2", ".pdf",
+}
+
+# 快速扫描结果中问题列表的字段名,及问题中文件路径的字段名(按顺序查找)
+QUICK_SCAN_ISSUE_KEYS = ["issues", "issue_detail"]
+QUICK_SCAN_ISSUE_PATH_KEYS = ["path", "file_path"]
+# 问题中规则名、问题级别的字段名(按顺序查找)
+QUICK_SCAN_ISSUE_RULE_KEYS = ["rule", "rule_name", "checkrule"]
+QUICK_SCAN_ISSUE_SEVERITY_KEYS = ["severity", "level"]
+# 问题中描述、行号、列号的字段名(按顺序查找),用于输出SARIF
+QUICK_SCAN_ISSUE_MSG_KEYS = ["msg", "message", "description"]
+QUICK_SCAN_ISSUE_LINE_KEYS = ["line", "line_num", "start_line"]
+QUICK_SCAN_ISSUE_COLUMN_KEYS = ["column", "col", "column_num"]
+
+# 快速扫描完整结果的默认输出文件(相对工作空间)
+QUICK_SCAN_REPORT_FILE = "tca_quick_scan_report.json"
+# 流式读取结果文件的分块大小(字节),及日志中输出的规则、文件、问题数量上限
+REPORT_READ_CHUNK_SIZE = 1024 * 1024
+REPORT_DIGEST_TOP_N = 10
+
+# 扫描结果缓存的默认大小上限(MB)
+RESULT_CACHE_MAX_SIZE = 1024
+
+# 分片扫描时每个扫描进程的内存占用估算值(MB),以及划分分片时每个文件的固定开销(字节)
+SHARD_MEMORY_PER_PROCESS = 1024
+SHARD_FILE_OVERHEAD = 4096
@@ -0,0 +1,135 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+阶段耗时及资源统计: 记录各阶段(下载、解压、工具初始化、遍历过滤、扫描等)的耗时、cpu时间及内存峰值
+"""
+
+import os
+import json
+import time
+import logging
+import resource
+import functools
+import threading
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Tracer(object):
+    """
+    阶段统计记录器,线程安全
+    注意: getrusage统计的是整个进程(及已结束的子进程),多个阶段并发执行时,各阶段的cpu时间会互相包含
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+        self.spans = []
+        self.counters = {}
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        统计代码块的耗时及资源使用
+        :param name: 阶段名称
+        :param args: 附加信息,代码块中可通过yield返回的字典继续添加
+        """
+        start_time = time.time()
+        start_self = resource.getrusage(resource.RUSAGE_SELF)
+        start_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        try:
+            yield args
+        finally:
+            end_time = time.time()
+            end_self = resource.getrusage(resource.RUSAGE_SELF)
+            end_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            record = {
+                "name": name,
+                "start": round(start_time - self._start_time, 6),
+                "wall_time": round(end_time - start_time, 6),
+                "cpu_time": round(self.__get_cpu_time(end_self) - self.__get_cpu_time(start_self), 6),
+                "child_cpu_time": round(self.__get_cpu_time(end_children) - self.__get_cpu_time(start_children), 6),
+                "max_rss_mb": round(end_self.ru_maxrss / 1024, 2),  # linux下ru_maxrss单位为KB
+                "child_max_rss_mb": round(end_children.ru_maxrss / 1024, 2),
+                "thread": threading.current_thread().name,
+                "args": args,
+            }
+            with self._lock:
+                self.spans.append(record)
+            logger.info("[阶段统计] %s: 耗时 %.2fs, cpu %.2fs, 子进程cpu %.2fs" % (
+                name, record["wall_time"], record["cpu_time"], record["child_cpu_time"]))
+
+    def traced(self, name):
+        """
+        装饰器: 统计函数的耗时及资源使用
+        :param name: 阶段名称
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def set_counter(self, name, value):
+        """
+        记录计数(如过滤前后的文件数)
+        """
+        with self._lock:
+            self.counters[name] = value
+
+    def get_timings(self):
+        """
+        :return: 已结束阶段的统计数据
+        """
+        with self._lock:
+            return {
+                "total_time": round(time.time() - self._start_time, 6),
+                "phases": list(self.spans),
+                "counters": dict(self.counters),
+            }
+
+    def write_trace(self, trace_file):
+        """
+        输出统计文件: .jsonl结尾时每行输出一个阶段的json;否则输出Chrome trace格式(可在chrome://tracing或Perfetto中查看)
+        :param trace_file: 输出文件路径
+        """
+        timings = self.get_timings()
+        with open(trace_file, "w") as wf:
+            if trace_file.endswith(".jsonl"):
+                for span in timings["phases"]:
+                    wf.write(json.dumps(span, ensure_ascii=False) + "\n")
+                wf.write(json.dumps({"name": "counters", "args": timings["counters"]}, ensure_ascii=False) + "\n")
+            else:
+                events = []
+                for span in timings["phases"]:
+                    args = dict(span["args"])
+                    for key in ["cpu_time", "child_cpu_time", "max_rss_mb", "child_max_rss_mb"]:
+                        args[key] = span[key]
+                    events.append({
+                        "name": span["name"],
+                        "cat": "phase",
+                        "ph": "X",
+                        "ts": int(span["start"] * 1000000),
+                        "dur": int(span["wall_time"] * 1000000),
+                        "pid": os.getpid(),
+                        "tid": span["thread"],
+                        "args": args,
+                    })
+                json.dump({"traceEvents": events, "otherData": timings["counters"]}, wf, indent=2, ensure_ascii=False)
+        logger.info(f"阶段统计文件: {trace_file}")
+
+    @staticmethod
+    def __get_cpu_time(usage):
+        return usage.ru_utime + usage.ru_stime
+
+
+# 全局统计记录器
+tracer = Tracer()
@@ -10,44 +10,165 @@
 """
 
 import os
+import sys
+import math
+import stat
+import zlib
+import shutil
 import logging
 import zipfile
+import threading
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from setting import UNZIP_CHUNK_SIZE, UNZIP_MAX_WORKERS, UNZIP_PARALLEL_MIN_SIZE, \
+    ZIP_MAX_WORKERS, ZIP_PARALLEL_MAX_SIZE, ZIP_STORE_ENTROPY, INCOMPRESSIBLE_EXTS
+from telemetry import tracer
 
 logger = logging.getLogger(__name__)
 
 
 class ZipMgr(object):
-    def zip_dir(self, dir_path, zip_filepath):
+    # 直接写入已压缩数据依赖zipfile的内部实现,仅在已验证的python版本范围内且内部属性存在时使用
+    RAW_WRITE_PY_VERSIONS = ((3, 6), (3, 13))
+    RAW_WRITE_ATTRS = ("_lock", "_writecheck", "_didModify", "start_dir", "fp")
+
+    @tracer.traced("zip")
+    def zip_dir(self, dir_path, zip_filepath, compresslevel=None, workers=None):
         """
         压缩目录,也支持压缩单个文件
+        文件列表边遍历边处理;小文件分发到线程池并行压缩,按遍历顺序写入压缩包;
+        已压缩格式(按扩展名)或采样熵值较高的文件使用STORE模式直接存储
         :param dir_path: 目录路径,或单个文件路径
         :param zip_filepath: 压缩后的文件路径
+        :param compresslevel: 压缩级别(0-9),默认使用zlib默认级别
+        :param workers: 并行压缩的线程数,默认按cpu核数
         :return: 压缩后的文件路径
         """
         dir_path = os.path.realpath(dir_path)
         zip_filepath = os.path.realpath(zip_filepath)
+        if compresslevel is None:
+            compresslevel = zlib.Z_DEFAULT_COMPRESSION
+        if not workers:
+            workers = min(ZIP_MAX_WORKERS, os.cpu_count() or 1)
 
-        filelist = []
-        if os.path.isfile(dir_path):
-            filelist.append(dir_path)
-        else:
-            for root, _, files in os.walk(dir_path):
-                for name in files:
-                    filelist.append(os.path.join(root, name))
-
-        zf = zipfile.ZipFile(zip_filepath, "w", zipfile.zlib.DEFLATED)
         pre_len = len(os.path.dirname(dir_path))
-        for tar in filelist:
-            arcname = tar[pre_len:].strip(os.path.sep)
-            zf.write(tar, arcname)
-        zf.close()
+        pending = collections.deque()
+        with zipfile.ZipFile(zip_filepath, "w", zipfile.ZIP_DEFLATED) as zf, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            raw_write = self.__can_write_raw(zf)
+            if not raw_write:
+                logger.info("当前python版本不支持直接写入已压缩数据,在写入时压缩")
+            for tar in self.__iter_files(dir_path):
+                arcname = tar[pre_len:].strip(os.path.sep)
+                if os.path.getsize(tar) > ZIP_PARALLEL_MAX_SIZE:
+                    # 大文件不在内存中缓存压缩结果,轮到时由当前线程流式压缩写入
+                    pending.append((tar, arcname, None))
+                else:
+                    pending.append((tar, arcname, executor.submit(self.__compress_file, tar, compresslevel, raw_write)))
+                # 限制已提交未写入的文件数,控制内存占用
+                while len(pending) > workers * 4:
+                    self.__write_member(zf, compresslevel, raw_write, *pending.popleft())
+            while pending:
+                self.__write_member(zf, compresslevel, raw_write, *pending.popleft())
         return zip_filepath
 
-    def unzip_file(self, zip_filepath, unzip_to_dir):
+    @classmethod
+    def __can_write_raw(cls, zf):
+        """
+        判断能否绕过zipfile直接写入已压缩数据(依赖zipfile的内部实现)
+        """
+        min_version, max_version = cls.RAW_WRITE_PY_VERSIONS
+        if not min_version <= sys.version_info[:2] <= max_version:
+            return False
+        return all(hasattr(zf, attr) for attr in cls.RAW_WRITE_ATTRS)
+
+    @staticmethod
+    def __iter_files(dir_path):
+        """
+        遍历目录下的文件(单个文件路径时返回其自身)
+        """
+        if os.path.isfile(dir_path):
+            yield dir_path
+            return
+        for root, _, files in os.walk(dir_path):
+            for name in files:
+                yield os.path.join(root, name)
+
+    @staticmethod
+    def __is_incompressible(file_path, sample):
+        """
+        判断文件是否不可压缩: 已压缩格式的扩展名,或采样数据的熵值(bits/byte)较高
+        """
+        if os.path.splitext(file_path)[1].lower() in INCOMPRESSIBLE_EXTS:
+            return True
+        if len(sample) < 1024:
+            return False
+        total = len(sample)
+        entropy = -sum(count / total * math.log(count / total, 2) for count in collections.Counter(sample).values())
+        return entropy > ZIP_STORE_ENTROPY
+
+    def __compress_file(self, file_path, compresslevel, raw_write):
+        """
+        在工作线程中压缩单个文件,zlib压缩时会释放GIL
+        :param raw_write: 是否直接写入已压缩数据;为False时只读取文件,写入时由zipfile压缩
+        :return: (压缩方式, crc, 原始大小, 压缩后数据);raw_write为False时为原始数据
+        """
+        with open(file_path, "rb") as rf:
+            data = rf.read()
+        crc = zlib.crc32(data)
+        if self.__is_incompressible(file_path, data[:4096]):
+            return zipfile.ZIP_STORED, crc, len(data), data
+        if not raw_write:
+            return zipfile.ZIP_DEFLATED, crc, len(data), data
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) >= len(data):
+            return zipfile.ZIP_STORED, crc, len(data), data
+        return zipfile.ZIP_DEFLATED, crc, len(data), compressed
+
+    def __write_member(self, zf, compresslevel, raw_write, file_path, arcname, future):
+        """
+        将文件写入压缩包:已在线程池中压缩的直接写入压缩数据,大文件流式压缩写入;
+        不支持直接写入已压缩数据时,通过ZipFile.writestr写入原始数据
+        """
+        if future is None:
+            with open(file_path, "rb") as rf:
+                sample = rf.read(4096)
+            compress_type = zipfile.ZIP_STORED if self.__is_incompressible(file_path, sample) else zipfile.ZIP_DEFLATED
+            zf.write(file_path, arcname, compress_type=compress_type, compresslevel=compresslevel)
+            return
+
+        compress_type, crc, file_size, data = future.result()
+        zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+        if not raw_write:
+            zf.writestr(zinfo, data, compress_type=compress_type, compresslevel=compresslevel)
+            return
+        zinfo.compress_type = compress_type
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = len(data)
+        # zipfile不支持写入已压缩的数据,以下按ZipFile.open(mode="w")的方式直接写入文件头和数据
+        with zf._lock:
+            zf.fp.seek(zf.start_dir)
+            zinfo.header_offset = zf.fp.tell()
+            zf._writecheck(zinfo)
+            zf._didModify = True
+            zf.fp.write(zinfo.FileHeader(False))
+            zf.fp.write(data)
+            zf.filelist.append(zinfo)
+            zf.NameToInfo[zinfo.filename] = zinfo
+            zf.start_dir = zf.fp.tell()
+
+    @tracer.traced("unzip")
+    def unzip_file(self, zip_filepath, unzip_to_dir, workers=None):
         """
         解压缩到指定目录
+        逐个成员流式写入磁盘,大文件分发到线程池并行解压,并恢复压缩包中记录的文件权限
         :param zip_filepath: 压缩文件
         :param unzip_to_dir: 解压缩后的目录路径
+        :param workers: 并行解压的线程数,默认按cpu核数
         :return: 解压缩后的目录路径
         """
         zip_filepath = os.path.realpath(zip_filepath)
@@ -55,22 +176,90 @@ class ZipMgr(object):
         unzip_to_dir = os.path.realpath(unzip_to_dir)
         if not os.path.exists(unzip_to_dir):
             os.mkdir(unzip_to_dir)
-        zfobj = zipfile.ZipFile(zip_filepath)
-        for name in zfobj.namelist():
-            name = name.replace(os.sep, "/")
-
-            if name.endswith("/"):
-                os.mkdir(os.path.join(unzip_to_dir, name))
-            else:
-                ext_filename = os.path.join(unzip_to_dir, name)
-                ext_dir = os.path.dirname(ext_filename)
-                if not os.path.exists(ext_dir):
-                    os.mkdir(ext_dir)
-                outfile = open(ext_filename, "wb")
-                outfile.write(zfobj.read(name))
-                outfile.close()
+        if not workers:
+            workers = min(UNZIP_MAX_WORKERS, os.cpu_count() or 1)
+
+        with zipfile.ZipFile(zip_filepath) as zfobj:
+            dir_modes = []
+            small_members = []
+            large_members = []
+            for info in zfobj.infolist():
+                ext_filename = self.__get_safe_path(unzip_to_dir, info.filename)
+                mode = self.__get_unix_mode(info)
+                if info.is_dir():
+                    os.makedirs(ext_filename, exist_ok=True)
+                    if mode:
+                        dir_modes.append((ext_filename, mode))
+                    continue
+                os.makedirs(os.path.dirname(ext_filename), exist_ok=True)
+                if info.file_size >= UNZIP_PARALLEL_MIN_SIZE and workers > 1:
+                    large_members.append((info, ext_filename, mode))
+                else:
+                    small_members.append((info, ext_filename, mode))
+
+            # 大文件分发到线程池,每个线程使用独立的ZipFile句柄
+            thread_local = threading.local()
+
+            def extract_in_thread(member):
+                if not hasattr(thread_local, "zfobj"):
+                    thread_local.zfobj = zipfile.ZipFile(zip_filepath)
+                    thread_zfobjs.append(thread_local.zfobj)
+                self.__extract_member(thread_local.zfobj, *member)
+
+            thread_zfobjs = []
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(extract_in_thread, member) for member in large_members]
+                    for member in small_members:
+                        self.__extract_member(zfobj, *member)
+                    for future in futures:
+                        future.result()
+            finally:
+                for thread_zfobj in thread_zfobjs:
+                    thread_zfobj.close()
+
+        # 目录权限最后设置,避免只读目录导致其下文件无法写入
+        for dir_path, mode in reversed(dir_modes):
+            os.chmod(dir_path, mode)
         return unzip_dir
 
+    @staticmethod
+    def __get_safe_path(unzip_to_dir, name):
+        """
+        获取成员的解压路径,拒绝绝对路径及包含..的路径穿越成员
+        :param unzip_to_dir: 解压目录(realpath)
+        :param name: 压缩包中的成员名称
+        :return: 解压路径
+        """
+        name = name.replace("\\", "/")
+        parts = name.split("/")
+        if name.startswith("/") or ".." in parts or ":" in parts[0]:
+            raise Exception(f"压缩包中存在非法路径,拒绝解压: {name}")
+        ext_filename = os.path.realpath(os.path.join(unzip_to_dir, *parts))
+        if ext_filename != unzip_to_dir and not ext_filename.startswith(unzip_to_dir + os.sep):
+            raise Exception(f"压缩包中存在非法路径,拒绝解压: {name}")
+        return ext_filename
+
+    @staticmethod
+    def __get_unix_mode(info):
+        """
+        获取压缩包中记录的unix权限位,非unix系统创建的压缩包返回None
+        """
+        if info.create_system != 3:
+            return None
+        mode = stat.S_IMODE(info.external_attr >> 16) & 0o777
+        return mode if mode else None
+
+    @staticmethod
+    def __extract_member(zfobj, info, ext_filename, mode):
+        """
+        流式解压单个文件成员,并恢复文件权限
+        """
+        with zfobj.open(info) as src, open(ext_filename, "wb") as dst:
+            shutil.copyfileobj(src, dst, UNZIP_CHUNK_SIZE)
+        if mode:
+            os.chmod(ext_filename, mode)
+
 
 if __name__ == "__main__":
     pass
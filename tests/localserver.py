@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+测试用的本地http服务
+"""
+
+import threading
+
+from http.server import ThreadingHTTPServer
+
+
+class LocalHttpServer(object):
+    """
+    在后台线程中运行的本地http服务,记录请求及新建的连接数
+    """
+    def __init__(self, handler_class):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self._server.daemon_threads = True
+        self._server.requests = []  # (method, path, headers)
+        self._server.connection_count = 0
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    @property
+    def connection_count(self):
+        return self._server.connection_count
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
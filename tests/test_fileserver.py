@@ -0,0 +1,167 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+文件下载测试: 使用支持Range请求的本地http服务
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+from http.server import BaseHTTPRequestHandler
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fileserver import FileServer, SegmentProgress
+from localserver import LocalHttpServer
+
+DATA = os.urandom(10 * 1024 + 123)
+SEGMENT_SIZE = 1024
+CONCURRENCY = 16  # 分段大小取DOWNLOAD_MIN_SEGMENT_SIZE,共11个分段
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    支持Range请求的文件服务;fail_starts中的起始位置返回500,range_support为False时忽略Range
+    """
+    protocol_version = "HTTP/1.1"
+    fail_starts = set()
+    range_support = True
+    etag = '"v1"'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path, dict(self.headers)))
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+        if not match or not self.range_support:
+            self.__send(200, DATA)
+            return
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(DATA) - 1
+        if start in self.fail_starts:
+            self.__send(500, b"error")
+            return
+        self.__send(206, DATA[start:end + 1], {"Content-Range": f"bytes {start}-{end}/{len(DATA)}"})
+
+    def __send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.etag)
+        if self.range_support:
+            self.send_header("Accept-Ranges", "bytes")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@mock.patch("fileserver.DOWNLOAD_MIN_SEGMENT_SIZE", SEGMENT_SIZE)
+@mock.patch("fileserver.time.sleep", lambda seconds: None)
+class SegmentedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, "client.zip")
+        self.part_path = self.file_path + ".part"
+        self.progress_path = self.part_path + SegmentProgress.SUFFIX
+        RangeHandler.fail_starts = set()
+        RangeHandler.range_support = True
+        RangeHandler.etag = '"v1"'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def __read_file(self):
+        with open(self.file_path, "rb") as rf:
+            return rf.read()
+
+    @staticmethod
+    def __segment_requests(server):
+        return [headers["Range"] for method, path, headers in server.requests if headers.get("Range") != "bytes=0-0"]
+
+    def test_download(self):
+        checksum = hashlib.sha256(DATA).hexdigest()
+        file_server = FileServer()
+        with LocalHttpServer(RangeHandler) as server:
+            result = file_server.download_file_segmented(server.url + "/client.zip", self.file_path, CONCURRENCY,
+                                                         checksum)
+        self.assertEqual(result, self.file_path)
+        self.assertEqual(self.__read_file(), DATA)
+        self.assertEqual(file_server.last_checksum, checksum)
+        self.assertEqual(len(self.__segment_requests(server)), 11)
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertFalse(os.path.exists(self.progress_path))
+
+    def test_checksum_mismatch(self):
+        file_server = FileServer()
+        with LocalHttpServer(RangeHandler) as server:
+            result = file_server.download_file_segmented(server.url + "/client.zip", self.file_path, CONCURRENCY,
+                                                         "0" * 64)
+        self.assertIsNone(result)
+        self.assertIsNone(file_server.last_checksum)
+        for file_path in [self.file_path, self.part_path, self.progress_path]:
+            self.assertFalse(os.path.exists(file_path))
+
+    def test_segment_failure_and_resume(self):
+        RangeHandler.fail_starts = {3 * SEGMENT_SIZE, 7 * SEGMENT_SIZE}
+        with LocalHttpServer(RangeHandler) as server:
+            with self.assertRaises(OSError):
+                FileServer().download_file_segmented(server.url + "/client.zip", self.file_path, CONCURRENCY)
+            # 保留临时文件及进度,失败的分段未记录为完成
+            self.assertFalse(os.path.exists(self.file_path))
+            with open(self.progress_path, "r") as rf:
+                done = json.load(rf)["done"]
+            self.assertEqual(done, [index for index in range(11) if index not in (3, 7)])
+
+            RangeHandler.fail_starts = set()
+            del server.requests[:]
+            file_server = FileServer()
+            result = file_server.download_file_segmented(server.url + "/client.zip", self.file_path, CONCURRENCY)
+        self.assertEqual(result, self.file_path)
+        self.assertEqual(self.__read_file(), DATA)
+        self.assertEqual(file_server.last_checksum, hashlib.sha256(DATA).hexdigest())
+        # 只下载未完成的分段
+        self.assertEqual(sorted(self.__segment_requests(server)),
+                         ["bytes=3072-4095", "bytes=7168-8191"])
+        self.assertFalse(os.path.exists(self.progress_path))
+
+    def test_resume_after_file_changed(self):
+        RangeHandler.fail_starts = {0}
+        with LocalHttpServer(RangeHandler) as server:
+            with self.assertRaises(OSError):
+                FileServer().download_file_segmented(server.url + "/client.zip", self.file_path, CONCURRENCY)
+            RangeHandler.fail_starts = set()
+            RangeHandler.etag = '"v2"'  # 服务端文件已变化,重新下载所有分段
+            del server.requests[:]
+            result = FileServer().download_file_segmented(server.url + "/client.zip", self.file_path, CONCURRENCY)
+        self.assertEqual(result, self.file_path)
+        self.assertEqual(self.__read_file(), DATA)
+        self.assertEqual(len(self.__segment_requests(server)), 11)
+
+    def test_no_range_support(self):
+        RangeHandler.range_support = False
+        with open(self.progress_path, "w") as wf:  # 上次分段下载残留的进度
+            wf.write("{}")
+        with LocalHttpServer(RangeHandler) as server:
+            result = FileServer().download_file_segmented(server.url + "/client.zip", self.file_path, CONCURRENCY,
+                                                          hashlib.sha256(DATA).hexdigest())
+        self.assertEqual(result, self.file_path)
+        self.assertEqual(self.__read_file(), DATA)
+        self.assertFalse(os.path.exists(self.progress_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
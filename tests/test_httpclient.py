@@ -0,0 +1,179 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+HttpClient测试: 使用本地http服务
+"""
+
+import os
+import sys
+import gzip
+import json
+import unittest
+
+from http.server import BaseHTTPRequestHandler
+from urllib.error import HTTPError
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from httpclient import HttpClient
+from localserver import LocalHttpServer
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """
+    /echo: 返回请求方法及请求体
+    /flaky/<status>/<n>: 前n次请求返回status,之后返回200
+    /drop: 响应后断开连接(不返回Connection: close,客户端会复用该连接)
+    /gzip: 返回gzip压缩的内容
+    /redirect/<status>: 重定向到/echo
+    /missing: 404
+    """
+    protocol_version = "HTTP/1.1"
+    flaky_counts = {}
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connection_count += 1
+
+    def do_GET(self):
+        self.__handle("GET")
+
+    def do_POST(self):
+        self.__handle("POST")
+
+    def __handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.server.requests.append((method, self.path, dict(self.headers)))
+        parts = self.path.strip("/").split("/")
+        if parts[0] == "echo":
+            self.__send(200, json.dumps({"method": method, "body": body.decode()}).encode())
+        elif parts[0] == "flaky":
+            key = (method, self.path)
+            self.flaky_counts[key] = self.flaky_counts.get(key, 0) + 1
+            if self.flaky_counts[key] <= int(parts[2]):
+                self.__send(int(parts[1]), b"busy")
+            else:
+                self.__send(200, b"ok")
+        elif parts[0] == "drop":
+            self.__send(200, b"bye")
+            self.close_connection = True
+        elif parts[0] == "gzip":
+            self.__send(200, gzip.compress(b"hello " * 1000), {"Content-Encoding": "gzip"})
+        elif parts[0] == "redirect":
+            self.__send(int(parts[1]), b"", {"Location": "/echo"})
+        else:
+            self.__send(404, b"not found")
+
+    def __send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@mock.patch("httpclient.getproxies", lambda: {})
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        EchoHandler.flaky_counts = {}
+        self.server = LocalHttpServer(EchoHandler).__enter__()
+        self.client = HttpClient(retry_times=3)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.__exit__(None, None, None)
+
+    def test_connection_reuse(self):
+        for _ in range(3):
+            self.assertEqual(json.loads(self.client.request(self.server.url + "/echo", {}, method="GET")),
+                             {"method": "GET", "body": ""})
+        self.client.request(self.server.url + "/echo", {}, body={"a": 1})
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_unread_response_not_reused(self):
+        with self.client.open(self.server.url + "/gzip", {}) as resp:
+            resp.read(10)
+        self.client.request(self.server.url + "/echo", {}, method="GET")
+        self.assertEqual(self.server.connection_count, 2)
+
+    @mock.patch("httpclient.time.sleep")
+    def test_retry_on_unavailable(self, sleep):
+        for status in (429, 503):
+            sleep.reset_mock()
+            self.assertEqual(self.client.request(f"{self.server.url}/flaky/{status}/2", {}, method="GET"), b"ok")
+            self.assertEqual(sleep.call_count, 2)
+
+    @mock.patch("httpclient.time.sleep")
+    def test_retry_exhausted(self, sleep):
+        with self.assertRaises(HTTPError) as cm:
+            self.client.request(self.server.url + "/flaky/503/10", {}, method="GET")
+        self.assertEqual(cm.exception.code, 503)
+        self.assertEqual(sleep.call_count, 3)
+        self.assertEqual(len(self.server.requests), 4)
+
+    @mock.patch("httpclient.time.sleep")
+    def test_post_not_retried(self, sleep):
+        with self.assertRaises(HTTPError) as cm:
+            self.client.request(self.server.url + "/flaky/503/1", {}, body={"a": 1})
+        self.assertEqual(cm.exception.code, 503)
+        sleep.assert_not_called()
+        self.assertEqual(len(self.server.requests), 1)
+
+    @mock.patch("httpclient.time.sleep")
+    def test_retry_reused_dead_connection(self, sleep):
+        self.assertEqual(self.client.request(self.server.url + "/drop", {}, method="GET"), b"bye")
+        # 非幂等请求在复用的连接已断开时同样使用新连接重试,且不等待
+        self.assertEqual(json.loads(self.client.request(self.server.url + "/echo", {}, body={"a": 1})),
+                         {"method": "POST", "body": '{"a": 1}'})
+        self.assertEqual(self.server.connection_count, 2)
+        sleep.assert_not_called()
+
+    def test_gzip(self):
+        self.assertEqual(self.client.request(self.server.url + "/gzip", {}, method="GET"), b"hello " * 1000)
+        self.assertEqual(self.server.requests[-1][2].get("Accept-Encoding"), "gzip")
+        with self.client.open(self.server.url + "/gzip", {}) as resp:
+            self.assertIsNone(resp.getheader("Content-Length"))
+            self.assertIsNone(resp.getheader("Content-Encoding"))
+            chunks = []
+            while True:
+                data = resp.read(100)
+                if not data:
+                    break
+                self.assertLessEqual(len(data), 100)
+                chunks.append(data)
+        self.assertEqual(b"".join(chunks), b"hello " * 1000)
+        # 读取完毕的连接归还连接池
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_redirect(self):
+        resp = json.loads(self.client.request(self.server.url + "/redirect/303", {}, body={"a": 1}))
+        self.assertEqual(resp, {"method": "GET", "body": ""})
+        resp = json.loads(self.client.request(self.server.url + "/redirect/302", {}, body={"a": 1}))
+        self.assertEqual(resp, {"method": "GET", "body": ""})
+        resp = json.loads(self.client.request(self.server.url + "/redirect/307", {}, body={"a": 1}))
+        self.assertEqual(resp, {"method": "POST", "body": '{"a": 1}'})
+        with self.client.open(self.server.url + "/redirect/301", {}) as resp:
+            self.assertEqual(resp.geturl(), self.server.url + "/echo")
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_http_error(self):
+        with self.assertRaises(HTTPError) as cm:
+            self.client.open(self.server.url + "/missing", {})
+        self.assertEqual(cm.exception.code, 404)
+        self.assertEqual(cm.exception.url, self.server.url + "/missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+参数解析测试
+"""
+
+import os
+import sys
+import unittest
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import setting
+from codedog_scan import TCAPlugin
+
+
+class ParamParseTest(unittest.TestCase):
+    @staticmethod
+    def __new_plugin(env):
+        env = dict({key: value for key, value in os.environ.items() if not key.startswith("INPUT_")}, **env)
+        with mock.patch.dict(os.environ, env, clear=True):
+            return TCAPlugin()
+
+    def test_default(self):
+        plugin = self.__new_plugin({})
+        self.assertEqual(plugin.project_workers, setting.PROJECT_WORKERS)
+        self.assertIsNone(plugin.download_concurrency)
+        self.assertEqual(plugin.result_cache_max_size, setting.RESULT_CACHE_MAX_SIZE)
+        self.assertIsNone(plugin.shard_memory_budget)
+        self.assertIsNone(plugin.quick_scan_shards)
+
+    def test_valid(self):
+        plugin = self.__new_plugin({"INPUT_PROJECT_WORKERS": "8", "INPUT_DOWNLOAD_CONCURRENCY": " 2 ",
+                                    "INPUT_RESULT_CACHE_MAX_SIZE": "64", "INPUT_SHARD_MEMORY_BUDGET": "4096",
+                                    "INPUT_QUICK_SCAN_SHARDS": "AUTO"})
+        self.assertEqual(plugin.project_workers, 8)
+        self.assertEqual(plugin.download_concurrency, 2)
+        self.assertEqual(plugin.result_cache_max_size, 64)
+        self.assertEqual(plugin.shard_memory_budget, 4096)
+        self.assertEqual(plugin.quick_scan_shards, "auto")
+
+    def test_invalid(self):
+        for value in ["abc", "1.5", "0", "-2", " "]:
+            plugin = self.__new_plugin({"INPUT_PROJECT_WORKERS": value, "INPUT_DOWNLOAD_CONCURRENCY": value,
+                                        "INPUT_RESULT_CACHE_MAX_SIZE": value, "INPUT_SHARD_MEMORY_BUDGET": value,
+                                        "INPUT_QUICK_SCAN_SHARDS": value})
+            self.assertEqual(plugin.project_workers, setting.PROJECT_WORKERS)
+            self.assertIsNone(plugin.download_concurrency)
+            self.assertEqual(plugin.result_cache_max_size, setting.RESULT_CACHE_MAX_SIZE)
+            self.assertIsNone(plugin.shard_memory_budget)
+            self.assertIsNone(plugin.quick_scan_shards)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+过滤路径匹配测试: 分级匹配(PathMatcher)与多个规则用|拼接后fullmatch的结果对比
+"""
+
+import os
+import re
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from pathfilter import RegexCompiler, FilterPathUtil
+
+
+class PathMatcherDiffTest(unittest.TestCase):
+    DIRS = ["src", "test", "third_party", "a.b", "lib", "src/test", "vendor/pkg"]
+    NAMES = ["main.py", "util.go", "a.b", "test_x.py", "README.md", "x.min.js", "Makefile", "ab"]
+    EXTS = ["py", "go", "js", "md", "min.js"]
+
+    def __gen_pattern(self, rnd):
+        """
+        随机生成一个规则: 字面量、前缀、后缀及其他正则表达式写法
+        """
+        dir_name = rnd.choice(self.DIRS)
+        name = rnd.choice(self.NAMES)
+        kind = rnd.randrange(10)
+        if kind == 0:  # 字面量
+            return re.escape(f"{dir_name}/{name}")
+        if kind == 1:  # 前缀
+            return re.escape(dir_name + "/") + ".*"
+        if kind == 2:  # 后缀
+            return ".*" + re.escape("." + rnd.choice(self.EXTS))
+        if kind == 3:  # 未转义的点号
+            return f"{dir_name}/.*"
+        if kind == 4:
+            return f".*/{rnd.choice(['test', 'lib', 'pkg'])}/.*"
+        if kind == 5:
+            return f"{re.escape(dir_name)}/[a-z_]+\\.py"
+        if kind == 6:
+            return f".*{rnd.choice(['test', 'min'])}.*"
+        if kind == 7:
+            return f"(?:{re.escape(dir_name)}|lib)/.*"
+        if kind == 8:
+            return f"{re.escape(dir_name)}/\\w+\\.(py|go)"
+        return rnd.choice(["", ".*", "src", "src/", "a.b", ".*\\.py|.*\\.go", "(?i)src/.*"])
+
+    def __gen_path(self, rnd):
+        if rnd.randrange(8) == 0:
+            return rnd.choice(["", "src", "src/", "a\nb.py", "src/main.py\n", "SRC/main.py", "ab"])
+        parts = [rnd.choice(self.DIRS) for _ in range(rnd.randrange(3))]
+        return "/".join(parts + [rnd.choice(self.NAMES)])
+
+    def test_diff_with_alternation(self):
+        rnd = random.Random(20221018)
+        for _ in range(500):
+            patterns = [self.__gen_pattern(rnd) for _ in range(rnd.randrange(1, 6))]
+            matcher = RegexCompiler.compile_matcher(patterns)
+            try:
+                regex = re.compile("|".join(patterns))
+            except re.error:  # 拼接后不合法(比如内联标志不在开头),过滤不生效
+                self.assertIsNone(matcher, f"patterns: {patterns}")
+                continue
+            for _ in range(40):
+                path = self.__gen_path(rnd)
+                self.assertEqual(matcher.fullmatch(path), regex.fullmatch(path) is not None,
+                                 f"patterns: {patterns}, path: {path!r}")
+
+    def test_invalid_pattern(self):
+        self.assertIsNone(RegexCompiler.compile_matcher(["src/(.*"]))
+        # 单独不合法、拼接后合法的规则,与拼接后的正则表达式一致
+        patterns = ["(src", "lib)/.*"]
+        matcher = RegexCompiler.compile_matcher(patterns)
+        self.assertTrue(matcher.fullmatch("src/a.py"))
+        self.assertTrue(matcher.fullmatch("lib/a.py"))
+        self.assertFalse(matcher.fullmatch("src"))
+
+    def test_filter_path(self):
+        filter_util = FilterPathUtil(["src/.*"], [".*/test/.*", ".*\\.md"])
+        self.assertFalse(filter_util.should_filter_path("src/main.py"))
+        self.assertTrue(filter_util.should_filter_path("src/test/main.py"))
+        self.assertTrue(filter_util.should_filter_path("src/README.md"))
+        self.assertTrue(filter_util.should_filter_path("lib/main.py"))
+
+
+if __name__ == "__main__":
+    unittest.main()
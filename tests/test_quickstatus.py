@@ -0,0 +1,76 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+快速扫描是否通过的判断测试
+"""
+
+import os
+import sys
+import collections
+import unittest
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from codedog_scan import TCAPlugin
+from quickreport import QuickReportSummary
+
+
+class QuickScanStatusTest(unittest.TestCase):
+    SEVERITY_COUNTS = collections.Counter({"error": 2, "warning": 3})
+
+    @staticmethod
+    def __check(env, severity_counts):
+        env = dict({key: value for key, value in os.environ.items() if not key.startswith("INPUT_")}, **env)
+        with mock.patch.dict(os.environ, env, clear=True):
+            plugin = TCAPlugin()
+            data = {"error_code": 0, "issue_count": sum(severity_counts.values())}
+            plugin._TCAPlugin__check_quickscan_status(data, severity_counts)
+        return plugin, data
+
+    def test_thresholds_ignored_without_opt_in(self):
+        plugin, data = self.__check({"INPUT_TOTAL_WARNING": "10"}, self.SEVERITY_COUNTS)
+        self.assertEqual(data["status"], "failed")
+        self.assertNotIn("redline_msg", data)
+        self.assertEqual(plugin.status_code, 1)
+
+    def test_thresholds_pass(self):
+        plugin, data = self.__check({"INPUT_QUICK_REDLINE": "true", "INPUT_TOTAL_WARNING": "5",
+                                     "INPUT_INCR_ERROR": "0"}, self.SEVERITY_COUNTS)
+        self.assertEqual(data["status"], "pass")
+        self.assertEqual(plugin.status_code, 0)
+        # 快速扫描只判断存量问题量指标,不判断无法提供数据的其他指标
+        self.assertEqual(data["redline_msg"], "[pass] 存量问题量(级别:致命+错误+警告) total_warning = 5, 符合: <= 5")
+
+    def test_thresholds_fail(self):
+        plugin, data = self.__check({"INPUT_QUICK_REDLINE": "true", "INPUT_TOTAL_FATAL": "0",
+                                     "INPUT_TOTAL_ERROR": "1"}, self.SEVERITY_COUNTS)
+        self.assertEqual(data["status"], "failed")
+        self.assertEqual(plugin.status_code, 1)
+        self.assertEqual(plugin.pass_msg, ["[pass] 存量问题量(级别:致命) total_fatal = 0, 符合: <= 0"])
+        self.assertEqual(len(plugin.fail_msg), 1)
+        self.assertIn("total_error = 2", plugin.fail_msg[0])
+
+    def test_opt_in_without_thresholds(self):
+        plugin, data = self.__check({"INPUT_QUICK_REDLINE": "true"}, collections.Counter())
+        self.assertEqual(data["status"], "pass")
+        self.assertNotIn("redline_msg", data)
+
+    def test_severity_case_insensitive(self):
+        summary = QuickReportSummary(0)
+        for severity in ["Error", "ERROR", "warning", "Warning"]:
+            summary.add({"severity": severity, "rule": "demo"})
+        self.assertEqual(summary.severity_counter, {"error": 2, "warning": 2})
+        plugin, data = self.__check({"INPUT_QUICK_REDLINE": "true", "INPUT_TOTAL_ERROR": "1"},
+                                    summary.severity_counter)
+        self.assertIn("total_error = 2", plugin.fail_msg[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+# Copyright (c) 2022 THL A29 Limited
+#
+# This source code file is made available under MIT License
+# See LICENSE for details
+# ==============================================================================
+
+"""
+扫描结果缓存测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from codedog_scan import TCAPlugin
+from resultcache import ResultCache
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.temp_dir, "src")
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+        os.makedirs(self.source_dir)
+        for name in ["a.py", "b.py"]:  # 内容相同的两个文件
+            with open(os.path.join(self.source_dir, name), "w") as wf:
+                wf.write("print('hello')\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def __new_cache(self, client_version="v1"):
+        return ResultCache(self.cache_dir, 1024 * 1024, ["safety"], client_version)
+
+    def test_key_includes_path(self):
+        cache = self.__new_cache()
+        key_a = cache.get_key(os.path.join(self.source_dir, "a.py"), "a.py")
+        key_b = cache.get_key(os.path.join(self.source_dir, "b.py"), "b.py")
+        self.assertNotEqual(key_a, key_b)
+        self.assertEqual(key_a, cache.get_key(os.path.join(self.source_dir, "a.py"), "a.py"))
+        self.assertNotEqual(key_a, self.__new_cache("v2").get_key(os.path.join(self.source_dir, "a.py"), "a.py"))
+
+    def test_key_changes_with_content(self):
+        cache = self.__new_cache()
+        file_path = os.path.join(self.source_dir, "a.py")
+        key = cache.get_key(file_path, "a.py")
+        with open(file_path, "a") as wf:
+            wf.write("print('world')\n")
+        self.assertNotEqual(key, cache.get_key(file_path, "a.py"))
+        self.assertIsNone(cache.get_key(os.path.join(self.source_dir, "missing.py"), "missing.py"))
+
+    def test_identical_files_with_different_issues(self):
+        """
+        内容相同的两个文件产生不同的问题(比如问题与路径相关),各自的缓存互不覆盖
+        """
+        issue = {"path": "a.py", "line": 1, "rule": "demo", "msg": "issue in a.py"}
+        plugin = self.__new_plugin()
+        miss_paths = plugin._TCAPlugin__apply_result_cache(["a.py", "b.py"])
+        self.assertEqual(miss_paths, ["a.py", "b.py"])
+        plugin._TCAPlugin__update_result_cache({"issue_count": 1}, {"a.py": [dict(issue)]})
+
+        plugin = self.__new_plugin()
+        miss_paths = plugin._TCAPlugin__apply_result_cache(["b.py", "a.py"])
+        self.assertEqual(miss_paths, [])
+        self.assertEqual(plugin.cached_issues, [issue])
+
+    def __new_plugin(self):
+        plugin = TCAPlugin()
+        plugin.source_dir = self.source_dir
+        plugin.result_cache = self.__new_cache()
+        return plugin
+
+
+if __name__ == "__main__":
+    unittest.main()